@@ -0,0 +1,72 @@
+"""
+Compare the query plan backends on the same plans.
+
+Run from the backend directory:
+    python -m benchmarks.bench_backends [scale_factor]
+"""
+import asyncio
+import sys
+import tempfile
+import time
+
+from benchmarks.datasets import load_scaled_sales
+from services.backend_service import available_backends, get_backend
+from services.data_service import DataAnalyzer, validate_query_plan
+from services import file_service
+
+PROMPTS = {
+    "revenue by region and category": ({
+        "group_by": ["Region", "ProductCategory"],
+        "aggregates": [{"column": "Revenue", "func": "sum"}, {"column": "Profit", "func": "sum"},
+                       {"column": "OrderID", "func": "nunique", "as": "Orders"}]
+    }, "query"),
+    "top 5 promoted categories": ({
+        "filters": [{"column": "PromotionApplied", "op": "==", "value": "yes"}],
+        "group_by": ["ProductCategory"],
+        "aggregates": [{"column": "Revenue", "func": "sum"}],
+        "sort": [{"column": "Revenue", "descending": True}],
+        "limit": 5
+    }, "query"),
+    "average order size per month": ({
+        "group_by": ["Year", "Month"],
+        "aggregates": [{"column": "UnitsSold", "func": "mean"}, {"column": "Revenue", "func": "median"}]
+    }, "query"),
+    "recent big orders in the north": ({
+        "filters": [{"column": "Region", "op": "==", "value": "North"},
+                    {"column": "OrderDate", "op": "between", "value": ["2022-01-01", "2022-12-31"]},
+                    {"column": "UnitsSold", "op": ">", "value": 15}],
+        "sort": [{"column": "OrderDate"}]
+    }, "filter"),
+}
+
+
+def _best_of(fn, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(factor: int = 100):
+    df = load_scaled_sales(factor)
+    # Store the data like an upload so DuckDB scans the Arrow file
+    file_service.DATA_DIR = tempfile.mkdtemp(prefix="dataprompt-bench-")
+    file_service.load_index()
+    dataset_id = asyncio.run(file_service.save_file(df, f"sales_x{factor}.csv"))
+    analyzer = DataAnalyzer(file_service.get_dataset(dataset_id), dataset_id=dataset_id)
+    print(f"Rows: {len(df):,}  backends: {', '.join(available_backends())}")
+
+    for name, (plan, kind) in PROMPTS.items():
+        plan = validate_query_plan(plan, analyzer.profile, kind)
+        timings = []
+        for backend_name in available_backends():
+            backend = get_backend(backend_name)
+            result = backend.execute(analyzer, plan)
+            timings.append(f"{backend_name} {_best_of(backend.execute, analyzer, plan) * 1000:8.1f} ms")
+        print(f"{name:<32} {len(result):>7} rows  " + "  ".join(timings))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
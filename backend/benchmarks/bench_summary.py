@@ -0,0 +1,92 @@
+"""
+Compare the columnar summary record builders with the iterrows loops they replaced.
+
+Run from the backend directory:
+    python -m benchmarks.bench_summary [scale_factor]
+"""
+import sys
+import time
+
+from benchmarks.datasets import load_scaled_sales
+from services.data_service import DataAnalyzer, _to_records, _period_labels
+
+
+def _legacy_monthly(monthly):
+    return [
+        {
+            "month": f"{int(row['Year'])}-{int(row['Month']):02d}",
+            "revenue": round(row['Revenue'], 2),
+            "profit": round(row['Profit'], 2),
+            "units_sold": int(row['UnitsSold'])
+        }
+        for _, row in monthly.iterrows()
+    ]
+
+
+def _columnar_monthly(monthly):
+    monthly = monthly.assign(Period=_period_labels(monthly))
+    return _to_records(
+        monthly,
+        {"month": 'Period', "revenue": 'Revenue', "profit": 'Profit', "units_sold": 'UnitsSold'},
+        rounded=("revenue", "profit"),
+        integers=("units_sold",)
+    )
+
+
+def _legacy_category_time(product_time):
+    return [
+        {
+            "date": f"{int(row['Year'])}-{int(row['Month']):02d}",
+            "category": row['ProductCategory'],
+            "revenue": round(row['Revenue'], 2),
+            "profit": round(row['Profit'], 2)
+        }
+        for _, row in product_time.iterrows()
+    ]
+
+
+def _columnar_category_time(product_time):
+    product_time = product_time.assign(Period=_period_labels(product_time))
+    return _to_records(
+        product_time,
+        {"date": 'Period', "category": 'ProductCategory', "revenue": 'Revenue', "profit": 'Profit'},
+        rounded=("revenue", "profit")
+    )
+
+
+def _best_of(fn, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(factor: int = 20):
+    df = load_scaled_sales(factor)
+    print(f"Rows: {len(df):,}")
+
+    monthly = df.groupby(['Year', 'Month'], observed=True).agg(
+        {'Revenue': 'sum', 'Profit': 'sum', 'UnitsSold': 'sum'}).reset_index()
+    product_time = df.groupby(['ProductCategory', 'Year', 'Month'], observed=True).agg(
+        {'Revenue': 'sum', 'Profit': 'sum'}).reset_index()
+
+    assert _legacy_monthly(monthly) == _columnar_monthly(monthly)
+    assert _legacy_category_time(product_time) == _columnar_category_time(product_time)
+
+    for name, frame, legacy, columnar in [
+        ("monthly_performance", monthly, _legacy_monthly, _columnar_monthly),
+        ("product_category_time_series", product_time, _legacy_category_time, _columnar_category_time),
+    ]:
+        legacy_s = _best_of(legacy, frame)
+        columnar_s = _best_of(columnar, frame)
+        print(f"{name:<30} {len(frame):>7} rows  iterrows {legacy_s * 1000:8.1f} ms  "
+              f"columnar {columnar_s * 1000:8.1f} ms  speedup {legacy_s / columnar_s:5.1f}x")
+
+    analyzer = DataAnalyzer(df)
+    print(f"generate_summary total: {_best_of(analyzer.generate_summary, repeat=1):.2f} s")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,29 @@
+import os
+import pandas as pd
+
+from services.ingest_service import compact_dtypes
+
+SAMPLE_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "services", "cleaned_dataset.csv")
+
+
+def load_scaled_sales(factor: int = 20, compact: bool = True) -> pd.DataFrame:
+    """
+    Build a scaled-up copy of cleaned_dataset.csv.
+
+    Each copy is shifted forward by the span of the original data (4 years),
+    so the number of rows, months and days all grow with `factor`, like a
+    store with a long order history.
+    """
+    base = pd.read_csv(SAMPLE_CSV)
+    order_dates = pd.to_datetime(base["OrderDate"])
+    copies = []
+    for k in range(factor):
+        shifted = base.copy()
+        shifted["OrderID"] = shifted["OrderID"] + f"-{k}"
+        shifted["Year"] = shifted["Year"] + 4 * k
+        shifted["OrderDate"] = (order_dates + pd.DateOffset(years=4 * k)).dt.strftime("%Y-%m-%d")
+        copies.append(shifted)
+    df = pd.concat(copies, ignore_index=True)
+    if compact:
+        df, _ = compact_dtypes(df)
+    return df
@@ -2,30 +2,43 @@ from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, F
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 import pandas as pd
-import io
 import os
 import uuid
 from typing import Dict, Any, List, Optional
 import json
-from datetime import datetime
 import asyncio
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
-import numpy as np
 # Import services
-from services.file_service import save_file, get_dataset, list_datasets
+from services.file_service import save_file, append_rows, get_dataset as load_dataset, get_dataset_info, list_datasets as list_stored_datasets, get_cache_stats, get_dataset_version
+from services.sandbox_service import get_sandbox_stats
+from services.code_cache import get_code_cache_stats
+from services.cube_service import get_cube_stats
+from services.model_cache import get_model_stats
+from services.result_cache import CACHEABLE_INTENTS, result_key, get_result, put_result, get_result_stats
+from services.ingest_service import spool_upload, read_tabular_file, compact_dtypes
 from services.nlp_service import classify_intent
 from services.data_service import DataAnalyzer
+from services.precompute_service import start_precompute, wait_for_profile, wait_for_summary, get_precompute_status
+from services.serialization import make_json_safe
 import aiohttp
 
 import requests
 
 
 
-# In-memory storage for datasets and analysis jobs
-cached_datasets = {}
+# In-memory storage for analysis jobs (datasets live in services.file_service)
 analysis_jobs = {}
 
-app = FastAPI(title="DataPrompt API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Cached DataFrames are shared by every request. With copy-on-write, the
+    # snapshots handed out by file_service behave as independent frames: a
+    # write only copies the columns it touches and never reaches the shared frame.
+    with pd.option_context("mode.copy_on_write", True):
+        yield
+
+app = FastAPI(title="DataPrompt API", lifespan=lifespan)
 
 # Add CORS middleware to allow requests from the frontend
 app.add_middleware(
@@ -45,96 +58,108 @@ class AnalyzeRequest(BaseModel):
     dataset_id: str
     chat_history: Optional[List[ChatMessage]] = None
 
+class BacktestRequest(BaseModel):
+    dataset_id: str
+    value_cols: List[str] = ["Revenue"]
+    group_by: List[str] = []
+    granularity: str = "month"
+    horizon: int = 3
+    min_train: int = 6
+    step: int = 1
+
 class ChatRequest(BaseModel):
     prompt: str
     chat_history: Optional[List[ChatMessage]] = None
     job_id: Optional[str] = None
 
 
-import math
-import numpy as np
-import pandas as pd
-import json
-
-def make_json_safe(data):
-    """
-    Recursively convert all NumPy and pandas types to Python native types,
-    and sanitize non-JSON-compliant float values (NaN, inf).
-    """
-    if data is None:
-        return None
-    elif isinstance(data, dict):
-        return {k: make_json_safe(v) for k, v in data.items()}
-    elif isinstance(data, list):
-        return [make_json_safe(item) for item in data]
-    elif isinstance(data, (np.integer, np.int64, np.int32, np.int16, np.int8)):
-        return int(data)
-    elif isinstance(data, (np.floating, float, np.float64, np.float32, np.float16)):
-        # Catch NaN, inf, -inf
-        if math.isnan(data) or math.isinf(data):
-            return None
-        return float(data)
-    elif isinstance(data, (np.ndarray,)):
-        return make_json_safe(data.tolist())
-    elif isinstance(data, pd.Timestamp):
-        return data.isoformat()
-    elif isinstance(data, pd.Series):
-        return make_json_safe(data.tolist())
-    elif isinstance(data, pd.DataFrame):
-        return make_json_safe(data.to_dict(orient='records'))
-    elif isinstance(data, np.bool_):
-        return bool(data)
-    elif hasattr(data, 'to_json'):
-        return json.loads(data.to_json())
-    elif hasattr(data, '__dict__'):
-        return make_json_safe(vars(data))
-    else:
-        return data
-
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(file: UploadFile = File(...), compact: bool = Form(True), backend: Optional[str] = Form(None)):
     """
     Upload a CSV file and return a dataset ID.
+    Set `compact` to false to keep the dtypes pandas inferred while parsing.
+    Set `backend` (e.g. "duckdb") to run this dataset's query plans on that engine.
     """
     if not file.filename.endswith(('.csv', '.xlsx', '.xls')):
         raise HTTPException(status_code=400, detail="Only CSV and Excel files are supported")
     
+    temp_path = None
     try:
-        # Read the file content
-        contents = await file.read()
-        
-        # Create a BytesIO object from the contents
-        file_obj = io.BytesIO(contents)
-        
-        # Determine file type and read with pandas
-        if file.filename.endswith('.csv'):
-            df = pd.read_csv(file_obj)
-        else:  # Excel file
-            df = pd.read_excel(file_obj)
+        # Spool the upload to disk in fixed-size chunks instead of holding it in memory
+        temp_path, size_bytes = await spool_upload(file)
+
+        # Parse incrementally from the spooled file
+        df, ingest_stats = read_tabular_file(temp_path, file.filename)
+
+        # Shrink dtypes (categoricals, booleans, downcast numerics) before storing
+        compaction = None
+        if compact:
+            df, compaction = compact_dtypes(df)
         
-        # Save the DataFrame to in-memory cache
-        dataset_id = str(uuid.uuid4())
-        cached_datasets[dataset_id] = {
-            "df": df,
-            "filename": file.filename,
-            "upload_time": datetime.now().isoformat(),
-            "columns": list(df.columns),
-            "row_count": len(df)
-        }
+        # Persist the DataFrame to the dataset store
+        metadata = {"backend": backend} if backend else {}
+        dataset_id = await save_file(df, file.filename, **metadata)
+
+        # Profile the dataset and compute its summary in the background so the
+        # upload returns as soon as parsing is done
+        start_precompute(dataset_id)
         
         return {
             "id": dataset_id,
             "filename": file.filename,
             "columns": list(df.columns),
-            "row_count": len(df)
+            "row_count": len(df),
+            "file_size_bytes": size_bytes,
+            "estimated_peak_bytes": ingest_stats["estimated_peak_bytes"],
+            "compaction": compaction,
+            **get_precompute_status(dataset_id)
         }
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
     finally:
-        # Reset file pointer and close
-        await file.seek(0)
         await file.close()
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+@app.post("/datasets/{dataset_id}/rows")
+async def append_dataset_rows(dataset_id: str, file: UploadFile = File(...), compact: bool = Form(True)):
+    """
+    Append the rows of a CSV or Excel file to a stored dataset.
+    Columns the dataset does not have are ignored, missing ones are left empty.
+    Set `compact` as for the upload, so both parse to the same dtypes.
+    """
+    if get_dataset_info(dataset_id) is None:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    if not file.filename.endswith(('.csv', '.xlsx', '.xls')):
+        raise HTTPException(status_code=400, detail="Only CSV and Excel files are supported")
+
+    temp_path = None
+    try:
+        temp_path, _ = await spool_upload(file)
+        rows, _ = read_tabular_file(temp_path, file.filename)
+        if compact:
+            rows, _ = compact_dtypes(rows)
+        version = await append_rows(dataset_id, rows)
+
+        # The profile and summary describe the old rows; rebuild them
+        start_precompute(dataset_id)
+
+        return {
+            "id": dataset_id,
+            "appended_rows": len(rows),
+            "row_count": get_dataset_info(dataset_id)["row_count"],
+            "version": version,
+            **get_precompute_status(dataset_id)
+        }
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error appending rows: {str(e)}")
+    finally:
+        await file.close()
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
 @app.get("/test")
 async def test():
     return {"message": "Hello, World!"}
@@ -144,48 +169,79 @@ async def list_datasets():
     """
     List all available datasets.
     """
-    datasets = [
-        {
-            "id": dataset_id,
-            "filename": info["filename"],
-            "upload_time": info["upload_time"],
-            "columns": info["columns"],
-            "row_count": info["row_count"]
-        }
-        for dataset_id, info in cached_datasets.items()
-    ]
-    
-    return {"datasets": datasets}
+    return {"datasets": list_stored_datasets()}
 
 @app.get("/datasets/{dataset_id}")
 async def get_dataset(dataset_id: str):
     """
     Get information about a specific dataset.
     """
-    if dataset_id not in cached_datasets:
+    info = get_dataset_info(dataset_id)
+    if info is None:
         raise HTTPException(status_code=404, detail="Dataset not found")
     
-    info = cached_datasets[dataset_id]
+    df = load_dataset(dataset_id)
     return {
         "id": dataset_id,
         "filename": info["filename"],
         "upload_time": info["upload_time"],
         "columns": info["columns"],
         "row_count": info["row_count"],
-        "preview": info["df"].head(10).to_dict(orient='records')
+        "preview": make_json_safe(df.head(10).to_dict(orient='records')),
+        **get_precompute_status(dataset_id)
+    }
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Report dataset, result, code, cube, forecast model and sandbox cache counters.
+    """
+    return {
+        "datasets": get_cache_stats(),
+        "results": get_result_stats(),
+        "code": get_code_cache_stats(),
+        "cube": get_cube_stats(),
+        "models": get_model_stats(),
+        "sandbox": get_sandbox_stats()
     }
 
 
+@app.post("/backtest")
+async def backtest_forecast(request: BacktestRequest):
+    """
+    Score a forecast configuration over rolling origins, reporting MAE and
+    MAPE per horizon. Folds run across the backtest worker pool.
+    """
+    df = load_dataset(request.dataset_id)
+    if df is None:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+
+    profile = await wait_for_profile(request.dataset_id)
+    analyzer = DataAnalyzer(df, profile=profile, dataset_id=request.dataset_id)
+    try:
+        result = await asyncio.to_thread(
+            analyzer.backtest, request.value_cols, request.granularity, request.group_by,
+            request.horizon, request.min_train, request.step
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return make_json_safe(result)
+
+
 @app.post("/analyze")
 async def analyze_data(request: AnalyzeRequest, background_tasks: BackgroundTasks):
     """
     Analyze data based on a prompt. Classify intent and handle accordingly.
     """
-    if request.dataset_id not in cached_datasets:
+    df = load_dataset(request.dataset_id)
+    if df is None:
         raise HTTPException(status_code=404, detail="Dataset not found")
-    
-    df = cached_datasets[request.dataset_id]["df"]
-    analyzer = DataAnalyzer(df)
+
+    # Reuse the profile of an in-flight precompute; datasets stored without a
+    # current profile get profiled on first use
+    profile = await wait_for_profile(request.dataset_id)
+    analyzer = DataAnalyzer(df, profile=profile, dataset_id=request.dataset_id)
 
     # Create and store job
     job_id = str(uuid.uuid4())
@@ -220,16 +276,38 @@ async def analyze_data(request: AnalyzeRequest, background_tasks: BackgroundTask
 
             return {
                 "job_id": job_id,
-                "result": make_json_safe({"message": error_message})
+                "result": make_json_safe({"message": error_message}),
+                "cache_hit": False
             }
 
+        # Deterministic intents are served from the result cache when possible;
+        # cached results are already JSON-safe
+        cache_key = None
+        if intent == "summary":
+            # Join a summary that is still being precomputed instead of starting another
+            await wait_for_summary(request.dataset_id)
+        if intent in CACHEABLE_INTENTS:
+            cache_key = result_key(request.dataset_id, get_dataset_version(request.dataset_id), intent,
+                                   analyzer.result_parameters(intent, request.prompt))
+            cached_result = get_result(cache_key)
+            if cached_result is not None:
+                print(f"[DEBUG] Result cache hit for {intent}")
+                analysis_jobs[job_id]["result"] = cached_result
+                analysis_jobs[job_id]["status"] = "completed"
+                return {
+                    "job_id": job_id,
+                    "result": cached_result,
+                    "cache_hit": True
+                }
+
         # Handle valid intents
         if intent == "summary":
             # result = analyzer.generate_summary()
             result = analyzer.generate_user_friendly_summary()
 
         elif intent == "query":
-            result = analyzer.execute_query(request.prompt, df.columns.tolist())
+            # Generated code runs in the sandbox pool; wait for it off the event loop
+            result = await asyncio.to_thread(analyzer.execute_query, request.prompt, df.columns.tolist())
 
         elif intent == "trend":
             result = analyzer.analyze_trend(request.prompt, **parameters)
@@ -245,10 +323,10 @@ async def analyze_data(request: AnalyzeRequest, background_tasks: BackgroundTask
             result = analyzer.what_if_analysis(request.prompt, **parameters)
 
         elif intent == "aggregation":
-            result = analyzer.aggregate(request.prompt, df.columns.tolist())
+            result = await asyncio.to_thread(analyzer.aggregate, request.prompt, df.columns.tolist())
 
         elif intent == "filter":
-            result = analyzer.filter_data(request.prompt, df.columns.tolist())
+            result = await asyncio.to_thread(analyzer.filter_data, request.prompt, df.columns.tolist())
 
         else:
             raise HTTPException(status_code=400, detail=f"Unsupported intent: {intent}")
@@ -261,9 +339,14 @@ async def analyze_data(request: AnalyzeRequest, background_tasks: BackgroundTask
         analysis_jobs[job_id]["result"] = result
         analysis_jobs[job_id]["status"] = "completed"
 
+        safe_result = make_json_safe(result)
+        if cache_key is not None and not (isinstance(result, dict) and result.get("type") == "error"):
+            put_result(cache_key, safe_result)
+
         return {
             "job_id": job_id,
-            "result": make_json_safe(result)
+            "result": safe_result,
+            "cache_hit": False
         }
 
     except Exception as e:
@@ -0,0 +1,226 @@
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import os
+from typing import Dict, Any, List, Optional, Tuple
+
+from services.file_service import get_dataset_path, get_dataset_info
+from services.datetime_service import NATIVE_DATETIME
+
+try:
+    import duckdb
+except ImportError:  # optional dependency
+    duckdb = None
+
+# Query plans (see data_service.validate_query_plan) can run on more than one
+# engine. "pandas" is the reference implementation; "duckdb" runs the same plan
+# as SQL on DuckDB's multithreaded engine, directly over the dataset's
+# memory-mapped Arrow file. The deployment default comes from
+# DATAPROMPT_QUERY_BACKEND and can be overridden per dataset with its "backend"
+# metadata field.
+DEFAULT_BACKEND = os.environ.get("DATAPROMPT_QUERY_BACKEND", "pandas")
+
+SQL_AGGREGATIONS = {
+    "sum": "SUM({})",
+    "mean": "AVG({})",
+    "median": "MEDIAN({})",
+    "min": "MIN({})",
+    "max": "MAX({})",
+    "count": "COUNT({})",
+    "nunique": "COUNT(DISTINCT {})",
+    "size": "COUNT(*)",
+}
+
+SQL_COMPARISONS = {"==": "=", "!=": "!=", ">": ">", ">=": ">=", "<": "<", "<=": "<="}
+
+# Column holding each row's position, used to return rows in dataset order
+ROW_COLUMN = "__row"
+
+
+def _quote(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class PandasBackend:
+    """
+    Reference backend: runs plans with DataAnalyzer.execute_plan.
+    """
+    name = "pandas"
+
+    def execute(self, analyzer, plan: Dict[str, Any]) -> pd.DataFrame:
+        return analyzer.execute_plan(plan)
+
+
+class DuckDBBackend:
+    """
+    Runs plans as SQL on DuckDB over the dataset's Arrow data.
+
+    Stored datasets are scanned straight from their memory-mapped Arrow file,
+    so no pandas conversion happens before the query. Results follow the
+    pandas backend: groups come back sorted by their keys, filtered rows keep
+    their dataset order and index, text comparisons ignore case, and text
+    date columns are compared and grouped through their detected format.
+    """
+    name = "duckdb"
+
+    def __init__(self):
+        # Opening a database costs more than most queries; each query gets its
+        # own cursor on this one, which is safe across threads
+        self._database = duckdb.connect()
+
+    def _table(self, analyzer, with_row_numbers: bool) -> pa.Table:
+        path = get_dataset_path(analyzer.dataset_id) if analyzer.dataset_id is not None else None
+        if path is not None:
+            table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+        else:
+            table = pa.Table.from_pandas(analyzer.df, preserve_index=False)
+        if with_row_numbers:
+            table = table.append_column(ROW_COLUMN, pa.array(np.arange(table.num_rows, dtype=np.int64)))
+        return table
+
+    def _value_sql(self, analyzer, col: str) -> str:
+        """
+        SQL expression of a column as the planner sees it: text dates are parsed.
+        """
+        quoted = _quote(col)
+        if col not in analyzer.date_columns:
+            return quoted
+        fmt = analyzer.profile.get("date_formats", {}).get(col)
+        if fmt == NATIVE_DATETIME:
+            return quoted
+        if fmt is None or fmt == "ISO8601":
+            return f"TRY_CAST(CAST({quoted} AS VARCHAR) AS TIMESTAMP)"
+        return f"TRY_STRPTIME(TRIM(CAST({quoted} AS VARCHAR)), '{fmt}')"
+
+    def _is_text(self, analyzer, col: str) -> bool:
+        dtype = analyzer.profile["dtypes"].get(col, "")
+        return (col not in analyzer.numeric_columns and col not in analyzer.date_columns
+                and dtype not in ("bool", "boolean"))
+
+    def _predicate_sql(self, analyzer, predicate: Dict[str, Any]) -> Tuple[str, List[Any]]:
+        col, op, value = predicate["column"], predicate["op"], predicate["value"]
+        expr = self._value_sql(analyzer, col)
+        if self._is_text(analyzer, col):
+            lowered = f"LOWER(CAST({expr} AS VARCHAR))"
+            if op == "contains":
+                return f"CONTAINS({lowered}, ?)", [value.lower()]
+            targets = [str(v).lower() for v in (value if isinstance(value, list) else [value])]
+            placeholders = ", ".join("?" for _ in targets)
+            negate = "NOT " if op in ("!=", "not in") else ""
+            return f"{lowered} {negate}IN ({placeholders})", targets
+
+        if isinstance(value, pd.Timestamp) or (isinstance(value, list) and value and isinstance(value[0], pd.Timestamp)):
+            value = [v.to_pydatetime() for v in value] if isinstance(value, list) else value.to_pydatetime()
+        if op == "between":
+            return f"{expr} BETWEEN ? AND ?", list(value)
+        if op in ("in", "not in"):
+            placeholders = ", ".join("?" for _ in value)
+            negate = "NOT " if op == "not in" else ""
+            return f"{expr} {negate}IN ({placeholders})", list(value)
+        if op == "!=":
+            # Missing values differ from everything, as in pandas
+            return f"({expr} != ? OR {expr} IS NULL)", [value]
+        return f"{expr} {SQL_COMPARISONS[op]} ?", [value]
+
+    def to_sql(self, analyzer, plan: Dict[str, Any]) -> Tuple[str, List[Any]]:
+        """
+        Translate a validated plan to a parameterized SQL query over table "t".
+        """
+        params: List[Any] = []
+        where = []
+        for predicate in plan["filters"]:
+            clause, values = self._predicate_sql(analyzer, predicate)
+            where.append(clause)
+            params.extend(values)
+
+        aggregated = bool(plan["aggregates"])
+        # Group keys as pandas sees them: text dates are grouped by their parsed
+        # timestamps, and rows with a missing key belong to no group
+        keys = [self._value_sql(analyzer, c) for c in plan["group_by"]] if aggregated else []
+        where.extend(f"{key} IS NOT NULL" for key in keys)
+        if aggregated:
+            select = [f"{key} AS {_quote(c)}" for key, c in zip(keys, plan["group_by"])]
+            for agg in plan["aggregates"]:
+                value = self._value_sql(analyzer, agg["column"]) if agg["column"] else None
+                if agg["func"] in ("mean", "median"):
+                    value = f"CAST({value} AS DOUBLE)"
+                elif agg["func"] == "sum" and analyzer.profile["dtypes"].get(agg["column"]) in ("bool", "boolean"):
+                    value = f"CAST({value} AS INTEGER)"
+                select.append(f"{SQL_AGGREGATIONS[agg['func']].format(value)} AS {_quote(agg['as'])}")
+        else:
+            columns = plan["select"] or analyzer.df.columns.tolist()
+            select = [_quote(c) for c in columns] + [_quote(ROW_COLUMN)]
+
+        sql = f"SELECT {', '.join(select)} FROM t"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if keys:
+            sql += " GROUP BY " + ", ".join(keys)
+
+        # Ties keep the pandas order: group keys for groups, dataset order for rows
+        order = []
+        for key in plan["sort"]:
+            col = key["column"]
+            expr = _quote(col) if aggregated else self._value_sql(analyzer, col)
+            order.append(f"{expr} {'DESC' if key['descending'] else 'ASC'} NULLS LAST")
+        if aggregated:
+            order += [f"{key} ASC NULLS LAST" for key in keys]
+        else:
+            order.append(_quote(ROW_COLUMN))
+        if order:
+            sql += " ORDER BY " + ", ".join(order)
+        if plan["limit"] is not None:
+            sql += f" LIMIT {int(plan['limit'])}"
+        return sql, params
+
+    def execute(self, analyzer, plan: Dict[str, Any]) -> pd.DataFrame:
+        aggregated = bool(plan["aggregates"])
+        sql, params = self.to_sql(analyzer, plan)
+        connection = self._database.cursor()
+        try:
+            connection.register("t", self._table(analyzer, with_row_numbers=not aggregated))
+            result = connection.execute(sql, params).df()
+        finally:
+            connection.close()
+
+        # Group keys and selected columns keep the dataset's dtype (e.g. categoricals)
+        for col in (plan["group_by"] if aggregated else result.columns.drop(ROW_COLUMN)):
+            source = analyzer.df[col]
+            if isinstance(source.dtype, pd.CategoricalDtype):
+                result[col] = pd.Categorical(result[col], categories=source.cat.categories)
+        if aggregated:
+            return result
+        rows = result.pop(ROW_COLUMN).to_numpy()
+        result.index = analyzer.df.index[rows]
+        return result
+
+
+_BACKENDS = {"pandas": PandasBackend()}
+if duckdb is not None:
+    _BACKENDS["duckdb"] = DuckDBBackend()
+
+
+def available_backends() -> List[str]:
+    """
+    Names of the backends usable in this deployment.
+    """
+    return list(_BACKENDS)
+
+
+def get_backend(name: Optional[str] = None, dataset_id: Optional[str] = None):
+    """
+    Resolve the query backend for a dataset.
+
+    An explicit `name` wins over the dataset's "backend" metadata, which wins
+    over the deployment default. Unknown or uninstalled backends fall back to
+    pandas.
+    """
+    choice = name
+    if choice is None and dataset_id is not None:
+        choice = (get_dataset_info(dataset_id) or {}).get("backend")
+    choice = choice or DEFAULT_BACKEND
+    backend = _BACKENDS.get(choice)
+    if backend is None:
+        print(f"[WARN] Query backend {choice!r} is not available, using pandas")
+        backend = _BACKENDS["pandas"]
+    return backend
@@ -0,0 +1,122 @@
+import numpy as np
+import os
+import threading
+import atexit
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from services.forecast_service import fit_trends
+from services.sandbox_service import process_context
+
+# Rolling-origin backtests refit the forecast at every origin and score it
+# against the periods that followed. Folds are independent, so they are split
+# into chunks and scored across a pool of worker processes.
+BACKTEST_WORKERS = int(os.environ.get("DATAPROMPT_BACKTEST_WORKERS", os.cpu_count() or 1))
+
+# Below this many folds the pool's round trip costs more than the folds
+BACKTEST_MIN_PARALLEL_FOLDS = 32
+
+# Chunks per worker, so a slow chunk does not leave the other workers idle
+CHUNKS_PER_WORKER = 4
+
+
+def score_folds(history: np.ndarray, origins: List[int], horizon: int) -> Dict[str, np.ndarray]:
+    """
+    Fit every series on the periods before each origin and score the
+    forecasts of the `horizon` periods from the origin on.
+
+    Args:
+        history: Array of shape (periods, series)
+        origins: Number of training periods of each fold
+        horizon: Periods forecast per fold
+
+    Returns:
+        Per-horizon sums of absolute errors and their counts, and sums of
+        absolute percentage errors and their counts (periods with an actual
+        value of 0 have no percentage error)
+    """
+    totals = {key: np.zeros(horizon) for key in ("abs_error", "count", "pct_error", "pct_count")}
+    steps = np.arange(horizon)
+    for origin in origins:
+        intercepts, slopes = fit_trends(history[:origin])
+        observed = min(horizon, len(history) - origin)
+        predicted = intercepts + np.outer(origin + steps[:observed], slopes)
+        actual = history[origin:origin + observed]
+        errors = np.abs(predicted - actual)
+        nonzero = actual != 0
+        totals["abs_error"][:observed] += errors.sum(axis=1)
+        totals["count"][:observed] += actual.shape[1]
+        totals["pct_error"][:observed] += np.where(nonzero, errors / np.abs(np.where(nonzero, actual, 1)), 0).sum(axis=1)
+        totals["pct_count"][:observed] += nonzero.sum(axis=1)
+    return totals
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """
+    Get the shared backtest pool, starting its workers on first use.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=BACKTEST_WORKERS, mp_context=process_context())
+            atexit.register(_executor.shutdown)
+        return _executor
+
+
+def run_backtest(history: np.ndarray, horizon: int = 3, min_train: int = 6, step: int = 1,
+                 parallel: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Rolling-origin backtest of linear-trend forecasts of period-level series.
+
+    Folds start at every `step` periods from `min_train` training periods on,
+    for as long as at least one period is left to score.
+
+    Args:
+        history: Array of shape (periods, series)
+        horizon: Periods forecast per fold
+        min_train: Training periods of the first fold (at least 2)
+        step: Periods between fold origins
+        parallel: Score the folds in the worker pool; by default only when
+            there are several workers and enough folds
+
+    Returns:
+        Dictionary with the MAE and MAPE (in percent) per horizon and the
+        number of folds, series and workers used
+    """
+    horizon, min_train, step = max(1, horizon), max(2, min_train), max(1, step)
+    origins = list(range(min_train, len(history), step))
+    if parallel is None:
+        parallel = BACKTEST_WORKERS > 1 and len(origins) >= BACKTEST_MIN_PARALLEL_FOLDS
+
+    if parallel and origins:
+        workers = BACKTEST_WORKERS
+        chunks = [chunk.tolist() for chunk in np.array_split(origins, workers * CHUNKS_PER_WORKER) if len(chunk)]
+        executor = get_executor()
+        results = list(executor.map(score_folds, [history] * len(chunks), chunks, [horizon] * len(chunks)))
+        totals = {key: sum(result[key] for result in results) for key in results[0]}
+    else:
+        workers = 1
+        totals = score_folds(history, origins, horizon)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mae = totals["abs_error"] / totals["count"]
+        mape = totals["pct_error"] / totals["pct_count"] * 100
+    print(f"[DEBUG] Backtested {len(origins)} folds of {history.shape[1]} series on {workers} worker(s)")
+    return {
+        "horizons": [
+            {
+                "horizon": h + 1,
+                "mae": float(mae[h]) if totals["count"][h] else None,
+                "mape": float(mape[h]) if totals["pct_count"][h] else None,
+                "folds": int(totals["count"][h] // max(1, history.shape[1]))
+            }
+            for h in range(horizon)
+        ],
+        "folds": len(origins),
+        "series": int(history.shape[1]),
+        "workers": workers
+    }
@@ -0,0 +1,101 @@
+import pandas as pd
+import numpy as np
+from typing import Dict, Any, List, Optional
+
+# Low-cardinality columns (regions, categories, stores, yes/no flags) get one
+# packed bitmap per distinct value, so equality and IN filters become bitwise
+# OR/AND over n/8 bytes instead of a comparison per row. Columns with more
+# distinct values than this are filtered by comparison as before.
+BITMAP_MAX_CARDINALITY = 64
+
+# Operators answered from the index. Negations are only answered for text
+# columns, where missing values never match; numeric `!=` keeps them.
+INDEXED_OPERATORS = {"==", "in"}
+INDEXED_TEXT_OPERATORS = {"==", "in", "!=", "not in"}
+
+
+def _is_text(values: pd.Series) -> bool:
+    return not (pd.api.types.is_numeric_dtype(values) or pd.api.types.is_datetime64_any_dtype(values)
+                or pd.api.types.is_bool_dtype(values))
+
+
+class BitmapIndex:
+    """
+    Packed bitmaps of the rows holding each distinct value of a column.
+
+    Text values are keyed in lower case, matching the case-insensitive text
+    comparisons of query plans.
+    """
+
+    def __init__(self, values: pd.Series):
+        self.length = len(values)
+        self.text = _is_text(values)
+        if self.text:
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                # Fold categories that only differ by case, then map through the codes
+                key_codes, keys = pd.factorize(pd.Series(values.cat.categories.astype(str)).str.lower())
+                codes = np.append(key_codes, -1)[values.cat.codes.to_numpy()]
+            else:
+                lowered = values.astype(str).str.lower().where(values.notna())
+                codes, keys = pd.factorize(lowered)
+        else:
+            codes, keys = pd.factorize(values)
+
+        self.keys = {key: i for i, key in enumerate(keys.tolist())}
+        self.bitmaps = [np.packbits(codes == i) for i in range(len(keys))]
+        self.present = np.packbits(codes >= 0)
+
+    @property
+    def nbytes(self) -> int:
+        return self.present.nbytes * (len(self.bitmaps) + 1)
+
+    def supports(self, op: str) -> bool:
+        return op in (INDEXED_TEXT_OPERATORS if self.text else INDEXED_OPERATORS)
+
+    def match(self, op: str, value: Any) -> np.ndarray:
+        """
+        Packed bitmap of the rows matching `column <op> value`.
+        """
+        targets = value if isinstance(value, list) else [value]
+        if self.text:
+            targets = [str(v).lower() for v in targets]
+        bits = np.zeros_like(self.present)
+        for target in targets:
+            i = self.keys.get(target)
+            if i is not None:
+                bits |= self.bitmaps[i]
+        if op in ("!=", "not in"):
+            return ~bits & self.present
+        return bits
+
+    def positions(self, bits: np.ndarray) -> np.ndarray:
+        """
+        Row positions of the set bits, in ascending order.
+        """
+        return np.flatnonzero(np.unpackbits(bits, count=self.length))
+
+
+def build_bitmap_index(values: pd.Series, cardinality: Optional[int] = None) -> Optional[BitmapIndex]:
+    """
+    Index a column if it has few enough distinct values, else return None.
+
+    Args:
+        values: Column to index
+        cardinality: Distinct values from the dataset profile, if known
+    """
+    if cardinality is None:
+        cardinality = values.nunique()
+    if cardinality > BITMAP_MAX_CARDINALITY or pd.api.types.is_datetime64_any_dtype(values):
+        return None
+    return BitmapIndex(values)
+
+
+def match_all(indexes: List[BitmapIndex], predicates: List[Dict[str, Any]]) -> np.ndarray:
+    """
+    Row positions matching every predicate, one index per predicate.
+    """
+    bits = None
+    for index, predicate in zip(indexes, predicates):
+        matched = index.match(predicate["op"], predicate["value"])
+        bits = matched if bits is None else bits & matched
+    return indexes[0].positions(bits)
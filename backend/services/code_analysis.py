@@ -0,0 +1,430 @@
+import ast
+import copy
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+
+from services import sandbox_service
+from services.sandbox_service import SandboxError
+
+# Generated pandas code is checked before it is sent to the sandbox. Simple
+# row-at-a-time constructs (apply with a lambda, comprehensions over iterrows)
+# are rewritten into whole-column operations, and the cost of what remains is
+# estimated from the dataset size. Code expected to run past the sandbox time
+# limit is rejected instead of tying up a worker until it is killed.
+
+# Rough per-row costs used by the estimate, in seconds
+VECTOR_ROW_SECONDS = 1e-8          # one vectorized operation
+JOIN_ROW_SECONDS = 1e-7            # one output row of a merge
+ELEMENT_APPLY_ROW_SECONDS = 1e-6   # Series.apply / map with a Python function
+ROW_APPLY_ROW_SECONDS = 2e-5       # DataFrame.apply(axis=1)
+ROW_LOOP_ROW_SECONDS = 5e-5        # Python loop over rows (iterrows, itertuples, ...)
+
+# Pow is left out: integer columns reject negative integer powers that
+# Python ints accept, so `x ** -1` per element has no column equivalent
+ARITHMETIC_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod)
+EQUALITY_OPERATORS = (ast.Eq, ast.NotEq)
+ORDERING_OPERATORS = (ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+
+# Methods whose result has as many rows as their input
+ROW_PRESERVING_METHODS = {"copy", "sort_values", "sort_index", "fillna", "assign", "rename", "astype",
+                          "reset_index", "set_index", "drop", "dropna", "query", "drop_duplicates", "merge"}
+
+# Methods that never modify their receiver, so a `.copy()` in front of them is
+# redundant. Methods such as pop, insert or update change the frame in place.
+NON_MUTATING_METHODS = {"groupby", "sort_values", "sort_index", "query", "filter", "head", "tail", "nlargest",
+                        "nsmallest", "sum", "mean", "median", "min", "max", "count", "nunique", "value_counts",
+                        "describe", "agg", "aggregate", "pivot_table", "merge", "drop_duplicates", "dropna",
+                        "fillna", "assign", "rename", "astype", "reset_index", "set_index", "drop", "select_dtypes"}
+
+
+class CodeCostError(SandboxError):
+    """Generated code was rejected because it is expected to exceed the sandbox time limit."""
+
+
+def _frame_name(node: ast.AST) -> Optional[str]:
+    """
+    Name of a frame expression cheap enough to repeat: `df`.
+    """
+    return node.id if isinstance(node, ast.Name) else None
+
+
+def _column_of(node: ast.AST) -> Optional[str]:
+    """
+    Column of a single-column expression such as `df['Revenue']`.
+    """
+    if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) \
+            and isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str):
+        return node.slice.value
+    return None
+
+
+def _is_boolean(node: ast.AST) -> bool:
+    return isinstance(node, (ast.Compare, ast.BoolOp)) or (isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not))
+
+
+class _Vectorizer:
+    """
+    Translate the body of a per-row or per-element function into a
+    whole-column expression, or give up by returning None.
+
+    For rows, `row['col']` and `row.col` become `frame['col']`; for elements,
+    the parameter becomes the series itself. Columns used in arithmetic or
+    ordering must be numeric, since text and categorical columns support those
+    per value but not (or differently) per column.
+    """
+
+    def __init__(self, param: str, target: ast.AST, per_row: bool, columns: frozenset, numeric: frozenset):
+        self.param = param
+        self.target = target
+        self.per_row = per_row
+        self.columns = columns
+        self.numeric = numeric
+        self.uses_param = False
+
+    def translate(self, body: ast.AST) -> Optional[ast.AST]:
+        node = self._visit(body, False)
+        return node if self.uses_param else None
+
+    def _column(self, col: Optional[str], expr: ast.AST, numeric: bool) -> Optional[ast.AST]:
+        if numeric and col not in self.numeric:
+            return None
+        self.uses_param = True
+        return expr
+
+    def _visit(self, node: ast.AST, numeric: bool) -> Optional[ast.AST]:
+        """
+        Args:
+            node: Expression to translate
+            numeric: Whether the expression is used in arithmetic or ordering
+        """
+        if isinstance(node, ast.Constant):
+            return node if isinstance(node.value, (bool, int, float, str)) else None
+
+        if isinstance(node, ast.Name) and node.id == self.param and not self.per_row:
+            return self._column(_column_of(self.target), copy.deepcopy(self.target), numeric)
+
+        if self.per_row and isinstance(node, (ast.Subscript, ast.Attribute)) and isinstance(node.value, ast.Name) \
+                and node.value.id == self.param:
+            col = node.attr if isinstance(node, ast.Attribute) else \
+                node.slice.value if isinstance(node.slice, ast.Constant) else None
+            if col not in self.columns:
+                return None
+            expr = ast.Subscript(value=copy.deepcopy(self.target), slice=ast.Constant(col), ctx=ast.Load())
+            return self._column(col, expr, numeric)
+
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ARITHMETIC_OPERATORS):
+            left, right = self._visit(node.left, True), self._visit(node.right, True)
+            return None if left is None or right is None else ast.BinOp(left=left, op=node.op, right=right)
+
+        if isinstance(node, ast.UnaryOp):
+            if isinstance(node.op, ast.Not) and _is_boolean(node.operand):
+                operand = self._visit(node.operand, False)
+                return None if operand is None else ast.UnaryOp(op=ast.Invert(), operand=operand)
+            if isinstance(node.op, (ast.USub, ast.UAdd)):
+                operand = self._visit(node.operand, True)
+                return None if operand is None else ast.UnaryOp(op=node.op, operand=operand)
+            return None
+
+        if isinstance(node, ast.Compare) and len(node.ops) == 1 \
+                and isinstance(node.ops[0], EQUALITY_OPERATORS + ORDERING_OPERATORS):
+            ordering = isinstance(node.ops[0], ORDERING_OPERATORS)
+            left, right = self._visit(node.left, ordering), self._visit(node.comparators[0], ordering)
+            return None if left is None or right is None else ast.Compare(left=left, ops=node.ops, comparators=[right])
+
+        if isinstance(node, ast.BoolOp) and all(_is_boolean(v) for v in node.values):
+            values = [self._visit(v, False) for v in node.values]
+            if any(v is None for v in values):
+                return None
+            op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+            result = values[0]
+            for value in values[1:]:
+                result = ast.BinOp(left=result, op=op, right=value)
+            return result
+
+        return None
+
+
+def _method_call(node: ast.AST, name: str) -> bool:
+    return isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == name
+
+
+def _keyword(node: ast.Call, name: str) -> Optional[ast.AST]:
+    for kw in node.keywords:
+        if kw.arg == name:
+            return kw.value
+    return None
+
+
+def _is_row_axis(node: Optional[ast.AST]) -> bool:
+    return isinstance(node, ast.Constant) and node.value in (1, "columns")
+
+
+class _Rewriter(ast.NodeTransformer):
+    """
+    Rewrite known slow patterns into vectorized pandas:
+
+    - `df.apply(lambda row: <expr>, axis=1)` -> `(<expr over df columns>).rename(None)`
+    - `s.apply(lambda x: <expr>)` / `s.map(...)` on a column -> `<expr over s>`
+    - `[<expr> for _, row in df.iterrows()]` (optionally with one `if`) -> `(<expr>).tolist()`
+    - `df.copy().method(...)` / `df.copy()[...]` -> `df.method(...)` / `df[...]` for
+      methods in NON_MUTATING_METHODS
+    """
+
+    def __init__(self, columns: frozenset, numeric: frozenset):
+        self.columns = columns
+        self.numeric = numeric
+        self.rewrites: List[str] = []
+
+    def visit_Call(self, node: ast.Call) -> ast.AST:
+        keep_copy = _keyword(node, "inplace") is not None
+        self.generic_visit(node)
+
+        # Copies feeding straight into a method that does not modify them are redundant
+        if not keep_copy and isinstance(node.func, ast.Attribute) and node.func.attr in NON_MUTATING_METHODS \
+                and _method_call(node.func.value, "copy") and not node.func.value.args:
+            node.func.value = node.func.value.func.value
+            self.rewrites.append("dropped a chained .copy()")
+
+        if not (_method_call(node, "apply") or _method_call(node, "map")) or len(node.args) != 1 \
+                or not isinstance(node.args[0], ast.Lambda) or len(node.args[0].args.args) != 1:
+            return node
+        func = node.args[0]
+        param = func.args.args[0].arg
+        receiver = node.func.value
+        axis = _keyword(node, "axis")
+
+        if node.func.attr == "apply" and _is_row_axis(axis) and len(node.keywords) == 1 \
+                and _frame_name(receiver) is not None:
+            body = _Vectorizer(param, receiver, True, self.columns, self.numeric).translate(func.body)
+            if body is not None:
+                self.rewrites.append("vectorized a row-wise apply")
+                return ast.Call(func=ast.Attribute(value=body, attr="rename", ctx=ast.Load()),
+                                args=[ast.Constant(None)], keywords=[])
+        elif not node.keywords and _column_of(receiver) is not None:
+            body = _Vectorizer(param, receiver, False, self.columns, self.numeric).translate(func.body)
+            if body is not None:
+                self.rewrites.append(f"vectorized an element-wise {node.func.attr}")
+                return body
+        return node
+
+    def visit_Subscript(self, node: ast.Subscript) -> ast.AST:
+        self.generic_visit(node)
+        if isinstance(node.ctx, ast.Load) and _method_call(node.value, "copy") and not node.value.args:
+            node.value = node.value.func.value
+            self.rewrites.append("dropped a chained .copy()")
+        return node
+
+    def visit_ListComp(self, node: ast.ListComp) -> ast.AST:
+        self.generic_visit(node)
+        if len(node.generators) != 1 or len(node.generators[0].ifs) > 1 or node.generators[0].is_async:
+            return node
+        generator = node.generators[0]
+        target, source = generator.target, generator.iter
+
+        if _method_call(source, "iterrows") and _frame_name(source.func.value) is not None \
+                and isinstance(target, ast.Tuple) and len(target.elts) == 2 \
+                and all(isinstance(e, ast.Name) for e in target.elts):
+            index_name, param, frame, per_row = target.elts[0].id, target.elts[1].id, source.func.value, True
+            if any(isinstance(n, ast.Name) and n.id == index_name for n in ast.walk(node)
+                   if n is not target.elts[0]):
+                return node
+        elif _method_call(source, "itertuples") and not source.args and not source.keywords \
+                and _frame_name(source.func.value) is not None and isinstance(target, ast.Name):
+            param, frame, per_row = target.id, source.func.value, True
+        elif _column_of(source) is not None and isinstance(target, ast.Name):
+            param, frame, per_row = target.id, source, False
+        else:
+            return node
+
+        element = _Vectorizer(param, frame, per_row, self.columns, self.numeric).translate(node.elt)
+        if element is None:
+            return node
+        if generator.ifs:
+            condition = _Vectorizer(param, frame, per_row, self.columns, self.numeric).translate(generator.ifs[0])
+            if condition is None:
+                return node
+            element = ast.Subscript(value=element, slice=condition, ctx=ast.Load())
+        self.rewrites.append("vectorized a list comprehension over rows")
+        return ast.Call(func=ast.Attribute(value=element, attr="tolist", ctx=ast.Load()), args=[], keywords=[])
+
+
+class _CostModel(ast.NodeVisitor):
+    """
+    Collect the constructs whose cost grows with the number of rows.
+
+    Each finding is a (construct, degree, seconds per row**degree, key columns)
+    tuple: degree 2 marks work that grows with the square of the row count,
+    such as nested loops over rows or a self-join.
+    """
+
+    def __init__(self):
+        self.findings: List[Tuple[str, int, float, Tuple[str, ...]]] = []
+        self.data_names = {"df"}
+        self.loop_depth = 0
+        self.operations = 0
+
+    def _is_data(self, node: ast.AST) -> bool:
+        """Whether an expression has (up to) as many rows as the dataset."""
+        if isinstance(node, ast.Name):
+            return node.id in self.data_names
+        if isinstance(node, ast.Subscript):
+            return self._is_data(node.value)
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+            return node.func.attr in ROW_PRESERVING_METHODS and self._is_data(node.func.value)
+        return False
+
+    def _is_row_iterable(self, node: ast.AST) -> bool:
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) \
+                and node.func.attr in ("iterrows", "itertuples"):
+            return self._is_data(node.func.value)
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            if node.func.id == "range" and node.args:
+                return any(isinstance(n, ast.Call) and isinstance(n.func, ast.Name) and n.func.id == "len"
+                           and n.args and self._is_data(n.args[0]) for n in ast.walk(node.args[-1]))
+            if node.func.id in ("zip", "enumerate"):
+                return any(self._is_row_iterable(a) for a in node.args)
+        # Iterating a column yields its values; iterating a frame only its column names
+        return _column_of(node) is not None and self._is_data(node)
+
+    def _add(self, construct: str, degree: int, seconds: float, keys: Tuple[str, ...] = ()):
+        self.findings.append((construct, degree, seconds, keys))
+
+    def _loop(self, iterables: List[ast.AST], body: List[ast.AST], visit_iterables: bool = True):
+        row_loops = sum(1 for it in iterables if self._is_row_iterable(it))
+        if visit_iterables:
+            for it in iterables:
+                self.visit(it)
+        if row_loops:
+            self.loop_depth += row_loops
+            self._add("nested loop over rows" if self.loop_depth > 1 else "loop over rows",
+                      self.loop_depth, ROW_LOOP_ROW_SECONDS)
+        for node in body:
+            self.visit(node)
+        self.loop_depth -= row_loops
+
+    def visit_Assign(self, node: ast.Assign):
+        self.generic_visit(node)
+        for target in node.targets:
+            if isinstance(target, ast.Name):
+                if self._is_data(node.value):
+                    self.data_names.add(target.id)
+                else:
+                    self.data_names.discard(target.id)
+
+    def visit_For(self, node: ast.For):
+        self._loop([node.iter], node.body + node.orelse)
+
+    def _comprehension(self, node):
+        iterables = [g.iter for g in node.generators]
+        body = [c for g in node.generators for c in g.ifs]
+        body += [node.key, node.value] if isinstance(node, ast.DictComp) else [node.elt]
+        self._loop(iterables, body)
+
+    visit_ListComp = visit_SetComp = visit_GeneratorExp = visit_DictComp = _comprehension
+
+    def visit_Call(self, node: ast.Call):
+        self.operations += 1
+        degree = self.loop_depth + 1
+        if isinstance(node.func, ast.Attribute):
+            method, receiver = node.func.attr, node.func.value
+            has_function = bool(node.args) and isinstance(node.args[0], (ast.Lambda, ast.Name))
+            if method == "apply" and _is_row_axis(_keyword(node, "axis")) and has_function:
+                self._add("row-wise apply", degree, ROW_APPLY_ROW_SECONDS)
+            elif method in ("apply", "map") and has_function and _column_of(receiver) is not None:
+                self._add(f"element-wise {method}", degree, ELEMENT_APPLY_ROW_SECONDS)
+            elif method == "merge" and isinstance(receiver, ast.Name) and receiver.id == "pd":
+                sides = node.args[:2]
+                if len(sides) == 2:
+                    self._merge(node, sides[0], sides[1], degree)
+            elif method == "merge":
+                self._merge(node, receiver, node.args[0] if node.args else _keyword(node, "right"), degree)
+        self.generic_visit(node)
+
+    def _merge(self, node: ast.Call, left: ast.AST, right: Optional[ast.AST], degree: int):
+        """
+        Merges of two dataset-sized frames grow with the square of the row
+        count when every row matches many others: always for cross joins, and
+        for keyed joins in proportion to how few distinct keys there are.
+        """
+        if right is None or not (self._is_data(left) and self._is_data(right)):
+            return
+        how = _keyword(node, "how")
+        if isinstance(how, ast.Constant) and how.value == "cross":
+            self._add("cross join", degree + 1, JOIN_ROW_SECONDS)
+            return
+        on = _keyword(node, "on")
+        keys = ()
+        if isinstance(on, ast.Constant) and isinstance(on.value, str):
+            keys = (on.value,)
+        elif isinstance(on, (ast.List, ast.Tuple)):
+            keys = tuple(e.value for e in on.elts if isinstance(e, ast.Constant) and isinstance(e.value, str))
+        if keys:
+            self._add("self-join", degree + 1, JOIN_ROW_SECONDS, keys)
+
+
+@lru_cache(maxsize=512)
+def _analyze(code: str, columns: frozenset, numeric: frozenset):
+    """
+    Rewrite and cost-model a snippet. Cached, so repeated snippets are parsed once.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        # Let the sandbox report the error as usual
+        return code, (), (), 0
+    rewriter = _Rewriter(columns, numeric)
+    tree = ast.fix_missing_locations(rewriter.visit(tree))
+    rewritten = ast.unparse(tree) if rewriter.rewrites else code
+    model = _CostModel()
+    model.visit(tree)
+    return rewritten, tuple(rewriter.rewrites), tuple(model.findings), model.operations
+
+
+def estimate_seconds(findings, operations: int, row_count: int, cardinality: Dict[str, int]) -> float:
+    """
+    Estimate the run time of a snippet from its findings and the dataset size.
+    """
+    seconds = max(operations, 1) * row_count * VECTOR_ROW_SECONDS
+    for construct, degree, per_row, keys in findings:
+        rows = float(row_count) ** degree
+        if keys:
+            # Each key value matches its own rows: n**2 / distinct keys
+            rows /= max([cardinality.get(k, 1) for k in keys] + [1])
+        seconds += rows * per_row
+    return seconds
+
+
+def prepare_code(code: str, profile: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Rewrite slow patterns in generated code and estimate its cost.
+
+    Args:
+        code: Generated pandas code operating on `df`
+        profile: Profile of the dataset the code runs against
+
+    Returns:
+        Dictionary with the code to run, the rewrites applied, the slow
+        constructs left in it and the estimated run time in seconds
+
+    Raises:
+        CodeCostError: If the estimate exceeds the sandbox time limit
+    """
+    columns = frozenset(profile.get("columns") or profile["dtypes"])
+    rewritten, rewrites, findings, operations = _analyze(code, columns, frozenset(profile["numeric_columns"]))
+    row_count = profile.get("row_count", 0)
+    seconds = estimate_seconds(findings, operations, row_count, profile.get("cardinality", {}))
+    constructs = sorted({f[0] for f in findings})
+
+    print(f"[DEBUG] Generated code cost: ~{seconds:.3f}s for {row_count:,} rows"
+          + (f"; rewrites: {', '.join(rewrites)}" if rewrites else "")
+          + (f"; slow constructs: {', '.join(constructs)}" if constructs else ""))
+    if seconds > sandbox_service.SANDBOX_TIMEOUT_SECONDS:
+        raise CodeCostError(
+            f"Generated code was not run: {', '.join(constructs) or 'it'} over {row_count:,} rows would take "
+            f"about {seconds:,.0f}s, more than the {sandbox_service.SANDBOX_TIMEOUT_SECONDS:g}s limit")
+    return {
+        "code": rewritten,
+        "rewrites": list(rewrites),
+        "slow_constructs": constructs,
+        "estimated_seconds": seconds
+    }
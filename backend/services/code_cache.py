@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+import pandas as pd
+
+from services import file_service
+
+# Generated code that executed successfully, persisted next to the datasets so
+# repeated questions skip the LLM round trip across restarts
+CODE_CACHE_FILENAME = "code_cache.json"
+
+# Maximum number of snippets kept; the least recently used one is evicted first
+CODE_CACHE_MAX_ENTRIES = int(os.environ.get("DATAPROMPT_CODE_CACHE_ENTRIES", 1000))
+
+# Snippets keyed by code_cache_key, ordered from least to most recently used
+_entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_loaded_from: Optional[str] = None
+code_stats = {"hits": 0, "misses": 0, "invalidations": 0, "saved_llm_seconds": 0.0}
+
+_lock = threading.RLock()
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalize a prompt so trivially different phrasings share a cache entry:
+    case, surrounding/repeated whitespace and trailing punctuation are ignored.
+    """
+    return re.sub(r"\s+", " ", prompt.strip().lower()).rstrip(" .?!")
+
+
+def schema_fingerprint(df: pd.DataFrame) -> str:
+    """
+    Fingerprint of a DataFrame's column names and dtypes.
+    """
+    schema = [[str(col), str(dtype)] for col, dtype in df.dtypes.items()]
+    return hashlib.sha1(json.dumps(schema).encode()).hexdigest()
+
+
+def code_cache_key(prompt: str, fingerprint: str, model: str) -> str:
+    """
+    Build the cache key of a snippet from the prompt, schema fingerprint and model name.
+    """
+    raw = json.dumps([normalize_prompt(prompt), fingerprint, model])
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _cache_path() -> str:
+    return os.path.join(file_service.DATA_DIR, CODE_CACHE_FILENAME)
+
+
+def _ensure_loaded():
+    global _loaded_from
+    if _loaded_from == _cache_path():
+        return
+    _entries.clear()
+    for key in code_stats:
+        code_stats[key] = 0
+    if os.path.exists(_cache_path()):
+        with open(_cache_path()) as f:
+            _entries.update(json.load(f))
+    _loaded_from = _cache_path()
+
+
+def _write():
+    os.makedirs(file_service.DATA_DIR, exist_ok=True)
+    tmp_path = _cache_path() + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(_entries, f, indent=2)
+    os.replace(tmp_path, _cache_path())
+
+
+def get_cached_code(key: str) -> Optional[str]:
+    """
+    Get a cached snippet, or None on a miss. A hit counts the LLM time it saves.
+    """
+    with _lock:
+        _ensure_loaded()
+        entry = _entries.get(key)
+        if entry is None:
+            code_stats["misses"] += 1
+            return None
+        _entries.move_to_end(key)
+        entry["hits"] += 1
+        code_stats["hits"] += 1
+        code_stats["saved_llm_seconds"] += entry["llm_seconds"]
+        return entry["code"]
+
+
+def put_cached_code(key: str, code: str, llm_seconds: float):
+    """
+    Store a snippet that executed successfully.
+
+    Args:
+        key: Key built by code_cache_key
+        code: Generated code as returned by the LLM
+        llm_seconds: Time the LLM took to generate it
+    """
+    with _lock:
+        _ensure_loaded()
+        _entries[key] = {
+            "code": code,
+            "llm_seconds": round(llm_seconds, 3),
+            "created": datetime.now().isoformat(),
+            "hits": 0
+        }
+        _entries.move_to_end(key)
+        while len(_entries) > CODE_CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+        _write()
+
+
+def invalidate_code(key: str):
+    """
+    Drop a snippet, e.g. because it failed to execute.
+    """
+    with _lock:
+        _ensure_loaded()
+        if _entries.pop(key, None) is not None:
+            code_stats["invalidations"] += 1
+            _write()
+
+
+def get_code_cache_stats() -> Dict[str, Any]:
+    """
+    Report hit rate and LLM time saved by the code cache.
+    """
+    with _lock:
+        _ensure_loaded()
+        lookups = code_stats["hits"] + code_stats["misses"]
+        return {
+            **code_stats,
+            "saved_llm_seconds": round(code_stats["saved_llm_seconds"], 3),
+            "hit_rate": code_stats["hits"] / lookups if lookups else 0.0,
+            "entries": len(_entries),
+            "max_entries": CODE_CACHE_MAX_ENTRIES
+        }
@@ -0,0 +1,164 @@
+import os
+import pandas as pd
+import numpy as np
+from typing import Dict, Any, List, Optional, Tuple
+
+from services.grouping_service import combine_codes
+
+# Most questions are sums and counts of a few measures broken down by a few
+# retail dimensions. The cube stores those measures pre-aggregated per
+# combination of dimension values that occurs in the data, so such questions
+# are answered from a few thousand cells instead of every row.
+CUBE_DIMENSIONS = ["Year", "Month", "ProductCategory", "ProductName", "Region", "CustomerSegment",
+                   "PromotionApplied", "Holiday"]
+CUBE_MEASURES = ["Revenue", "Profit", "UnitsSold"]
+
+# Set DATAPROMPT_CUBE=0 to answer every query from raw rows
+CUBE_ENABLED = os.environ.get("DATAPROMPT_CUBE", "1") != "0"
+
+# Dimensions with more distinct values than this are left out of the cube
+CUBE_MAX_CARDINALITY = 1000
+
+cube_stats = {"builds": 0, "hits": 0, "misses": 0}
+
+
+def _distinct(code_arrays: List[np.ndarray], sizes: List[int], length: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find the distinct combinations of several code arrays. Keys are combined
+    with combine_codes, which compresses them before they could overflow int64.
+
+    Returns:
+        Position of the first occurrence of each combination, and the
+        combination of every position
+    """
+    keys, _ = combine_codes(code_arrays, sizes, length)
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    return first, inverse.ravel()
+
+
+class Cube:
+    """
+    Additive measures per occurring combination of dimension values.
+
+    Every cell holds, for one combination, the dimension codes (positions in
+    `levels`, -1 for a missing value), the number of rows, and the sum and
+    non-null count of each measure.
+    """
+
+    def __init__(self, df: pd.DataFrame, dimensions: List[str], measures: List[str]):
+        self.levels: Dict[str, pd.Series] = {}
+        row_codes = {}
+        for dim in dimensions:
+            values = df[dim]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                codes = values.cat.codes.to_numpy()
+                levels = pd.Series(pd.Categorical.from_codes(np.arange(len(values.cat.categories)), dtype=values.dtype))
+            else:
+                # Sorted, so code order is the order pandas gives groups
+                codes, uniques = pd.factorize(values, sort=True)
+                levels = pd.Series(uniques)
+            self.levels[dim] = levels
+            row_codes[dim] = codes
+
+        # Cells are the distinct combinations of codes, shifted so missing is 0
+        first, inverse = _distinct([row_codes[dim] + 1 for dim in dimensions],
+                                   [len(self.levels[dim]) + 1 for dim in dimensions], len(df))
+        size = len(first)
+        self.codes: Dict[str, np.ndarray] = {dim: row_codes[dim][first].astype(np.int32) for dim in dimensions}
+
+        self.rows = np.bincount(inverse, minlength=size)
+        self.sums: Dict[str, np.ndarray] = {}
+        self.counts: Dict[str, np.ndarray] = {}
+        self.integer_measures = set()
+        for measure in measures:
+            values = df[measure]
+            if pd.api.types.is_integer_dtype(values):
+                self.integer_measures.add(measure)
+            present = values.notna().to_numpy()
+            weights = np.where(present, values.to_numpy(dtype=float, na_value=0.0), 0.0)
+            self.sums[measure] = np.bincount(inverse, weights=weights, minlength=size)
+            self.counts[measure] = np.bincount(inverse, weights=present, minlength=size).astype(np.int64)
+
+    @property
+    def dimensions(self) -> List[str]:
+        return list(self.levels)
+
+    @property
+    def measures(self) -> List[str]:
+        return list(self.sums)
+
+    @property
+    def cell_count(self) -> int:
+        return len(self.rows)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = list(self.codes.values()) + list(self.sums.values()) + list(self.counts.values()) + [self.rows]
+        return sum(a.nbytes for a in arrays)
+
+    def group(self, dimensions: List[str], keep: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """
+        Roll the kept cells up to the given dimensions.
+
+        Args:
+            dimensions: Dimensions to group by, in order
+            keep: Boolean mask of the cells to use, None for all
+
+        Returns:
+            Dictionary with per-group "codes" (per dimension), "rows", "sums" and
+            "counts" (per measure); groups come in the order of their codes and
+            combinations with a missing dimension value are dropped
+        """
+        cells = np.arange(self.cell_count) if keep is None else np.flatnonzero(keep)
+        for dim in dimensions:
+            cells = cells[self.codes[dim][cells] >= 0]
+
+        cell_codes = [self.codes[dim][cells] for dim in dimensions]
+        first, inverse = _distinct(cell_codes, [len(self.levels[dim]) for dim in dimensions], len(cells))
+        size = len(first)
+
+        # Number the groups in the order of their codes
+        codes = {dim: c[first] for dim, c in zip(dimensions, cell_codes)}
+        if dimensions:
+            order = np.lexsort([codes[dim] for dim in reversed(dimensions)])
+            rank = np.empty(size, dtype=np.int64)
+            rank[order] = np.arange(size)
+            inverse = rank[inverse]
+            codes = {dim: c[order] for dim, c in codes.items()}
+        return {
+            "codes": codes,
+            "rows": np.bincount(inverse, weights=self.rows[cells], minlength=size).astype(np.int64),
+            "sums": {m: np.bincount(inverse, weights=s[cells], minlength=size) for m, s in self.sums.items()},
+            "counts": {m: np.bincount(inverse, weights=c[cells], minlength=size).astype(np.int64)
+                       for m, c in self.counts.items()},
+        }
+
+
+def build_cube(df: pd.DataFrame, profile: Dict[str, Any]) -> Optional[Cube]:
+    """
+    Build the cube of a dataset from the retail dimensions and measures it has.
+
+    Returns:
+        The cube, or None if the cube is disabled or the dataset has no
+        usable dimension or measure
+    """
+    if not CUBE_ENABLED:
+        return None
+    cardinality = profile.get("cardinality", {})
+    dimensions = [d for d in CUBE_DIMENSIONS if d in df.columns and d not in profile.get("date_columns", [])
+                  and cardinality.get(d, 0) <= CUBE_MAX_CARDINALITY]
+    measures = [m for m in CUBE_MEASURES if m in df.columns and m in profile["numeric_columns"]]
+    if not dimensions or not measures:
+        return None
+    cube = Cube(df, dimensions, measures)
+    cube_stats["builds"] += 1
+    print(f"[DEBUG] Built cube with {cube.cell_count:,} cells over {dimensions} for {len(df):,} rows")
+    return cube
+
+
+def get_cube_stats() -> Dict[str, Any]:
+    """
+    Report cube builds and how many aggregate queries the cube answered.
+    """
+    lookups = cube_stats["hits"] + cube_stats["misses"]
+    return {**cube_stats, "hit_rate": cube_stats["hits"] / lookups if lookups else 0.0, "enabled": CUBE_ENABLED}
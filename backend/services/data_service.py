@@ -1,18 +1,32 @@
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Union, Callable
 import json
 import requests
 import re
 import traceback
+import time
 from datetime import datetime, timedelta
 import json
 
 # from services.prepare_data_for_prediction import forecast_weekly_sales, forecast_monthly_sales  # Adjust to your actual import path
 from dateutil.parser import parse as parse_date
 
-from services.nlp_service import generate_panda_code_from_prompt, classify_forecast_intent, parse_whatif_scenarios, extract_forecast_period
-from services.forecast_service import process_and_predict, process_whatif, process_forecast
+from services.nlp_service import MODEL_NAME as CODE_MODEL_NAME, generate_panda_code_from_prompt, generate_query_plan, classify_forecast_intent, parse_whatif_scenarios, extract_forecast_period
+from services.forecast_service import process_and_predict, process_whatif, ForecastModel, FORECAST_FREQUENCIES, monthly_totals, grouped_totals, convert_horizon
+from services.backtest_service import run_backtest
+from services.profile_service import build_profile
+from services.datetime_service import get_parsed_datetime, get_year_month_dates, get_sorted_date_index
+from services.file_service import get_derived, get_dataset_version
+from services.model_cache import model_key, get_model, put_model
+from services.sandbox_service import run_code, SandboxError
+from services.code_cache import code_cache_key, schema_fingerprint, get_cached_code, put_cached_code, invalidate_code
+from services.grouping_service import GroupingSets
+from services.backend_service import get_backend
+from services.code_analysis import prepare_code
+from services.bitmap_index import build_bitmap_index, match_all
+from services.cube_service import build_cube, cube_stats
+from services.time_pyramid import build_time_pyramid
 
 
 
@@ -27,37 +41,803 @@ MODEL_NAME = "llama3.2"
 
 
 
+# Bins used by the summary breakdowns
+TEMPERATURE_BINS = [0, 10, 20, 30, 40, 100]
+TEMPERATURE_LABELS = ['0-10', '10-20', '20-30', '30-40', '40+']
+MARGIN_BINS = [-0.5, 0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
+MARGIN_LABELS = ['Loss', '0-10%', '10-20%', '20-30%', '30-40%', '40-50%',
+                 '50-60%', '60-70%', '70-80%', '80-90%', '90-100%']
+
+
+def _period_labels(frame: pd.DataFrame, year_col: str = 'Year', month_col: str = 'Month') -> pd.Series:
+    """
+    Format integer year/month columns as YYYY-MM labels for a whole frame at once.
+    """
+    years = frame[year_col].astype(np.int64).astype(str)
+    months = frame[month_col].astype(np.int64).astype(str).str.zfill(2)
+    return years + '-' + months
+
+
+def _to_records(frame: pd.DataFrame, fields: Dict[str, str], rounded=(), integers=(), booleans=()) -> List[Dict[str, Any]]:
+    """
+    Turn an aggregated frame into chart records with whole-column operations.
+
+    Args:
+        frame: Aggregated data
+        fields: Output key -> source column, in output order
+        rounded: Output keys rounded to 2 decimals
+        integers: Output keys cast to int
+        booleans: Output keys cast to bool
+
+    Returns:
+        List of record dictionaries
+    """
+    out = pd.DataFrame({key: frame[col].to_numpy() for key, col in fields.items()})
+    for key in rounded:
+        out[key] = out[key].astype(float).round(2)
+    for key in integers:
+        out[key] = out[key].astype(np.int64)
+    for key in booleans:
+        out[key] = out[key].astype(bool)
+    return out.to_dict(orient='records')
+
+
+# Query plan IR: operators and aggregations a plan may use
+PLAN_OPERATORS = {"==", "!=", ">", ">=", "<", "<=", "in", "not in", "between", "contains"}
+PLAN_AGGREGATIONS = {"sum", "mean", "median", "min", "max", "count", "nunique", "size"}
+ORDERING_OPERATORS = {">", ">=", "<", "<=", "between"}
+DATE_RANGE_OPERATORS = ORDERING_OPERATORS | {"=="}
+CUBE_AGGREGATIONS = {"sum", "count", "mean"}
+
+# Measures and dimensions forecast prompts can name, as regex -> column.
+# "for each region", "per category" or "by segment" forecast one series per group.
+FORECAST_MEASURES = {
+    r"\brevenue\b|\bsales\b": "Revenue",
+    r"\bprofits?\b": "Profit",
+    r"\bunits\b": "UnitsSold",
+}
+FORECAST_DIMENSIONS = {
+    r"\bcategor(y|ies)\b": "ProductCategory",
+    r"\bproducts?\b(?!\s+categor)": "ProductName",
+    r"\bregions?\b": "Region",
+    r"\bsegments?\b": "CustomerSegment",
+    r"\bstores?\b": "StoreID",
+}
+# Forecast granularities. One named outright ("weekly revenue") wins, then
+# the unit of the horizon ("for the next 6 weeks"), then any period the
+# prompt mentions, checked in order; months when there is none.
+FORECAST_GRANULARITIES = {
+    r"\bdaily\b": "day",
+    r"\bweekly\b": "week",
+    r"\bmonthly\b": "month",
+    r"\bquarterly\b": "quarter",
+    r"\byearly\b|\bannual(ly)?\b": "year",
+}
+FORECAST_PERIOD_WORDS = {
+    r"\bdays?\b": "day",
+    r"\bweeks?\b": "week",
+    r"\bquarters?\b": "quarter",
+    r"\byears?\b": "year",
+}
+OPERATOR_ALIASES = {"=": "==", "eq": "==", "ne": "!=", "<>": "!=", "gt": ">", "gte": ">=", "lt": "<",
+                    "lte": "<=", "not_in": "not in", "notin": "not in", "isin": "in"}
+# Spellings accepted for plan values compared with boolean columns (case-insensitive)
+TRUE_VALUES = {"yes", "y", "true", "t", "1"}
+FALSE_VALUES = {"no", "n", "false", "f", "0"}
+
+
+class QueryPlanError(ValueError):
+    """A query plan does not fit the dataset it should run against."""
+
+
+def _plan_scalar(value: Any, col: str, profile: Dict[str, Any]) -> Any:
+    """
+    Coerce a literal from a plan to the type of the column it is compared with.
+    """
+    dtype = profile["dtypes"].get(col, "")
+    if isinstance(value, (list, dict)):
+        raise QueryPlanError(f"Expected a single value for {col}, got {value!r}")
+    if dtype in ("bool", "boolean"):
+        text = str(value).strip().lower()
+        if text in TRUE_VALUES or text in FALSE_VALUES:
+            return text in TRUE_VALUES
+        raise QueryPlanError(f"Expected a yes/no value for {col}, got {value!r}")
+    if col in profile["numeric_columns"]:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise QueryPlanError(f"Expected a number for {col}, got {value!r}")
+    if col in profile["date_columns"]:
+        try:
+            return pd.Timestamp(value)
+        except (TypeError, ValueError):
+            raise QueryPlanError(f"Expected a date for {col}, got {value!r}")
+    return str(value)
+
+
+def validate_query_plan(plan: Dict[str, Any], profile: Dict[str, Any], kind: str = "query") -> Dict[str, Any]:
+    """
+    Check a query plan against the dataset profile and normalize it.
+
+    Every referenced column must exist, ordering comparisons need numeric or
+    date columns, numeric aggregations need numeric or boolean columns and
+    literals are coerced to the column types. Filter plans may not aggregate.
+
+    Returns:
+        Plan with filters, group_by, aggregates, select, sort and limit keys
+
+    Raises:
+        QueryPlanError: If the plan does not fit the dataset
+    """
+    if not isinstance(plan, dict):
+        raise QueryPlanError("A query plan must be a JSON object")
+    columns = set(profile["columns"])
+    orderable = set(profile["numeric_columns"]) | set(profile["date_columns"])
+    summable = set(profile["numeric_columns"]) | {c for c, d in profile["dtypes"].items() if d in ("bool", "boolean")}
+
+    def column(name, where):
+        if not isinstance(name, str) or name not in columns:
+            raise QueryPlanError(f"Unknown column {name!r} in {where}")
+        return name
+
+    def as_list(value, where):
+        if value is None:
+            return []
+        if not isinstance(value, list):
+            raise QueryPlanError(f"{where} must be a list")
+        return value
+
+    filters = []
+    for item in as_list(plan.get("filters"), "filters"):
+        col = column(item.get("column"), "filters")
+        op = str(item.get("op", "==")).strip().lower()
+        op = OPERATOR_ALIASES.get(op, op)
+        if op not in PLAN_OPERATORS:
+            raise QueryPlanError(f"Unsupported operator {op!r}")
+        if op in ORDERING_OPERATORS and col not in orderable:
+            raise QueryPlanError(f"Operator {op!r} needs a numeric or date column, not {col}")
+        value = item.get("value")
+        if op in ("in", "not in"):
+            value = [_plan_scalar(v, col, profile) for v in (value if isinstance(value, list) else [value])]
+        elif op == "between":
+            if not isinstance(value, list) or len(value) != 2:
+                raise QueryPlanError("between needs [low, high]")
+            value = [_plan_scalar(v, col, profile) for v in value]
+        elif op == "contains":
+            value = str(value)
+        else:
+            value = _plan_scalar(value, col, profile)
+        filters.append({"column": col, "op": op, "value": value})
+
+    group_by = [column(c, "group_by") for c in as_list(plan.get("group_by"), "group_by")]
+
+    aggregates = []
+    for item in as_list(plan.get("aggregates"), "aggregates"):
+        func = str(item.get("func", "")).strip().lower()
+        if func not in PLAN_AGGREGATIONS:
+            raise QueryPlanError(f"Unsupported aggregation {func!r}")
+        col = item.get("column")
+        col = column(col, "aggregates") if (func != "size" or col) else None
+        if func in ("sum", "mean", "median") and col not in summable:
+            raise QueryPlanError(f"Cannot {func} non-numeric column {col}")
+        if func in ("min", "max") and col not in orderable:
+            raise QueryPlanError(f"Cannot take {func} of non-numeric column {col}")
+        aggregates.append({"column": col, "func": func, "as": item.get("as")})
+    if group_by and not aggregates:
+        aggregates.append({"column": None, "func": "size", "as": "count"})
+
+    # Output names default to the column, disambiguated by function when repeated
+    counts = {}
+    for agg in aggregates:
+        counts[agg["column"]] = counts.get(agg["column"], 0) + 1
+    for agg in aggregates:
+        if not agg["as"]:
+            agg["as"] = agg["column"] if agg["column"] and counts[agg["column"]] == 1 else f"{agg['column'] or 'rows'}_{agg['func']}"
+    if aggregates and len({a["as"] for a in aggregates} | set(group_by)) != len(aggregates) + len(group_by):
+        raise QueryPlanError("Aggregate output names must be unique")
+
+    if kind == "filter" and aggregates:
+        raise QueryPlanError("Filter plans cannot group or aggregate")
+
+    select = [column(c, "select") for c in as_list(plan.get("select"), "select")]
+    outputs = set(group_by) | {a["as"] for a in aggregates} if aggregates else columns
+
+    sort = []
+    for item in as_list(plan.get("sort"), "sort"):
+        if isinstance(item, str):
+            item = {"column": item}
+        if item.get("column") not in outputs:
+            raise QueryPlanError(f"Cannot sort by {item.get('column')!r}")
+        sort.append({"column": item["column"], "descending": bool(item.get("descending", False))})
+
+    limit = plan.get("limit")
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            raise QueryPlanError(f"Invalid limit {limit!r}")
+        if limit < 1:
+            raise QueryPlanError(f"Invalid limit {limit!r}")
+
+    return {"filters": filters, "group_by": group_by, "aggregates": aggregates,
+            "select": select, "sort": sort, "limit": limit}
+
+
+def _estimated_selectivity(predicate: Dict[str, Any], cardinality: Dict[str, int]) -> float:
+    """
+    Rough share of rows a predicate keeps, used to evaluate selective filters first.
+    """
+    distinct = max(cardinality.get(predicate["column"], 2), 1)
+    op = predicate["op"]
+    if op == "==":
+        return 1 / distinct
+    if op == "in":
+        return min(len(predicate["value"]) / distinct, 1.0)
+    if op in ("!=", "not in"):
+        return 1.0
+    return 0.5
+
+
+def _date_range(predicate: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Bounds of a date predicate, as keyword arguments of SortedDateIndex.range.
+    """
+    op, value = predicate["op"], predicate["value"]
+    if op == "between":
+        return {"low": value[0], "high": value[1]}
+    if op == "==":
+        return {"low": value, "high": value}
+    if op in (">", ">="):
+        return {"low": value, "include_low": op == ">="}
+    return {"high": value, "include_high": op == "<="}
+
+
+def _evaluate_predicate(values: pd.Series, predicate: Dict[str, Any]) -> np.ndarray:
+    """
+    Evaluate one plan filter on a column, returning a boolean mask.
+    Text comparisons ignore case.
+    """
+    op = predicate["op"]
+    value = predicate["value"]
+    is_text = not (pd.api.types.is_numeric_dtype(values) or pd.api.types.is_datetime64_any_dtype(values)
+                   or pd.api.types.is_bool_dtype(values))
+
+    if is_text:
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Compare the categories once and map the result through the codes
+            categories = pd.Series(values.cat.categories.astype(str)).str.lower()
+            codes = values.cat.codes.to_numpy()
+            if op == "contains":
+                matches = categories.str.contains(value.lower(), regex=False).to_numpy()
+            else:
+                targets = [str(v).lower() for v in (value if isinstance(value, list) else [value])]
+                matches = categories.isin(targets).to_numpy()
+            mask = np.append(matches, False)[codes]
+            return ~mask & (codes >= 0) if op in ("!=", "not in") else mask
+        lowered = values.astype(str).str.lower()
+        if op == "contains":
+            return lowered.str.contains(value.lower(), regex=False).to_numpy()
+        targets = [str(v).lower() for v in (value if isinstance(value, list) else [value])]
+        mask = lowered.isin(targets).to_numpy() & values.notna().to_numpy()
+        return ~mask & values.notna().to_numpy() if op in ("!=", "not in") else mask
+
+    if op == "contains":
+        raise QueryPlanError("contains needs a text column")
+    if op == "in":
+        return values.isin(value).to_numpy()
+    if op == "not in":
+        return (~values.isin(value) & values.notna()).to_numpy()
+    if op == "between":
+        return values.between(value[0], value[1]).to_numpy()
+    compare = {"==": values.eq, "!=": values.ne, ">": values.gt, ">=": values.ge, "<": values.lt, "<=": values.le}[op]
+    return compare(value).fillna(False).to_numpy(dtype=bool)
+
+
 class DataAnalyzer:
-    def __init__(self, df: pd.DataFrame):
+    def __init__(self, df: pd.DataFrame, profile: Optional[Dict[str, Any]] = None, dataset_id: Optional[str] = None,
+                 backend: Optional[str] = None):
+        """
+        Args:
+            df: Dataset to analyze
+            profile: Dataset profile from services.profile_service.build_profile.
+                     Computed here when not supplied.
+            dataset_id: ID of the stored dataset. When given, derived data such as
+                        parsed date columns is shared with other requests.
+            backend: Query plan backend ("pandas", "duckdb"); takes precedence over
+                     the dataset's own setting, which takes precedence over the
+                     deployment default
+        """
         print("[DEBUG] Initializing DataAnalyzer")
         self.df = df
+        self.dataset_id = dataset_id
+        self.profile = profile if profile is not None else build_profile(df)
+        self.backend = get_backend(backend, dataset_id)
 
-        # Identify numeric, categorical, and date columns
-        self.numeric_columns = df.select_dtypes(include=["number"]).columns.tolist()
-        print(f"[DEBUG] Numeric columns: {self.numeric_columns}")
-        
-        self.categorical_columns = df.select_dtypes(include=["object", "category"]).columns.tolist()
-        print(f"[DEBUG] Categorical columns: {self.categorical_columns}")
-        
-        self.date_columns = df.select_dtypes(include=["datetime", "datetime64"]).columns.tolist()
-        print(f"[DEBUG] Initial date columns: {self.date_columns}")
+        # Numeric, categorical, and date columns come from the cached profile
+        self.numeric_columns = list(self.profile["numeric_columns"])
+        self.categorical_columns = list(self.profile["categorical_columns"])
+        self.date_columns = list(self.profile["date_columns"])
+        print(f"[DEBUG] Date columns: {self.date_columns}")
 
-        # Optionally, try parsing additional columns to datetime if not already
-        for col in df.columns:
-            if col not in self.date_columns:
-                try:
-                    print(f"[DEBUG] Attempting to parse {col} as datetime")
-                    parsed_col = pd.to_datetime(df[col])
-                    if parsed_col.notnull().sum() > 0:  # has valid datetime entries
-                        self.date_columns.append(col)
-                        print(f"[DEBUG] Successfully parsed {col} as datetime")
-                except Exception as e:
-                    print(f"[DEBUG] Failed to parse {col} as datetime: {str(e)}")
-                    continue
-        
-        print(f"[DEBUG] Final date columns: {self.date_columns}")
+    def get_datetime(self, col: str) -> pd.Series:
+        """
+        Get a column parsed as datetime. The parse runs once per dataset with
+        the format detected at profiling time.
+        """
+        fmt = self.profile.get("date_formats", {}).get(col)
+        return get_parsed_datetime(self.df, col, fmt, dataset_id=self.dataset_id)
+
+    def _derived(self, key, builder):
+        """
+        Build data derived from the dataset once, sharing it per dataset when possible.
+        """
+        if self.dataset_id is None:
+            return builder()
+        return get_derived(self.dataset_id, key, builder)
+
+    def _summary_aggregates(self) -> Dict[str, pd.DataFrame]:
+        """
+        Every breakdown used by the summaries, computed in one pass by the
+        grouping-sets engine. A set is only computed when its columns exist.
+        """
+        def build():
+            df = self.df
+            columns = set(df.columns)
+            sales = {'Revenue': ('Revenue', 'sum'), 'Profit': ('Profit', 'sum'), 'UnitsSold': ('UnitsSold', 'sum')}
+            sets = {}
+            dimensions = {}
+
+            if {'Year', 'Month', 'Revenue', 'Profit', 'UnitsSold'} <= columns:
+                sets['monthly'] = (['Year', 'Month'], sales)
+            for name, dimension in [('product', 'ProductCategory'), ('region', 'Region'), ('segment', 'CustomerSegment')]:
+                if {dimension, 'Revenue', 'Profit', 'UnitsSold', 'OrderID'} <= columns:
+                    sets[name] = ([dimension], {**sales, 'OrderID': ('OrderID', 'nunique')})
+            if {'PromotionApplied', 'Revenue', 'Profit', 'UnitsSold', 'ProfitMargin'} <= columns:
+                sets['promotion'] = (['PromotionApplied'], {**sales, 'ProfitMargin': ('ProfitMargin', 'mean')})
+            if {'Holiday', 'Revenue', 'UnitsSold', 'FootTraffic'} <= columns:
+                sets['holiday'] = (['Holiday'], {'Revenue': ('Revenue', 'sum'), 'UnitsSold': ('UnitsSold', 'sum'),
+                                                 'FootTraffic': ('FootTraffic', 'mean')})
+            if {'Temperature', 'UnitsSold', 'Revenue', 'FootTraffic'} <= columns:
+                dimensions['TempRange'] = pd.cut(df['Temperature'], bins=TEMPERATURE_BINS, labels=TEMPERATURE_LABELS)
+                sets['temperature'] = (['TempRange'], {'UnitsSold': ('UnitsSold', 'sum'), 'Revenue': ('Revenue', 'sum'),
+                                                       'FootTraffic': ('FootTraffic', 'mean')})
+            if 'ProfitMargin' in columns:
+                dimensions['MarginRange'] = pd.cut(df['ProfitMargin'], bins=MARGIN_BINS, labels=MARGIN_LABELS)
+                sets['margin'] = (['MarginRange'], {'count': ('ProfitMargin', 'size')})
+            if {'ProductCategory', 'Year', 'Month', 'Revenue', 'Profit'} <= columns:
+                sets['product_time'] = (['ProductCategory', 'Year', 'Month'],
+                                        {'Revenue': ('Revenue', 'sum'), 'Profit': ('Profit', 'sum')})
+
+            return GroupingSets(df, dimensions).compute(sets)
+
+        return self._derived(("summary_aggregates",), build)
+
+    def _calendar_aggregates(self, col: str) -> Dict[str, pd.DataFrame]:
+        """
+        Order counts per day and per day of week (Monday = 0) for a date column.
+        """
+        def build():
+            dates = self.get_datetime(col)
+            dimensions = {'Day': dates.dt.normalize(), 'DayOfWeek': dates.dt.dayofweek}
+            return GroupingSets(self.df, dimensions).compute({
+                'daily': (['Day'], {'count': (col, 'size')}),
+                'weekday': (['DayOfWeek'], {'count': (col, 'size')}),
+            })
+
+        return self._derived(("calendar_aggregates", col), build)
+
+    def _run_with_cached_code(self, kind: str, prompt: str, generate: Callable[[], Optional[str]],
+                              execute: Callable[[str], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        """
+        Get code (or a serialized query plan) for a prompt from the code cache or
+        the LLM and execute it.
+
+        Snippets are cached per (kind and normalized prompt, schema, model) once
+        they execute successfully, and dropped from the cache if they later fail.
+
+        Returns:
+            The result, or None if nothing was generated or `execute` gave up
+        """
+        key = code_cache_key(f"{kind}: {prompt}", schema_fingerprint(self.df), CODE_MODEL_NAME)
+        code = get_cached_code(key)
+        cached = code is not None
+        if cached:
+            print(f"[DEBUG] Using cached {kind} code")
+        else:
+            started = time.perf_counter()
+            code = generate()
+            llm_seconds = time.perf_counter() - started
+            if code is None:
+                return None
+
+        result = execute(code)
+
+        # A recovered filter ("filter_result") means the generated code itself failed
+        succeeded = result is not None and result.get("type") not in ("error", "filter_result")
+        if cached and not succeeded:
+            invalidate_code(key)
+        elif not cached and succeeded:
+            put_cached_code(key, code, llm_seconds)
+        return result
+
+    def _answer_with_generated_code(self, kind: str, prompt: str, llm_prompt: str, df_columns: List[str],
+                                    execute_code: Callable[[str], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Answer a filter, query or aggregation prompt with a validated query plan,
+        falling back to free-form generated code if no usable plan comes back.
+        """
+        result = self._run_with_cached_code(
+            f"plan {kind}", prompt,
+            lambda: self._generate_plan_text(prompt, df_columns, kind),
+            lambda text: self._execute_plan_text(kind, prompt, text)
+        )
+        if result is not None:
+            return result
+
+        print("[DEBUG] No usable query plan, falling back to generated code")
+        return self._run_with_cached_code(
+            kind, prompt,
+            lambda: generate_panda_code_from_prompt(llm_prompt, df_columns, self.get_column_metadata()),
+            execute_code
+        )
+
+    def _generate_plan_text(self, prompt: str, df_columns: List[str], kind: str) -> Optional[str]:
+        plan = generate_query_plan(prompt, df_columns, kind, self.get_column_metadata())
+        return json.dumps(plan) if plan is not None else None
+
+    def _execute_plan_text(self, kind: str, prompt: str, text: str) -> Optional[Dict[str, Any]]:
+        """
+        Validate and run a serialized query plan, shaping the result like the
+        free-form path does. Returns None if the plan is unusable.
+        """
+        try:
+            plan = validate_query_plan(json.loads(text), self.profile, kind)
+        except Exception as e:
+            print(f"[DEBUG] Query plan rejected: {str(e)}")
+            return None
+
+        data = self.answer_from_cube(plan)
+        cube_hit = data is not None
+        pyramid_hit = False
+        if not cube_hit:
+            data = self.answer_from_pyramid(plan)
+            pyramid_hit = data is not None
+        if data is None:
+            try:
+                data = self.backend.execute(self, plan)
+            except Exception as e:
+                if self.backend.name == "pandas":
+                    print(f"[DEBUG] Query plan failed: {str(e)}")
+                    return None
+                # The pandas reference backend runs every valid plan
+                print(f"[WARN] {self.backend.name} backend failed ({str(e)}), running the plan with pandas")
+                data = self.execute_plan(plan)
+
+        engine = "cube" if cube_hit else "time pyramid" if pyramid_hit else self.backend.name
+        print(f"[DEBUG] Query plan executed on {engine}: {plan} -> {len(data)} rows")
+        if kind == "filter":
+            if data.empty and not self.df.empty:
+                return {
+                    "type": "error",
+                    "data": {
+                        "message": "Filter operation produced an empty result. Please refine your filter criteria.",
+                        "plan": plan
+                    }
+                }
+            return {
+                "type": "filter",
+                "data": data,
+                "user_input": prompt,
+                "plan": plan
+            }
+        return {
+            'type': 'query',
+            'data': data,
+            'note': {prompt},
+            'plan': plan,
+            'cube_hit': cube_hit,
+            'pyramid_hit': pyramid_hit
+        }
+
+    def get_cube(self):
+        """
+        Cube of the dataset's retail dimensions and measures, built on first
+        use and shared per dataset. None for in-memory datasets, datasets
+        without cube columns, or when the cube is disabled.
+        """
+        if self.dataset_id is None:
+            return None
+
+        def build():
+            try:
+                return build_cube(self.df, self.profile)
+            except Exception as e:
+                print(f"[WARN] Could not build cube: {str(e)}")
+                return None
+
+        return self._derived(("cube",), build)
+
+    def answer_from_cube(self, plan: Dict[str, Any]) -> Optional[pd.DataFrame]:
+        """
+        Answer an aggregate plan from the dataset's cube.
+
+        Plans qualify when they only group and filter by cube dimensions and
+        only sum, count or average cube measures (or count rows).
+
+        Returns:
+            The plan's result, or None when the plan does not qualify
+        """
+        if not plan["aggregates"]:
+            return None
+        cube = self.get_cube()
+        if cube is None:
+            return None
+        dimensions = set(cube.dimensions)
+        if not (set(plan["group_by"]) <= dimensions
+                and all(f["column"] in dimensions for f in plan["filters"])
+                and all(a["func"] == "size" or (a["func"] in CUBE_AGGREGATIONS and a["column"] in cube.measures)
+                        for a in plan["aggregates"])):
+            cube_stats["misses"] += 1
+            return None
+
+        # Filters are evaluated once per distinct value and mapped onto the cells
+        keep = None
+        for predicate in plan["filters"]:
+            levels = cube.levels[predicate["column"]]
+            try:
+                null_matches = _evaluate_predicate(pd.Series([np.nan]).astype(levels.dtype), predicate)[0]
+            except (TypeError, ValueError):
+                null_matches = False  # the column cannot hold missing values
+            matches = np.append(_evaluate_predicate(levels, predicate), null_matches)[cube.codes[predicate["column"]]]
+            keep = matches if keep is None else keep & matches
+
+        grouped = cube.group(plan["group_by"], keep)
+        if not plan["group_by"]:
+            # A plan without groups always returns one row, even when no row matched
+            grouped = {
+                "codes": {},
+                "rows": np.array([grouped["rows"].sum()]),
+                "sums": {m: np.array([v.sum()]) for m, v in grouped["sums"].items()},
+                "counts": {m: np.array([v.sum()]) for m, v in grouped["counts"].items()},
+            }
+
+        result = pd.DataFrame({
+            dim: cube.levels[dim].take(grouped["codes"][dim]).reset_index(drop=True) for dim in plan["group_by"]
+        }, index=pd.RangeIndex(len(grouped["rows"])))
+        for agg in plan["aggregates"]:
+            col, func = agg["column"], agg["func"]
+            if func == "size":
+                values = grouped["rows"]
+            elif func == "count":
+                values = grouped["counts"][col]
+            elif func == "sum":
+                values = grouped["sums"][col]
+                if col in cube.integer_measures:
+                    values = values.round().astype(np.int64)
+            else:
+                counts = grouped["counts"][col]
+                values = np.divide(grouped["sums"][col], counts, out=np.full(len(counts), np.nan), where=counts > 0)
+            result[agg["as"]] = values
+
+        cube_stats["hits"] += 1
+        return self._sort_and_limit(result, plan)
+
+    def get_time_pyramid(self, col: str):
+        """
+        Time pyramid of the numeric columns along a date column, built on
+        first use and shared per dataset.
+
+        Raises:
+            ValueError: If the column does not hold dates
+        """
+        fmt = self.profile.get("date_formats", {}).get(col)
+        return self._derived(("time_pyramid", col),
+                             lambda: build_time_pyramid(self.df, col, self.get_datetime(col), self.numeric_columns, fmt))
+
+    def answer_from_pyramid(self, plan: Dict[str, Any]) -> Optional[pd.DataFrame]:
+        """
+        Answer a date-range total from the time pyramid of a stored dataset.
+
+        Plans qualify when they have no groups, only filter one date column by
+        whole days and only sum numeric columns (or count rows).
+
+        Returns:
+            The plan's result, or None when the plan does not qualify
+        """
+        if self.dataset_id is None or plan["group_by"] or not plan["filters"] or not plan["aggregates"]:
+            return None
+        columns = {f["column"] for f in plan["filters"]}
+        if len(columns) > 1 or not columns <= set(self.date_columns) \
+                or not all(f["op"] in DATE_RANGE_OPERATORS for f in plan["filters"]):
+            return None
+        pyramid = self.get_time_pyramid(columns.pop())
+        if not all(a["func"] == "size" or (a["func"] == "sum" and a["column"] in pyramid.daily)
+                                      for a in plan["aggregates"]):
+            return None
+
+        start, stop = None, None
+        for predicate in plan["filters"]:
+            days = pyramid.day_range(**_date_range(predicate))
+            if days is None:
+                return None
+            if days[0] is not None:
+                start = days[0] if start is None else max(start, days[0])
+            if days[1] is not None:
+                stop = days[1] if stop is None else min(stop, days[1])
+
+        result = pd.DataFrame({
+            agg["as"]: [pyramid.range_total(None if agg["func"] == "size" else agg["column"], start, stop)]
+            for agg in plan["aggregates"]
+        })
+        return self._sort_and_limit(result, plan)
+
+    def get_bitmap_index(self, col: str):
+        """
+        Bitmap index of a low-cardinality column, built on first use and shared
+        per dataset. None for in-memory datasets, date columns and columns with
+        too many distinct values.
+        """
+        if self.dataset_id is None or col in self.date_columns:
+            return None
+        cardinality = self.profile.get("cardinality", {}).get(col)
+        return self._derived(("bitmap_index", col), lambda: build_bitmap_index(self.df[col], cardinality))
+
+    def get_date_index(self, col: str):
+        """
+        Sorted date index of a date column, built on first use and shared per
+        dataset. None for in-memory datasets and columns that are not dates.
+        """
+        if self.dataset_id is None or col not in self.date_columns:
+            return None
+        return get_sorted_date_index(self.get_datetime(col), col, dataset_id=self.dataset_id)
+
+    def _plan_values(self, col: str) -> pd.Series:
+        # Date columns are compared, aggregated and sorted as datetimes
+        return self.get_datetime(col) if col in self.date_columns else self.df[col]
+
+    def execute_plan(self, plan: Dict[str, Any]) -> pd.DataFrame:
+        """
+        Run a validated query plan with vectorized operations.
+
+        - Equality and IN filters on low-cardinality columns of stored datasets
+          are answered together from bitmap indexes, and date ranges by binary
+          search in sorted date indexes.
+        - Other predicates are pushed down: each filter is evaluated on its column
+          alone, most selective first, and only on the rows earlier filters kept.
+        - Only the referenced columns of the surviving rows are materialized.
+        - A single sort key with a limit uses top-k selection instead of a full sort.
+
+        Args:
+            plan: Plan returned by validate_query_plan
+
+        Returns:
+            Resulting DataFrame
+        """
+        df = self.df
+        cardinality = self.profile.get("cardinality", {})
+
+        # Indexed predicates first, as one AND over their bitmaps
+        indexes, indexed, ranges, residual = [], [], [], []
+        for predicate in plan["filters"]:
+            index = self.get_bitmap_index(predicate["column"])
+            date_index = self.get_date_index(predicate["column"]) if predicate["op"] in DATE_RANGE_OPERATORS else None
+            if index is not None and index.supports(predicate["op"]):
+                indexes.append(index)
+                indexed.append(predicate)
+            elif date_index is not None:
+                ranges.append(date_index.range(**_date_range(predicate)))
+            else:
+                residual.append(predicate)
+        positions = match_all(indexes, indexed) if indexed else None
+        for rows in ranges:
+            rows = np.sort(rows)
+            positions = rows if positions is None else np.intersect1d(positions, rows, assume_unique=True)
+
+        # Predicate pushdown
+        for predicate in sorted(residual, key=lambda f: _estimated_selectivity(f, cardinality)):
+            if positions is not None and len(positions) == 0:
+                break
+            values = self._plan_values(predicate["column"])
+            if positions is not None:
+                values = values.iloc[positions]
+            keep = _evaluate_predicate(values, predicate)
+            positions = np.flatnonzero(keep) if positions is None else positions[keep]
+
+        aggregated = bool(plan["aggregates"])
+        if aggregated:
+            columns = list(dict.fromkeys(plan["group_by"] + [a["column"] for a in plan["aggregates"] if a["column"]]))
+        else:
+            columns = plan["select"] or df.columns.tolist()
+            columns = columns + [s["column"] for s in plan["sort"] if s["column"] not in columns]
+
+        # Projection: materialize only the referenced columns of the kept rows
+        frame = df[columns] if positions is None else df[columns].iloc[positions]
+
+        if aggregated:
+            for col in set(columns) & set(self.date_columns):
+                frame = frame.assign(**{col: self._plan_values(col).loc[frame.index]})
+            named = {
+                a["as"]: (a["column"] or (columns[0] if columns else None), a["func"])
+                for a in plan["aggregates"]
+            }
+            if plan["group_by"]:
+                result = frame.groupby(plan["group_by"], observed=True).agg(**named).reset_index()
+            else:
+                result = pd.DataFrame([{
+                    name: (len(frame) if func == "size" else frame[col].agg(func))
+                    for name, (col, func) in named.items()
+                }])
+        else:
+            result = frame
+        return self._sort_and_limit(result, plan, positions)
+
+    def _sort_and_limit(self, result: pd.DataFrame, plan: Dict[str, Any],
+                        positions: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """
+        Apply a plan's sort and limit to its grouped or filtered rows.
+
+        Args:
+            result: Groups, or the selected columns of the kept rows
+            plan: Plan returned by validate_query_plan
+            positions: Row positions of the kept rows, None for all rows
+        """
+        aggregated = bool(plan["aggregates"])
+
+        # Sort and limit, with top-k selection for a single numeric key
+        sort_keys = plan["sort"]
+        limit = plan["limit"]
+        if sort_keys:
+            key = sort_keys[0]
+            key_values = result[key["column"]]
+            if limit is not None and len(sort_keys) == 1 and pd.api.types.is_numeric_dtype(key_values) \
+                    and not pd.api.types.is_bool_dtype(key_values):
+                select = result.nlargest if key["descending"] else result.nsmallest
+                result = select(limit, key["column"])
+            else:
+                by = []
+                for s in sort_keys:
+                    col = s["column"]
+                    if not aggregated and col in self.date_columns:
+                        # Sort text dates chronologically through their parsed values
+                        parsed = self._plan_values(col)
+                        parsed = parsed if positions is None else parsed.iloc[positions]
+                        col = f"__sort_{col}"
+                        result = result.assign(**{col: parsed.to_numpy()})
+                    by.append(col)
+                result = result.sort_values(by, ascending=[not s["descending"] for s in sort_keys], kind="stable")
+        if limit is not None:
+            result = result.head(limit)
+
+        if aggregated:
+            # Groups are numbered in result order
+            result = result.reset_index(drop=True)
+        else:
+            result = result[plan["select"] or self.df.columns.tolist()]
+        return result
+
+    def _run_generated(self, code: str, outputs=('df',)):
+        """
+        Run LLM-generated code against the dataset in the sandbox pool.
+        Stored datasets are memory-mapped by the workers; other frames are sent along.
+
+        Known slow patterns are rewritten into vectorized form first, and code
+        expected to exceed the sandbox time limit is rejected (CodeCostError).
+        If the rewritten code fails, the original code is run instead.
+        """
+        prepared = prepare_code(code, self.profile)
+        try:
+            return self._run_in_sandbox(prepared["code"], outputs)
+        except SandboxError as e:
+            if not prepared["rewrites"]:
+                raise
+            print(f"[DEBUG] Rewritten code failed ({e}), running the original code")
+            return self._run_in_sandbox(code, outputs)
+
+    def _run_in_sandbox(self, code: str, outputs):
+        if self.dataset_id is not None:
+            return run_code(code, dataset_id=self.dataset_id, outputs=outputs)
+        return run_code(code, df=self.df, outputs=outputs)
 
-    
     def get_column_metadata(self) -> str:
         """
         Generate a textual summary of column names and types for LLM.
@@ -79,6 +859,7 @@ class DataAnalyzer:
         """
         print("[INFO] Generating user-friendly dataset summary")
         df = self.df
+        groups = self._summary_aggregates()
 
         summary = {
             "overview": {
@@ -98,120 +879,82 @@ class DataAnalyzer:
             summary["insights"]["key_metrics"] = df[self.numeric_columns].describe().round(2).to_dict()
 
         # 2. Time Trends
-        if all(col in df.columns for col in ['Revenue', 'Profit', 'Month', 'Year']):
-            monthly = df.groupby(['Year', 'Month']).agg({
-                'Revenue': 'sum',
-                'Profit': 'sum',
-                'UnitsSold': 'sum'
-            }).reset_index()
-            summary["visual_data"]["monthly_performance"] = [
-                {
-                    "month": f"{int(row['Year'])}-{int(row['Month']):02d}",
-                    "revenue": round(row['Revenue'], 2),
-                    "profit": round(row['Profit'], 2),
-                    "units_sold": int(row['UnitsSold'])
-                }
-                for _, row in monthly.iterrows()
-            ]
+        if 'monthly' in groups:
+            monthly = groups['monthly'].copy()
+            monthly['Period'] = _period_labels(monthly)
+            summary["visual_data"]["monthly_performance"] = _to_records(
+                monthly,
+                {"month": 'Period', "revenue": 'Revenue', "profit": 'Profit', "units_sold": 'UnitsSold'},
+                rounded=("revenue", "profit"),
+                integers=("units_sold",)
+            )
 
         # 3. Best and Worst Product Categories
-        if all(col in df.columns for col in ['ProductCategory', 'Revenue', 'Profit']):
-            product_stats = df.groupby('ProductCategory').agg({
-                'Revenue': 'sum',
-                'Profit': 'sum',
-                'UnitsSold': 'sum',
-                'OrderID': 'nunique'
-            }).reset_index()
+        if 'product' in groups:
+            product_stats = groups['product'].copy()
 
             product_stats['AverageOrderValue'] = product_stats['Revenue'] / product_stats['OrderID']
             product_stats['ProfitPerUnit'] = product_stats['Profit'] / product_stats['UnitsSold']
 
-            summary["visual_data"]["product_performance"] = [
-                {
-                    "category": row['ProductCategory'],
-                    "revenue": round(row['Revenue'], 2),
-                    "profit": round(row['Profit'], 2),
-                    "units_sold": int(row['UnitsSold']),
-                    "avg_order_value": round(row['AverageOrderValue'], 2),
-                    "profit_per_unit": round(row['ProfitPerUnit'], 2)
-                }
-                for _, row in product_stats.iterrows()
-            ]
+            summary["visual_data"]["product_performance"] = _to_records(
+                product_stats,
+                {"category": 'ProductCategory', "revenue": 'Revenue', "profit": 'Profit', "units_sold": 'UnitsSold',
+                 "avg_order_value": 'AverageOrderValue', "profit_per_unit": 'ProfitPerUnit'},
+                rounded=("revenue", "profit", "avg_order_value", "profit_per_unit"),
+                integers=("units_sold",)
+            )
 
         # 4. Regional Sales Breakdown
-        if 'Region' in df.columns:
-            region_stats = df.groupby('Region').agg({
-                'Revenue': 'sum',
-                'Profit': 'sum',
-                'UnitsSold': 'sum',
-                'OrderID': 'nunique'
-            }).reset_index()
-
-            summary["visual_data"]["regional_performance"] = [
-                {
-                    "region": row['Region'],
-                    "revenue": round(row['Revenue'], 2),
-                    "profit": round(row['Profit'], 2),
-                    "units_sold": int(row['UnitsSold']),
-                    "total_orders": int(row['OrderID'])
-                }
-                for _, row in region_stats.iterrows()
-            ]
+        if 'region' in groups:
+            region_stats = groups['region'].copy()
+
+            summary["visual_data"]["regional_performance"] = _to_records(
+                region_stats,
+                {"region": 'Region', "revenue": 'Revenue', "profit": 'Profit', "units_sold": 'UnitsSold',
+                 "total_orders": 'OrderID'},
+                rounded=("revenue", "profit"),
+                integers=("units_sold", "total_orders")
+            )
 
         # 5. Promotions Impact
-        if 'PromotionApplied' in df.columns:
-            promo_stats = df.groupby('PromotionApplied').agg({
-                'Revenue': 'sum',
-                'Profit': 'sum',
-                'UnitsSold': 'sum',
-                'ProfitMargin': 'mean'
-            }).reset_index()
-
-            summary["visual_data"]["promotion_impact"] = [
-                {
-                    "profit": round(row['Profit'], 2),
-                    "units_sold": int(row['UnitsSold']),
-                    "average_profit_margin_percent": round(row['ProfitMargin'] * 100, 2)
-                }
-                for _, row in promo_stats.iterrows()
-            ]
+        if 'promotion' in groups:
+            promo_stats = groups['promotion'].copy()
+
+            promo_stats['ProfitMarginPercent'] = promo_stats['ProfitMargin'] * 100
+            summary["visual_data"]["promotion_impact"] = _to_records(
+                promo_stats,
+                {"profit": 'Profit', "units_sold": 'UnitsSold', "average_profit_margin_percent": 'ProfitMarginPercent'},
+                rounded=("profit", "average_profit_margin_percent"),
+                integers=("units_sold",)
+            )
 
         # 6. Customer Segments
-        if 'CustomerSegment' in df.columns:
-            segment_stats = df.groupby('CustomerSegment').agg({
-                'Revenue': 'sum',
-                'Profit': 'sum',
-                'UnitsSold': 'sum',
-                'OrderID': 'nunique'
-            }).reset_index()
+        if 'segment' in groups:
+            segment_stats = groups['segment'].copy()
             segment_stats['AvgRevenuePerOrder'] = segment_stats['Revenue'] / segment_stats['OrderID']
 
-            summary["visual_data"]["customer_segments"] = [
-                {
-                    "segment": row['CustomerSegment'],
-                    "revenue": round(row['Revenue'], 2),
-                    "profit": round(row['Profit'], 2),
-                    "units_sold": int(row['UnitsSold']),
-                    "avg_revenue_per_order": round(row['AvgRevenuePerOrder'], 2)
-                }
-                for _, row in segment_stats.iterrows()
-            ]
+            summary["visual_data"]["customer_segments"] = _to_records(
+                segment_stats,
+                {"segment": 'CustomerSegment', "revenue": 'Revenue', "profit": 'Profit', "units_sold": 'UnitsSold',
+                 "avg_revenue_per_order": 'AvgRevenuePerOrder'},
+                rounded=("revenue", "profit", "avg_revenue_per_order"),
+                integers=("units_sold",)
+            )
 
         # 7. Calendar Trends
         if 'OrderDate' in self.date_columns:
             try:
-                df['OrderDateParsed'] = pd.to_datetime(df['OrderDate'])
-                daily_orders = df.groupby(df['OrderDateParsed'].dt.date).size().reset_index()
+                daily_orders = self._calendar_aggregates('OrderDate')['daily'].copy()
                 daily_orders.columns = ['date', 'orders']
 
-                summary["visual_data"]["daily_orders"] = [
-                    {"date": str(date), "orders": int(count)}
-                    for date, count in zip(daily_orders['date'], daily_orders['orders'])
-                ]
+                daily_orders['date'] = daily_orders['date'].dt.strftime('%Y-%m-%d')
+                summary["visual_data"]["daily_orders"] = _to_records(
+                    daily_orders, {"date": 'date', "orders": 'orders'}, integers=("orders",)
+                )
             except Exception as e:
                 print(f"[WARNING] Couldn't parse OrderDate: {e}")
 
-        print("[INFO] Summary ready: ", summary)
+        print(f"[INFO] Summary ready with sections: {list(summary['visual_data'])}")
         return {
             "type": "summary",
             "data": summary
@@ -224,6 +967,7 @@ class DataAnalyzer:
         """
         print("[DEBUG] Generating enhanced dataset summary")
         df = self.df
+        groups = self._summary_aggregates()
         
         # Base summary structure
         summary = {
@@ -245,115 +989,77 @@ class DataAnalyzer:
             summary["numeric_stats"] = df[self.numeric_columns].describe().to_dict()
             
             # Revenue and profit trends by time period (for time series charts)
-            if all(col in df.columns for col in ['Revenue', 'Profit', 'Month', 'Year']):
-                monthly_performance = df.groupby(['Year', 'Month']).agg({
-                    'Revenue': 'sum',
-                    'Profit': 'sum',
-                    'UnitsSold': 'sum'
-                }).reset_index()
+            if 'monthly' in groups:
+                monthly_performance = groups['monthly'].copy()
                 
                 # Format for time series chart
-                summary["charts_data"]["monthly_performance"] = [
-                    {
-                        "date": f"{int(row['Year'])}-{int(row['Month']):02d}",
-                        "revenue": round(row['Revenue'], 2),
-                        "profit": round(row['Profit'], 2),
-                        "unitsSold": int(row['UnitsSold'])
-                    }
-                    for _, row in monthly_performance.iterrows()
-                ]
+                monthly_performance['Period'] = _period_labels(monthly_performance)
+                summary["charts_data"]["monthly_performance"] = _to_records(
+                    monthly_performance,
+                    {"date": 'Period', "revenue": 'Revenue', "profit": 'Profit', "unitsSold": 'UnitsSold'},
+                    rounded=("revenue", "profit"),
+                    integers=("unitsSold",)
+                )
                 
             # Product performance metrics (for bar/pie charts)
-            if all(col in df.columns for col in ['ProductCategory', 'Revenue', 'Profit']):
-                product_performance = df.groupby('ProductCategory').agg({
-                    'Revenue': 'sum',
-                    'Profit': 'sum',
-                    'UnitsSold': 'sum',
-                    'OrderID': 'nunique'
-                }).reset_index()
+            if 'product' in groups:
+                product_performance = groups['product'].copy()
                 
                 # Calculate additional metrics
                 product_performance['AverageOrderValue'] = product_performance['Revenue'] / product_performance['OrderID']
                 product_performance['ProfitPerUnit'] = product_performance['Profit'] / product_performance['UnitsSold']
                 
                 # Format for category comparison charts
-                summary["charts_data"]["product_category_performance"] = [
-                    {
-                        "category": row['ProductCategory'],
-                        "revenue": round(row['Revenue'], 2),
-                        "profit": round(row['Profit'], 2),
-                        "unitsSold": int(row['UnitsSold']),
-                        "orders": int(row['OrderID']),
-                        "avgOrderValue": round(row['AverageOrderValue'], 2),
-                        "profitPerUnit": round(row['ProfitPerUnit'], 2)
-                    }
-                    for _, row in product_performance.iterrows()
-                ]
+                summary["charts_data"]["product_category_performance"] = _to_records(
+                    product_performance,
+                    {"category": 'ProductCategory', "revenue": 'Revenue', "profit": 'Profit', "unitsSold": 'UnitsSold',
+                     "orders": 'OrderID', "avgOrderValue": 'AverageOrderValue', "profitPerUnit": 'ProfitPerUnit'},
+                    rounded=("revenue", "profit", "avgOrderValue", "profitPerUnit"),
+                    integers=("unitsSold", "orders")
+                )
                 
             # Regional performance (for map or comparison charts)
-            if 'Region' in df.columns:
-                regional_performance = df.groupby('Region').agg({
-                    'Revenue': 'sum',
-                    'Profit': 'sum',
-                    'UnitsSold': 'sum',
-                    'OrderID': 'nunique'
-                }).reset_index()
+            if 'region' in groups:
+                regional_performance = groups['region'].copy()
                 
                 # Format for regional charts
-                summary["charts_data"]["regional_performance"] = [
-                    {
-                        "region": row['Region'],
-                        "revenue": round(row['Revenue'], 2),
-                        "profit": round(row['Profit'], 2),
-                        "unitsSold": int(row['UnitsSold']),
-                        "orders": int(row['OrderID'])
-                    }
-                    for _, row in regional_performance.iterrows()
-                ]
+                summary["charts_data"]["regional_performance"] = _to_records(
+                    regional_performance,
+                    {"region": 'Region', "revenue": 'Revenue', "profit": 'Profit', "unitsSold": 'UnitsSold',
+                     "orders": 'OrderID'},
+                    rounded=("revenue", "profit"),
+                    integers=("unitsSold", "orders")
+                )
                 
             # Promotion effectiveness (for comparison charts)
-            if 'PromotionApplied' in df.columns:
-                promotion_effect = df.groupby('PromotionApplied').agg({
-                    'Revenue': 'sum',
-                    'Profit': 'sum',
-                    'UnitsSold': 'sum',
-                    'ProfitMargin': 'mean'
-                }).reset_index()
+            if 'promotion' in groups:
+                promotion_effect = groups['promotion'].copy()
                 
                 # Format for promotion comparison
-                summary["charts_data"]["promotion_effectiveness"] = [
-                    {
-                        "promotionApplied": bool(row['PromotionApplied']),
-                        "revenue": round(row['Revenue'], 2),
-                        "profit": round(row['Profit'], 2),
-                        "unitsSold": int(row['UnitsSold']),
-                        "avgProfitMargin": round(row['ProfitMargin'] * 100, 2)
-                    }
-                    for _, row in promotion_effect.iterrows()
-                ]
+                promotion_effect['ProfitMarginPercent'] = promotion_effect['ProfitMargin'] * 100
+                summary["charts_data"]["promotion_effectiveness"] = _to_records(
+                    promotion_effect,
+                    {"promotionApplied": 'PromotionApplied', "revenue": 'Revenue', "profit": 'Profit',
+                     "unitsSold": 'UnitsSold', "avgProfitMargin": 'ProfitMarginPercent'},
+                    rounded=("revenue", "profit", "avgProfitMargin"),
+                    integers=("unitsSold",),
+                    booleans=("promotionApplied",)
+                )
                 
             # Customer segment analysis
-            if 'CustomerSegment' in df.columns:
-                segment_analysis = df.groupby('CustomerSegment').agg({
-                    'Revenue': 'sum',
-                    'Profit': 'sum',
-                    'UnitsSold': 'sum',
-                    'OrderID': 'nunique'
-                }).reset_index()
+            if 'segment' in groups:
+                segment_analysis = groups['segment'].copy()
                 
                 segment_analysis['AvgRevenuePerOrder'] = segment_analysis['Revenue'] / segment_analysis['OrderID']
                 
                 # Format for segment comparison
-                summary["charts_data"]["customer_segments"] = [
-                    {
-                        "segment": row['CustomerSegment'],
-                        "revenue": round(row['Revenue'], 2),
-                        "profit": round(row['Profit'], 2),
-                        "unitsSold": int(row['UnitsSold']),
-                        "avgRevenuePerOrder": round(row['AvgRevenuePerOrder'], 2)
-                    }
-                    for _, row in segment_analysis.iterrows()
-                ]
+                summary["charts_data"]["customer_segments"] = _to_records(
+                    segment_analysis,
+                    {"segment": 'CustomerSegment', "revenue": 'Revenue', "profit": 'Profit', "unitsSold": 'UnitsSold',
+                     "avgRevenuePerOrder": 'AvgRevenuePerOrder'},
+                    rounded=("revenue", "profit", "avgRevenuePerOrder"),
+                    integers=("unitsSold",)
+                )
         
         # Categorical statistics with enhanced insights
         if self.categorical_columns:
@@ -371,22 +1077,16 @@ class DataAnalyzer:
             }
             
             # Seasonal trends (if applicable)
-            if 'Holiday' in df.columns:
-                holiday_impact = df.groupby('Holiday').agg({
-                    'Revenue': 'sum',
-                    'UnitsSold': 'sum',
-                    'FootTraffic': 'mean' if 'FootTraffic' in df.columns else 'count'
-                }).reset_index()
+            if 'holiday' in groups:
+                holiday_impact = groups['holiday'].copy()
                 
-                summary["charts_data"]["holiday_impact"] = [
-                    {
-                        "holiday": bool(row['Holiday']),
-                        "revenue": round(row['Revenue'], 2),
-                        "unitsSold": int(row['UnitsSold']),
-                        "avgFootTraffic": round(row['FootTraffic'], 2)
-                    }
-                    for _, row in holiday_impact.iterrows()
-                ]
+                summary["charts_data"]["holiday_impact"] = _to_records(
+                    holiday_impact,
+                    {"holiday": 'Holiday', "revenue": 'Revenue', "unitsSold": 'UnitsSold', "avgFootTraffic": 'FootTraffic'},
+                    rounded=("revenue", "avgFootTraffic"),
+                    integers=("unitsSold",),
+                    booleans=("holiday",)
+                )
         
         # Date statistics with enhanced time series data
         if self.date_columns:
@@ -394,7 +1094,7 @@ class DataAnalyzer:
             date_stats = {}
             for col in self.date_columns:
                 try:
-                    date_series = pd.to_datetime(df[col])
+                    date_series = self.get_datetime(col)
                     date_stats[col] = {
                         "min_date": date_series.min().isoformat(),
                         "max_date": date_series.max().isoformat(),
@@ -404,37 +1104,30 @@ class DataAnalyzer:
                     # Create time series distribution
                     if col == 'OrderDate':
                         # Daily order counts for timeline chart
-                        daily_orders = df.groupby(date_series.dt.date).size().reset_index()
+                        calendar = self._calendar_aggregates(col)
+                        daily_orders = calendar['daily'].copy()
                         daily_orders.columns = ['date', 'count']
                         
                         # Format for timeline chart
-                        summary["charts_data"]["daily_order_volume"] = [
-                            {
-                                "date": date.isoformat(),
-                                "orders": int(count)
-                            }
-                            for date, count in zip(daily_orders['date'], daily_orders['count'])
-                        ]
+                        daily_orders['date'] = daily_orders['date'].dt.strftime('%Y-%m-%d')
+                        summary["charts_data"]["daily_order_volume"] = _to_records(
+                            daily_orders, {"date": 'date', "orders": 'count'}, integers=("orders",)
+                        )
                         
                         # Weekday distribution
-                        weekday_distribution = df.groupby(date_series.dt.day_name()).size().reset_index()
-                        weekday_distribution.columns = ['weekday', 'count']
+                        weekday_distribution = calendar['weekday'].copy()
+                        weekday_distribution.columns = ['weekday_order', 'count']
                         
-                        # Ensure proper weekday ordering
+                        # Grouped by day of week (Monday = 0), so already in weekday order
                         weekday_order = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-                        weekday_distribution['weekday_order'] = weekday_distribution['weekday'].map(
-                            {day: i for i, day in enumerate(weekday_order)}
+                        weekday_distribution['weekday'] = weekday_distribution['weekday_order'].astype(int).map(
+                            dict(enumerate(weekday_order))
                         )
-                        weekday_distribution = weekday_distribution.sort_values('weekday_order')
                         
                         # Format for weekday distribution chart
-                        summary["charts_data"]["weekday_distribution"] = [
-                            {
-                                "weekday": weekday,
-                                "orders": int(count)
-                            }
-                            for weekday, count in zip(weekday_distribution['weekday'], weekday_distribution['count'])
-                        ]
+                        summary["charts_data"]["weekday_distribution"] = _to_records(
+                            weekday_distribution, {"weekday": 'weekday', "orders": 'count'}, integers=("orders",)
+                        )
                     
                     print(f"[DEBUG] Date stats for {col}: range = {date_stats[col]['range_days']} days")
                 except Exception as e:
@@ -445,68 +1138,40 @@ class DataAnalyzer:
         
         # Additional insights
         # Temperature impact on sales (if temperature data exists)
-        if 'Temperature' in df.columns:
-            # Group by temperature ranges
-            df['TempRange'] = pd.cut(df['Temperature'], 
-                                    bins=[0, 10, 20, 30, 40, 100], 
-                                    labels=['0-10', '10-20', '20-30', '30-40', '40+'])
-            
-            temp_impact = df.groupby('TempRange').agg({
-                'UnitsSold': 'sum',
-                'Revenue': 'sum',
-                'FootTraffic': 'mean' if 'FootTraffic' in df.columns else 'count'
-            }).reset_index()
-            
-            summary["charts_data"]["temperature_impact"] = [
-                {
-                    "tempRange": str(row['TempRange']),
-                    "unitsSold": int(row['UnitsSold']),
-                    "revenue": round(row['Revenue'], 2),
-                    "footTraffic": round(row['FootTraffic'], 2)
-                }
-                for _, row in temp_impact.iterrows() if not pd.isna(row['TempRange'])
-            ]
+        if 'temperature' in groups:
+            # Grouped by temperature ranges; empty ranges are still reported
+            temp_impact = groups['temperature'].set_index('TempRange').reindex(TEMPERATURE_LABELS).reset_index()
+            temp_impact[['UnitsSold', 'Revenue']] = temp_impact[['UnitsSold', 'Revenue']].fillna(0)
+            temp_impact = temp_impact.assign(TempRange=temp_impact['TempRange'].astype(str))
+            summary["charts_data"]["temperature_impact"] = _to_records(
+                temp_impact,
+                {"tempRange": 'TempRange', "unitsSold": 'UnitsSold', "revenue": 'Revenue', "footTraffic": 'FootTraffic'},
+                rounded=("revenue", "footTraffic"),
+                integers=("unitsSold",)
+            )
         
         # Profit margin distribution (for histogram)
-        if 'ProfitMargin' in df.columns:
-            # Create bins for profit margin distribution
-            margin_bins = [-0.5, 0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
-            margin_labels = ['Loss', '0-10%', '10-20%', '20-30%', '30-40%', '40-50%', 
-                            '50-60%', '60-70%', '70-80%', '80-90%', '90-100%']
-            
-            df['MarginRange'] = pd.cut(df['ProfitMargin'], 
-                                    bins=margin_bins,
-                                    labels=margin_labels)
-            
-            margin_dist = df.groupby('MarginRange').size().reset_index()
+        if 'margin' in groups:
+            # Profit margin distribution over fixed bins; empty bins are still reported
+            margin_dist = groups['margin'].set_index('MarginRange').reindex(MARGIN_LABELS, fill_value=0).reset_index()
             margin_dist.columns = ['range', 'count']
             
-            summary["charts_data"]["profit_margin_distribution"] = [
-                {
-                    "range": str(range_name),
-                    "count": int(count)
-                }
-                for range_name, count in zip(margin_dist['range'], margin_dist['count'])
-                if not pd.isna(range_name)
-            ]
+            margin_dist = margin_dist.assign(range=margin_dist['range'].astype(str))
+            summary["charts_data"]["profit_margin_distribution"] = _to_records(
+                margin_dist, {"range": 'range', "count": 'count'}, integers=("count",)
+            )
         
         # Product performance over time
-        if all(col in df.columns for col in ['ProductCategory', 'Month', 'Year', 'Revenue']):
-            product_time = df.groupby(['ProductCategory', 'Year', 'Month']).agg({
-                'Revenue': 'sum',
-                'Profit': 'sum'
-            }).reset_index()
+        if 'product_time' in groups:
+            product_time = groups['product_time'].copy()
             
             # Format for stacked/grouped bar or line chart
-            summary["charts_data"]["product_category_time_series"] = [
-                {
-                    "date": f"{int(row['Year'])}-{int(row['Month']):02d}",
-                    "category": row['ProductCategory'],
-                    "revenue": round(row['Revenue'], 2),
-                    "profit": round(row['Profit'], 2)
-                }
-                for _, row in product_time.iterrows()
-            ]
+            product_time['Period'] = _period_labels(product_time)
+            summary["charts_data"]["product_category_time_series"] = _to_records(
+                product_time,
+                {"date": 'Period', "category": 'ProductCategory', "revenue": 'Revenue', "profit": 'Profit'},
+                rounded=("revenue", "profit")
+            )
         
         print("[DEBUG] Enhanced summary generation complete")
         return {
@@ -536,7 +1201,13 @@ class DataAnalyzer:
 
         """
         
-        code = generate_panda_code_from_prompt(augmented_prompt, df_columns)
+        return self._answer_with_generated_code("filter", prompt, augmented_prompt, df_columns,
+                                                lambda code: self._execute_filter(prompt, df_columns, code))
+
+    def _execute_filter(self, prompt: str, df_columns: List[str], code: str):
+        """
+        Validate, fix and run generated filter code.
+        """
         print("Generated code from LLM:", code)
         
         # Preprocessing step to validate and fix common errors in the generated code
@@ -574,14 +1245,10 @@ class DataAnalyzer:
                 print(f"[DEBUG] Fallback to safe template: {code}")
         
         try:
-            # Execute the code with safety measures
-            local_vars = {'df': self.df.copy()}
-            
-            # Add a timeout mechanism to prevent infinite loops (if supported in your environment)
-            exec(code, {}, local_vars)
+            # Execute the code in the sandbox pool, which enforces time and memory limits
+            result_df = self._run_generated(code, outputs=('df',))
             
             # Check if the result is a valid DataFrame
-            result_df = local_vars.get('df')
             if not isinstance(result_df, pd.DataFrame):
                 print(f"[DEBUG] Result is not a DataFrame, type: {type(result_df)}")
                 return {
@@ -658,12 +1325,14 @@ class DataAnalyzer:
         Execute a custom query using LLM to generate pandas code, returning
         either a scalar or a DataFrame.
         """
-        code = generate_panda_code_from_prompt(prompt, df_columns)
+        return self._answer_with_generated_code("query", prompt, prompt, df_columns,
+                                                lambda code: self._execute_query_code(prompt, code))
+
+    def _execute_query_code(self, prompt: str, code: str):
         print("Generated code from LLM:", code)
 
         try:
             print(f"[DEBUG] Aggregating data with prompt: {prompt}")
-            local_vars = {'df': self.df.copy()}
 
             # Only wrap if the model didn't already assign to `result`
             if not re.search(r'^\s*result\s*=', code):
@@ -672,14 +1341,8 @@ class DataAnalyzer:
                 exec_code = code
 
             print(f"[DEBUG] Executing code:\n{exec_code}")
-            exec(exec_code, {}, local_vars)
-
-            # Grab the result
-            result = local_vars.get('result')
-
-            # If still None, fall back to df
-            if result is None:
-                result = local_vars['df']
+            # Grab the result, falling back to df if it is still None
+            result = self._run_generated(exec_code, outputs=('result', 'df'))
 
             print(f"[DEBUG] Aggregation result: {result!r}")
             return {
@@ -696,55 +1359,105 @@ class DataAnalyzer:
                 "message": f"Error aggregating data: {str(e)}"
             }
 
-    def analyze_trend(self, prompt: str, **parameters) -> Dict[str, Any]:
+    def resolve_trend_parameters(self, prompt: str) -> Dict[str, Optional[str]]:
         """
-        Analyze trends in time series data.
+        Work out the time column, value column and time period a trend prompt asks for.
+
+        Returns:
+            Dictionary with time_col, value_col and time_period; the columns are
+            None when they cannot be identified
         """
-        try:
-            print(f"[DEBUG] Analyzing trend with prompt: {prompt}")
-            
-            # Step 1: Identify the time column and value column
-            time_col = None
-            value_col = None
-            
-            # First, try to find a date column
-            if self.date_columns:
-                time_col = self.date_columns[0]  # Use the first date column by default
-                print(f"[DEBUG] Using date column for time: {time_col}")
-            
-            # Look for time-related keywords in the prompt
-            time_keywords = ["time", "date", "month", "year", "day", "week", "period"]
+        # Identify the time column and value column
+        time_col = None
+        value_col = None
+
+        # First, try to find a date column
+        if self.date_columns:
+            time_col = self.date_columns[0]  # Use the first date column by default
+            print(f"[DEBUG] Using date column for time: {time_col}")
+
+        # Look for time-related keywords in the prompt
+        time_keywords = ["time", "date", "month", "year", "day", "week", "period"]
+        for col in self.df.columns:
+            if any(keyword in col.lower() for keyword in time_keywords):
+                time_col = col
+                print(f"[DEBUG] Found time column from keywords: {time_col}")
+                break
+
+        # If still no time column, look for columns with "date" or "time" in the name
+        if not time_col:
             for col in self.df.columns:
-                if any(keyword in col.lower() for keyword in time_keywords):
+                if "date" in col.lower() or "time" in col.lower():
                     time_col = col
-                    print(f"[DEBUG] Found time column from keywords: {time_col}")
+                    print(f"[DEBUG] Found time column from name: {time_col}")
                     break
-            
-            # If still no time column, look for columns with "date" or "time" in the name
-            if not time_col:
-                for col in self.df.columns:
-                    if "date" in col.lower() or "time" in col.lower():
-                        time_col = col
-                        print(f"[DEBUG] Found time column from name: {time_col}")
-                        break
-            
-            # Look for value column in the prompt
-            value_keywords = ["revenue", "sales", "profit", "amount", "value", "price", "cost", "units"]
-            for keyword in value_keywords:
-                if keyword in prompt.lower():
-                    # Find a column that matches this keyword
-                    for col in self.numeric_columns:
-                        if keyword in col.lower():
-                            value_col = col
-                            print(f"[DEBUG] Found value column from prompt keyword: {value_col}")
-                            break
-                    if value_col:
+
+        # Look for value column in the prompt
+        value_keywords = ["revenue", "sales", "profit", "amount", "value", "price", "cost", "units"]
+        for keyword in value_keywords:
+            if keyword in prompt.lower():
+                # Find a column that matches this keyword
+                for col in self.numeric_columns:
+                    if keyword in col.lower():
+                        value_col = col
+                        print(f"[DEBUG] Found value column from prompt keyword: {value_col}")
                         break
+                if value_col:
+                    break
+
+        # If no value column found, use the first numeric column
+        if not value_col and self.numeric_columns:
+            value_col = self.numeric_columns[0]
+            print(f"[DEBUG] Using default value column: {value_col}")
+
+        # Determine the appropriate time grouping (day, week, month, quarter, year)
+        # Look for time period keywords in the prompt
+        time_period = "month"  # Default to monthly
+        if "daily" in prompt.lower() or "day" in prompt.lower():
+            time_period = "day"
+        elif "weekly" in prompt.lower() or "week" in prompt.lower():
+            time_period = "week"
+        elif "quarter" in prompt.lower():
+            time_period = "quarter"
+        elif "yearly" in prompt.lower() or "year" in prompt.lower() or "annual" in prompt.lower():
+            time_period = "year"
+
+        return {"time_col": time_col, "value_col": value_col, "time_period": time_period}
+
+    def result_parameters(self, intent: str, prompt: str) -> Dict[str, Any]:
+        """
+        Normalized parameters that fully determine the result of a deterministic
+        intent, used as part of its result cache key.
+        """
+        if intent == "trend":
+            return self.resolve_trend_parameters(prompt)
+        return {}
+
+    def _period_sums(self, pyramid, value_col: str, time_period: str) -> pd.DataFrame:
+        """
+        Sum a value column per day, week, month, quarter or year of a date column.
+
+        The sums are read from the date column's time pyramid, so the cost
+        depends on the number of periods, not rows. Weeks (ending Sunday),
+        months and quarters include the empty periods in between, like pd.Grouper.
+        """
+        labels, sums = pyramid.period_sums(value_col, time_period)
+        if time_period != "year":
+            labels = labels.astype("datetime64[ns]")
+        return pd.DataFrame({pyramid.column: labels, value_col: sums})
+
+    def analyze_trend(self, prompt: str, **parameters) -> Dict[str, Any]:
+        """
+        Analyze trends in time series data.
+        """
+        try:
+            print(f"[DEBUG] Analyzing trend with prompt: {prompt}")
             
-            # If no value column found, use the first numeric column
-            if not value_col and self.numeric_columns:
-                value_col = self.numeric_columns[0]
-                print(f"[DEBUG] Using default value column: {value_col}")
+            # Step 1: Identify the time column, value column and time period
+            trend_parameters = self.resolve_trend_parameters(prompt)
+            time_col = trend_parameters["time_col"]
+            value_col = trend_parameters["value_col"]
+            time_period = trend_parameters["time_period"]
             
             if not time_col or not value_col:
                 print("[ERROR] Could not identify time or value column")
@@ -756,42 +1469,21 @@ class DataAnalyzer:
             # Step 2: Prepare the data
             print(f"[DEBUG] Preparing trend data with time_col={time_col} and value_col={value_col}")
             
-            # Convert time column to datetime if it's not already
-            if time_col not in self.date_columns:
-                try:
-                    self.df[time_col] = pd.to_datetime(self.df[time_col])
-                    print(f"[DEBUG] Converted {time_col} to datetime")
-                except Exception as e:
-                    print(f"[ERROR] Failed to convert {time_col} to datetime: {str(e)}")
-                    return {
-                        "type": "error",
-                        "message": f"Failed to convert {time_col} to datetime: {str(e)}"
-                    }
-            
-            # Determine the appropriate time grouping (day, week, month, year)
-            # Look for time period keywords in the prompt
-            time_period = "month"  # Default to monthly
-            if "daily" in prompt.lower() or "day" in prompt.lower():
-                time_period = "day"
-            elif "weekly" in prompt.lower() or "week" in prompt.lower():
-                time_period = "week"
-            elif "yearly" in prompt.lower() or "year" in prompt.lower() or "annual" in prompt.lower():
-                time_period = "year"
-            
+            # Parse the time column and total it per day, once per dataset
+            try:
+                pyramid = self.get_time_pyramid(time_col)
+                print(f"[DEBUG] Parsed {time_col} as datetime")
+            except Exception as e:
+                print(f"[ERROR] Failed to convert {time_col} to datetime: {str(e)}")
+                return {
+                    "type": "error",
+                    "message": f"Failed to convert {time_col} to datetime: {str(e)}"
+                }
+
             print(f"[DEBUG] Using time period: {time_period}")
             
-            # Group by the time period and calculate the sum of the value column
-            if time_period == "day":
-                grouped = self.df.groupby(self.df[time_col].dt.date)
-            elif time_period == "week":
-                grouped = self.df.groupby(pd.Grouper(key=time_col, freq='W'))
-            elif time_period == "year":
-                grouped = self.df.groupby(self.df[time_col].dt.year)
-            else:  # Default to month
-                grouped = self.df.groupby(pd.Grouper(key=time_col, freq='M'))
-            
-            # Calculate aggregates
-            agg_data = grouped.agg({value_col: 'sum'}).reset_index()
+            # Sum the value column per time period
+            agg_data = self._period_sums(pyramid, value_col, time_period)
             print(f"[DEBUG] Aggregated data shape: {agg_data.shape}")
             
             # Format the time column  Aggregated data shape: {agg_data.shape}")
@@ -801,6 +1493,8 @@ class DataAnalyzer:
                 agg_data['period'] = agg_data[time_col].dt.strftime('%Y-%m-%d')
             elif time_period == "week":
                 agg_data['period'] = agg_data[time_col].dt.strftime('%Y-%m-%d')
+            elif time_period == "quarter":
+                agg_data['period'] = agg_data[time_col].dt.to_period('Q').astype(str)
             elif time_period == "year":
                 agg_data['period'] = agg_data[time_col].astype(str)
             else:  # month
@@ -852,12 +1546,14 @@ class DataAnalyzer:
         """
         Aggregate data based on one or more dimensions.
         """
-        code = generate_panda_code_from_prompt(prompt, df_columns)
+        return self._answer_with_generated_code("aggregation", prompt, prompt, df_columns,
+                                                lambda code: self._execute_aggregate_code(prompt, code))
+
+    def _execute_aggregate_code(self, prompt: str, code: str):
         print("Generated code from LLM:", code)
 
         try:
             print(f"[DEBUG] Aggregating data with prompt: {prompt}")
-            local_vars = {'df': self.df.copy()}
 
                 # Only wrap if the model didn't already assign to `result`
             if not re.search(r'^\s*result\s*=', code):
@@ -866,14 +1562,8 @@ class DataAnalyzer:
                 exec_code = code
 
             print(f"[DEBUG] Executing code:\n{exec_code}")
-            exec(exec_code, {}, local_vars)
-
-                # Grab the result
-            result = local_vars.get('result')
-
-                # If still None, fall back to df
-            if result is None:
-                 result = local_vars['df']
+                # Grab the result, falling back to df if it is still None
+            result = self._run_generated(exec_code, outputs=('result', 'df'))
 
             print(f"[DEBUG] Aggregation result: {result!r}")
             return {
@@ -895,19 +1585,167 @@ class DataAnalyzer:
         Forecast future values based on historical data.
         """
         print(f"[DEBUG] Forecasting with prompt: {prompt}")
-        forecast_period  = extract_forecast_period(prompt)
-        
-        print(f"[DEBUG] Forecasting with prompt: {forecast_period}")
+        count, unit = extract_forecast_period(prompt)
 
-        combined_data = process_forecast(df=self.df, forecast_periods=forecast_period)
+        parameters = self.resolve_forecast_parameters(prompt, unit)
+        value_cols, group_by = parameters["value_cols"], parameters["group_by"]
+        forecast_period = convert_horizon(count, unit, parameters["granularity"])
+        print(f"[DEBUG] Forecasting {forecast_period} {parameters['granularity']} periods")
+        model, model_hit = self.get_forecast_model(value_cols, parameters["granularity"], group_by)
+        combined_data = model.forecast(forecast_period)
 
-        print(f"[DEBUG] Combined forecast result: {combined_data}")
+        print(f"[DEBUG] Combined forecast result: {len(combined_data)} records")
 
         return {
             "type": "forecast",
             "data": combined_data,
+            "target_column": value_cols[0],
+            "target_columns": value_cols,
+            "group_by": group_by,
+            "granularity": model.granularity,
+            "forecast_periods": forecast_period,
+            "model_cache_hit": model_hit,
         }
-    
+
+    def get_forecast_model(self, value_cols: List[str], granularity: str = "month",
+                           group_by: Optional[List[str]] = None):
+        """
+        Forecast model of the given series, fitted once per dataset version
+        and shared through the model cache by every horizon and prompt.
+
+        Returns:
+            (ForecastModel, whether it came from the cache)
+        """
+        group_by = list(group_by or [])
+        version = get_dataset_version(self.dataset_id) if self.dataset_id is not None else None
+        key = model_key(self.dataset_id, version, value_cols, group_by, granularity) if version is not None else None
+        if key is not None:
+            model = get_model(key)
+            if model is not None:
+                return model, True
+
+        series, used_granularity = self.period_series(value_cols, granularity, group_by)
+        model = ForecastModel(series, used_granularity, value_cols, group_by)
+        if key is not None:
+            put_model(key, model)
+        return model, False
+
+    def backtest(self, value_cols: List[str], granularity: str = "month", group_by: Optional[List[str]] = None,
+                 horizon: int = 3, min_train: int = 6, step: int = 1) -> Dict[str, Any]:
+        """
+        Rolling-origin backtest of the forecast of the given series, on the
+        period-level history of its cached forecast model.
+
+        Raises:
+            ValueError: If a column is unknown or not numeric
+        """
+        group_by = list(group_by or [])
+        unknown = [c for c in value_cols if c not in self.numeric_columns] + \
+                  [c for c in group_by if c not in self.df.columns]
+        if unknown:
+            raise ValueError(f"Unknown or non-numeric columns: {unknown}")
+        if granularity not in FORECAST_FREQUENCIES:
+            raise ValueError(f"Unknown granularity {granularity!r}")
+
+        model, _ = self.get_forecast_model(value_cols, granularity, group_by)
+        result = run_backtest(model.history, horizon=horizon, min_train=min_train, step=step)
+        return {
+            "type": "backtest",
+            "target_columns": model.value_cols,
+            "group_by": model.group_by,
+            "granularity": model.granularity,
+            "periods": model.periods,
+            **result
+        }
+
+    def resolve_forecast_parameters(self, prompt: str, horizon_unit: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Work out the measures, groups and period a forecast prompt asks for,
+        e.g. "forecast revenue and profit for each region for the next 6 weeks".
+
+        Args:
+            prompt: Forecast prompt
+            horizon_unit: Unit of the prompt's horizon, see extract_forecast_period
+
+        Returns:
+            Dictionary with value_cols (Revenue by default), group_by (empty
+            unless the prompt asks for each/per/by a known dimension) and
+            granularity (months by default)
+        """
+        text = prompt.lower()
+        value_cols = []
+        for pattern, col in FORECAST_MEASURES.items():
+            if re.search(pattern, text) and col in self.numeric_columns and col not in value_cols:
+                value_cols.append(col)
+        if not value_cols:
+            value_cols = ['Revenue']
+
+        group_by = []
+        if re.search(r"\b(each|every|per|by)\b", text):
+            group_by = [col for pattern, col in FORECAST_DIMENSIONS.items()
+                        if re.search(pattern, text) and col in self.df.columns]
+
+        granularity = next((g for pattern, g in FORECAST_GRANULARITIES.items() if re.search(pattern, text)), None) \
+            or horizon_unit \
+            or next((g for pattern, g in FORECAST_PERIOD_WORDS.items() if re.search(pattern, text)), "month")
+
+        return {"value_cols": value_cols, "group_by": group_by, "granularity": granularity}
+
+    def period_series(self, value_cols: Union[str, List[str]], granularity: str = "month",
+                      group_by: Optional[List[str]] = None):
+        """
+        Totals of columns per period (and group), the history forecasts are
+        fitted on.
+
+        Periods come from the time pyramid of the first date column, or else
+        from the Year and Month columns. Ungrouped totals are read from the
+        pyramid or summed per month once per dataset; grouped totals take one
+        pass over the rows, also once per dataset.
+
+        Returns:
+            (DataFrame with the group columns, Date and value columns, one row
+            per group and period; granularity used)
+
+        Raises:
+            ValueError: If the dataset has neither
+        """
+        value_cols = [value_cols] if isinstance(value_cols, str) else list(value_cols)
+        group_by = list(group_by or [])
+
+        for col in self.date_columns:
+            try:
+                pyramid = self.get_time_pyramid(col)
+            except Exception as e:
+                print(f"[WARN] Could not read {col} as dates: {str(e)}")
+                continue
+            if group_by:
+                series = self._derived(
+                    ("period_series", col, granularity, tuple(group_by), tuple(value_cols)),
+                    lambda: grouped_totals(self.df, pyramid.row_periods(self.get_datetime(col), granularity),
+                                           pyramid.period_starts(granularity), value_cols, group_by))
+                return series, granularity
+            series = pd.DataFrame({'Date': pyramid.period_starts(granularity).astype("datetime64[ns]")})
+            for value_col in value_cols:
+                series[value_col] = pyramid.series(value_col, granularity)[1]
+            return series, granularity
+
+        if {'Year', 'Month'} <= set(self.df.columns):
+            dates = get_year_month_dates(self.df, dataset_id=self.dataset_id)
+
+            def build():
+                if not group_by:
+                    totals = [monthly_totals(self.df, value_col, dates=dates) for value_col in value_cols]
+                    return pd.concat([totals[0][['Date']]] + [t.drop(columns='Date') for t in totals], axis=1)
+                months = dates.to_numpy(dtype="datetime64[M]").view(np.int64)
+                first = months.min() if len(months) else 0
+                labels = (first + np.arange(months.max() - first + 1 if len(months) else 0)).astype("datetime64[M]")
+                return grouped_totals(self.df, months - first, labels, value_cols, group_by)
+
+            series = self._derived(("period_series", "Year-Month", tuple(group_by), tuple(value_cols)), build)
+            return series, "month"
+
+        raise ValueError("Forecasting needs a date column or Year and Month columns")
+
     def what_if_analysis(self, prompt: str, **parameters):
         feature_input = parse_whatif_scenarios(prompt, self.df.columns.tolist())
         print(f"[DEBUG] What-if analysis input: {feature_input}")
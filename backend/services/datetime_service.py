@@ -0,0 +1,215 @@
+import pandas as pd
+import numpy as np
+from typing import Dict, Optional
+
+from services.file_service import get_derived
+
+# Formats tried, in order, when detecting datetime columns. Day-first and
+# month-first formats are both listed; the first one that parses every sampled
+# value wins.
+CANDIDATE_FORMATS = [
+    "%Y-%m-%d",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y/%m/%d",
+    "%d/%m/%Y",
+    "%m/%d/%Y",
+    "%d-%m-%Y",
+    "%m-%d-%Y",
+    "%d.%m.%Y",
+    "%d/%m/%Y %H:%M",
+    "%m/%d/%Y %H:%M",
+    "%b %d, %Y",
+    "%d %b %Y",
+    "%B %d, %Y",
+    "%d %B %Y",
+    "%Y-%m",
+    "ISO8601",
+]
+
+# Number of distinct values inspected per column during detection
+DETECTION_SAMPLE_SIZE = 100
+
+# Marker stored as the "format" of columns that already have a datetime dtype
+NATIVE_DATETIME = "datetime64"
+
+
+def _text_values(series: pd.Series) -> Optional[pd.Series]:
+    """
+    Return the distinct values of a text column, or None for non-text columns.
+    Categorical columns contribute their categories.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        values = pd.Series(series.cat.categories)
+    elif series.dtype == object or pd.api.types.is_string_dtype(series):
+        values = pd.Series(series.dropna().unique())
+    else:
+        return None
+
+    if values.empty or not values.map(lambda v: isinstance(v, str)).all():
+        return None
+    return values
+
+
+def detect_datetime_format(series: pd.Series, sample_size: int = DETECTION_SAMPLE_SIZE) -> Optional[str]:
+    """
+    Find the exact datetime format of a column from a small sample of its values.
+
+    Only text columns are considered, so numeric columns such as Revenue are
+    never mistaken for epoch timestamps.
+
+    Returns:
+        A strftime format (or "ISO8601"), NATIVE_DATETIME for columns that are
+        already datetimes, or None if the column does not hold dates.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return NATIVE_DATETIME
+
+    values = _text_values(series)
+    if values is None:
+        return None
+
+    sample = values.head(sample_size).str.strip()
+    # Plain numbers ("2024", "20240101") are not treated as dates
+    if sample.str.fullmatch(r"[+-]?\d+(\.\d+)?").all():
+        return None
+
+    for fmt in CANDIDATE_FORMATS:
+        parsed = pd.to_datetime(sample, format=fmt, errors="coerce")
+        if parsed.notna().all():
+            return fmt
+    return None
+
+
+def detect_datetime_columns(df: pd.DataFrame) -> Dict[str, str]:
+    """
+    Detect every datetime column of a DataFrame.
+
+    Returns:
+        Mapping of column name to its detected format
+    """
+    formats = {}
+    for col in df.columns:
+        fmt = detect_datetime_format(df[col])
+        if fmt is not None:
+            formats[col] = fmt
+    return formats
+
+
+def parse_datetime_column(series: pd.Series, fmt: str) -> pd.Series:
+    """
+    Parse a whole column with a known format in one vectorised pass.
+
+    Categorical columns only parse their categories and map them back
+    through the codes. Values that do not match the format become NaT.
+    """
+    if fmt == NATIVE_DATETIME:
+        return series
+
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = pd.to_datetime(pd.Series(series.cat.categories).str.strip(), format=fmt, errors="coerce")
+        codes = series.cat.codes.to_numpy()
+        values = categories.to_numpy()[codes]
+        values[codes == -1] = np.datetime64("NaT")
+        return pd.Series(values, index=series.index, name=series.name)
+
+    return pd.to_datetime(series.str.strip() if series.dtype == object else series,
+                          format=fmt, errors="coerce", cache=True)
+
+
+def get_parsed_datetime(df: pd.DataFrame, col: str, fmt: Optional[str] = None,
+                        dataset_id: Optional[str] = None) -> pd.Series:
+    """
+    Get a column parsed as datetime, shared by every analyzer of the dataset.
+
+    Args:
+        df: Dataset holding the column
+        col: Column name
+        fmt: Known format; detected from a sample when omitted
+        dataset_id: Cache the parsed column per dataset when given
+
+    Raises:
+        ValueError: If the column does not hold dates
+    """
+    def build():
+        column_format = fmt or detect_datetime_format(df[col])
+        if column_format is None:
+            raise ValueError(f"Column {col} does not contain recognizable dates")
+        return parse_datetime_column(df[col], column_format)
+
+    if dataset_id is None:
+        return build()
+    return get_derived(dataset_id, ("datetime", col), build)
+
+
+def get_year_month_dates(df: pd.DataFrame, year_col: str = "Year", month_col: str = "Month",
+                         dataset_id: Optional[str] = None) -> pd.Series:
+    """
+    Build first-of-month dates from integer year and month columns with
+    integer arithmetic instead of pd.to_datetime's column assembly.
+    """
+    def build():
+        months = (df[year_col].to_numpy(dtype=np.int64) - 1970) * 12 + (df[month_col].to_numpy(dtype=np.int64) - 1)
+        values = months.astype("datetime64[M]").astype("datetime64[ns]")
+        return pd.Series(values, index=df.index, name="Date")
+
+    if dataset_id is None:
+        return build()
+    return get_derived(dataset_id, ("datetime", f"{year_col}-{month_col}"), build)
+
+
+class SortedDateIndex:
+    """
+    Row positions of a date column in chronological order, with the sorted
+    int64 timestamps next to them. Missing dates are left out.
+
+    A time range maps to a contiguous slice of the permutation found with two
+    binary searches. Ties keep the order pandas' default sort gives them, so
+    taking rows through the index matches sort_values on the same dates.
+    """
+
+    def __init__(self, dates: pd.Series):
+        values = dates.to_numpy(dtype="datetime64[ns]").view(np.int64)
+        valid = np.flatnonzero(values != np.iinfo(np.int64).min)
+        self.length = len(values)
+        # Sorted as datetime64, like pandas, since numpy sorts int64 ties differently
+        self.order = valid[values[valid].view("datetime64[ns]").argsort(kind="quicksort")]
+        self.values = values[self.order]
+
+    @property
+    def nbytes(self) -> int:
+        return self.order.nbytes + self.values.nbytes
+
+    def range(self, low: Optional[pd.Timestamp] = None, high: Optional[pd.Timestamp] = None,
+              include_low: bool = True, include_high: bool = True) -> np.ndarray:
+        """
+        Positions of the rows dated between `low` and `high`, in chronological order.
+        """
+        start = 0 if low is None else np.searchsorted(
+            self.values, pd.Timestamp(low).as_unit("ns").value, side="left" if include_low else "right")
+        stop = len(self.values) if high is None else np.searchsorted(
+            self.values, pd.Timestamp(high).as_unit("ns").value, side="right" if include_high else "left")
+        return self.order[start:max(start, stop)]
+
+
+def get_sorted_date_index(dates: pd.Series, key: str, dataset_id: Optional[str] = None) -> Optional[SortedDateIndex]:
+    """
+    Get the sorted index of a parsed date column, built once per dataset.
+
+    Args:
+        dates: Parsed dates, e.g. from get_parsed_datetime
+        key: Identifies the dates within the dataset, e.g. the column name
+        dataset_id: Cache the index per dataset when given
+
+    Returns:
+        The index, or None for timezone-aware dates
+    """
+    def build():
+        if getattr(dates.dtype, "tz", None) is not None:
+            return None
+        return SortedDateIndex(dates)
+
+    if dataset_id is None:
+        return build()
+    return get_derived(dataset_id, ("date_index", key), build)
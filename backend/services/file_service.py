@@ -1,57 +1,381 @@
-from fastapi import UploadFile, HTTPException
 import pandas as pd
-import io
+import pyarrow as pa
+import asyncio
 import os
 import uuid
-from typing import Dict, Any, List
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Callable, Hashable
 import json
 from datetime import datetime
 
-# In-memory storage for datasets
-# In production, use a database or file system
-cached_datasets = {}
+# Datasets are written once to Arrow IPC files under DATA_DIR and reopened lazily
+# through a memory map. index.json holds the metadata of every stored dataset.
+DATA_DIR = os.environ.get(
+    "DATAPROMPT_DATA_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+)
+INDEX_FILENAME = "index.json"
 
-async def save_file(df: pd.DataFrame, filename: str) -> str:
+# Metadata for every stored dataset, keyed by dataset ID
+_index: Dict[str, Dict[str, Any]] = {}
+
+# Memory budget for opened DataFrames, measured with memory_usage(deep=True)
+CACHE_BUDGET_BYTES = int(os.environ.get("DATAPROMPT_CACHE_BUDGET_BYTES", 1024 ** 3))
+
+# DataFrames that have been opened in this process, keyed by dataset ID and
+# ordered from least to most recently used
+cached_datasets: "OrderedDict[str, pd.DataFrame]" = OrderedDict()
+_cached_bytes: Dict[str, int] = {}
+cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+# Artifacts derived from a cached dataset (parsed columns, indexes, ...). They
+# count towards the memory budget and are dropped together with the dataset.
+_derived: Dict[str, Dict[Hashable, Any]] = {}
+
+_lock = threading.RLock()
+
+# Per-dataset locks serializing writes, so an append always builds on the
+# latest data instead of overwriting a concurrent write
+_write_locks: Dict[str, asyncio.Lock] = {}
+
+# Callbacks notified with the dataset ID whenever a stored dataset's data changes
+_change_listeners: List[Callable[[str], None]] = []
+
+
+def _index_path() -> str:
+    return os.path.join(DATA_DIR, INDEX_FILENAME)
+
+
+def _write_index():
+    os.makedirs(DATA_DIR, exist_ok=True)
+    tmp_path = _index_path() + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(_index, f, indent=2)
+    os.replace(tmp_path, _index_path())
+
+
+def load_index():
+    """
+    (Re)load dataset metadata from the index file. DataFrames are not opened
+    until they are requested.
+    """
+    with _lock:
+        _index.clear()
+        cached_datasets.clear()
+        _cached_bytes.clear()
+        _derived.clear()
+        _write_locks.clear()
+        for key in cache_stats:
+            cache_stats[key] = 0
+        if os.path.exists(_index_path()):
+            with open(_index_path()) as f:
+                _index.update(json.load(f))
+
+
+def _write_arrow(df: pd.DataFrame, path: str):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp_path = path + ".tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def _read_arrow(path: str) -> pd.DataFrame:
+    # Keep the memory map open: numeric columns without nulls are converted
+    # zero-copy, so the resulting arrays are read-only views over the file.
+    source = pa.memory_map(path, "r")
+    table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas(split_blocks=True)
+
+
+def snapshot(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Get an immutable-by-default view of a shared DataFrame.
+
+    The snapshot shares all column data with `df` (no copy is made). With
+    pandas copy-on-write, which the app enables at startup, any write to it,
+    including in-place operations, copies just the affected columns first.
+    Hand one to every reader that might modify its frame.
+    """
+    return df.copy(deep=False)
+
+
+def _sizeof(value: Any) -> int:
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    nbytes = getattr(value, "nbytes", None)
+    return int(nbytes) if isinstance(nbytes, (int, float)) else 0
+
+
+def _enforce_budget(keep: str):
+    """
+    Evict least recently used datasets until the cache fits in
+    CACHE_BUDGET_BYTES. Every dataset is already persisted, so eviction only
+    drops the in-memory copy and its derived artifacts; the next get_dataset
+    call reloads it from its Arrow file. `keep` is never evicted, even if it
+    alone exceeds the budget.
+    """
+    while len(cached_datasets) > 1 and sum(_cached_bytes.values()) > CACHE_BUDGET_BYTES:
+        evicted_id = next(iter(cached_datasets))
+        if evicted_id == keep:
+            cached_datasets.move_to_end(keep)
+            continue
+        cached_datasets.pop(evicted_id)
+        _cached_bytes.pop(evicted_id, None)
+        _derived.pop(evicted_id, None)
+        cache_stats["evictions"] += 1
+        print(f"[DEBUG] Evicted dataset {evicted_id} from memory cache")
+
+
+def _cache_put(dataset_id: str, df: pd.DataFrame):
+    """
+    Add a DataFrame to the in-memory cache, evicting older datasets if needed.
+    """
+    cached_datasets[dataset_id] = df
+    cached_datasets.move_to_end(dataset_id)
+    _cached_bytes[dataset_id] = _sizeof(df)
+    _derived.pop(dataset_id, None)
+    _enforce_budget(keep=dataset_id)
+
+
+def get_derived(dataset_id: str, key: Hashable, builder: Callable[[], Any]) -> Any:
     """
-    Save a DataFrame to in-memory cache and return a dataset ID.
-    
+    Get an artifact derived from a dataset, building it on first use.
+
+    Artifacts are shared by every request on the dataset and live exactly as
+    long as the dataset stays in the memory cache.
+
+    Args:
+        dataset_id: Dataset ID
+        key: Identifies the artifact, e.g. ("datetime", "OrderDate")
+        builder: Zero-argument function producing the artifact
+
+    Returns:
+        The cached or freshly built artifact
+    """
+    with _lock:
+        artifacts = _derived.get(dataset_id)
+        if artifacts is not None and key in artifacts:
+            return artifacts[key]
+
+    value = builder()
+
+    with _lock:
+        if dataset_id not in cached_datasets:
+            return value
+        artifacts = _derived.setdefault(dataset_id, {})
+        if key in artifacts:
+            return artifacts[key]
+        artifacts[key] = value
+        _cached_bytes[dataset_id] += _sizeof(value)
+        _enforce_budget(keep=dataset_id)
+        return value
+
+
+def on_dataset_change(listener: Callable[[str], None]):
+    """
+    Register a callback run with the dataset ID whenever a dataset's data is
+    replaced, so caches of results computed from it can be invalidated.
+    """
+    _change_listeners.append(listener)
+
+
+def _notify_change(dataset_id: str):
+    for listener in list(_change_listeners):
+        listener(dataset_id)
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    """
+    Report hit, miss and eviction counters of the dataset cache.
+    """
+    with _lock:
+        return {
+            **cache_stats,
+            "cached_datasets": len(cached_datasets),
+            "cached_bytes": sum(_cached_bytes.values()),
+            "budget_bytes": CACHE_BUDGET_BYTES
+        }
+
+
+async def save_file(df: pd.DataFrame, filename: str, **metadata) -> str:
+    """
+    Persist a DataFrame to the dataset store and return a dataset ID.
+
     Args:
         df: pandas DataFrame to save
         filename: Original filename
-        
+        metadata: Extra metadata stored in the index alongside the dataset
+
     Returns:
         Dataset ID
     """
     dataset_id = str(uuid.uuid4())
-    cached_datasets[dataset_id] = {
-        "df": df,
-        "filename": filename,
-        "upload_time": datetime.now().isoformat(),
-        "columns": list(df.columns),
-        "row_count": len(df)
-    }
+    path = get_dataset_path(dataset_id, must_exist=False)
+    os.makedirs(DATA_DIR, exist_ok=True)
+    await asyncio.to_thread(_write_arrow, df, path)
+
+    with _lock:
+        _index[dataset_id] = {
+            "filename": filename,
+            "upload_time": datetime.now().isoformat(),
+            "columns": list(df.columns),
+            "row_count": len(df),
+            "file": os.path.basename(path),
+            "version": 1,
+            **metadata
+        }
+        _write_index()
+        _cache_put(dataset_id, snapshot(df))
     return dataset_id
 
-def get_dataset_path(dataset_id: str) -> str:
+async def replace_dataset(dataset_id: str, df: pd.DataFrame, **metadata) -> Optional[int]:
     """
-    Get the path to a dataset.
-    In this in-memory implementation, we just return the dataset ID if it exists.
-    
+    Overwrite the data of a stored dataset and bump its version.
+
+    The cached frame and everything derived from it are dropped, and change
+    listeners are notified so results computed from the old data are discarded.
+
     Args:
         dataset_id: Dataset ID
-        
+        df: New contents
+        metadata: Metadata to add or replace
+
     Returns:
-        Dataset path or ID
+        New dataset version, or None for unknown datasets
     """
-    if dataset_id not in cached_datasets:
+    if dataset_id not in _index:
         return None
-    
-    return dataset_id
+
+    async with _write_lock(dataset_id):
+        return await _replace_locked(dataset_id, df, **metadata)
+
+def _write_lock(dataset_id: str) -> asyncio.Lock:
+    with _lock:
+        return _write_locks.setdefault(dataset_id, asyncio.Lock())
+
+async def _replace_locked(dataset_id: str, df: pd.DataFrame, **metadata) -> Optional[int]:
+    """
+    replace_dataset for callers already holding the dataset's write lock.
+    """
+    if dataset_id not in _index:
+        return None
+
+    await asyncio.to_thread(_write_arrow, df, get_dataset_path(dataset_id, must_exist=False))
+
+    with _lock:
+        info = _index[dataset_id]
+        # The stored profile described the old data; it is rebuilt on next use
+        info.pop("profile", None)
+        info.update(metadata)
+        info.update({
+            "columns": list(df.columns),
+            "row_count": len(df),
+            "version": info.get("version", 1) + 1
+        })
+        _write_index()
+        cached_datasets.pop(dataset_id, None)
+        _cached_bytes.pop(dataset_id, None)
+        _cache_put(dataset_id, snapshot(df))
+        version = info["version"]
+    _notify_change(dataset_id)
+    return version
+
+def _concat_rows(df: pd.DataFrame, rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    Append rows to a dataset, keeping categorical columns categorical by
+    extending their categories with the new values.
+    """
+    rows = rows.reindex(columns=df.columns)
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            added = pd.Index(rows[col].dropna().unique()).difference(df[col].cat.categories)
+            dtype = pd.CategoricalDtype(df[col].cat.categories.append(added)) if len(added) else df[col].dtype
+            df = df.assign(**{col: df[col].astype(dtype)})
+            rows = rows.assign(**{col: rows[col].astype(dtype)})
+    return pd.concat([df, rows], ignore_index=True)
+
+async def append_rows(dataset_id: str, rows: pd.DataFrame) -> Optional[int]:
+    """
+    Append rows to a stored dataset and bump its version.
+
+    Like replace_dataset, except that derived artifacts defining
+    `appended(rows)` are carried over: the method gets the appended rows and
+    returns the artifact updated for them, or None to rebuild it on next use.
+
+    Args:
+        dataset_id: Dataset ID
+        rows: New rows; columns missing from the dataset are ignored
+
+    Returns:
+        New dataset version, or None for unknown datasets
+    """
+    if dataset_id not in _index:
+        return None
+
+    # Read, combine and write under the write lock, so concurrent appends
+    # each see the rows added by the one before
+    async with _write_lock(dataset_id):
+        df = get_dataset(dataset_id)
+        if df is None:
+            return None
+        combined = _concat_rows(df, rows)
+        added = combined.iloc[len(df):]
+
+        with _lock:
+            artifacts = dict(_derived.get(dataset_id, {}))
+        carried = {}
+        for key, artifact in artifacts.items():
+            appended = getattr(artifact, "appended", None)
+            if appended is not None:
+                updated = appended(added)
+                if updated is not None:
+                    carried[key] = updated
+
+        version = await _replace_locked(dataset_id, combined)
+        with _lock:
+            if dataset_id in cached_datasets:
+                _derived[dataset_id] = carried
+                _cached_bytes[dataset_id] += sum(_sizeof(a) for a in carried.values())
+                _enforce_budget(keep=dataset_id)
+    return version
+
+def get_dataset_version(dataset_id: str) -> Optional[int]:
+    """
+    Get the version of a dataset, which increases every time its data changes.
+
+    Returns:
+        Dataset version, or None for unknown datasets
+    """
+    info = _index.get(dataset_id)
+    if info is None:
+        return None
+    return info.get("version", 1)
+
+def get_dataset_path(dataset_id: str, must_exist: bool = True) -> Optional[str]:
+    """
+    Get the path to a dataset's Arrow file.
+
+    Args:
+        dataset_id: Dataset ID
+        must_exist: Return None if the dataset is not in the index
+
+    Returns:
+        Dataset path, or None for unknown datasets
+    """
+    if must_exist and dataset_id not in _index:
+        return None
+
+    return os.path.join(DATA_DIR, f"{dataset_id}.arrow")
 
 def list_datasets() -> List[Dict[str, Any]]:
     """
     List all available datasets.
-    
+
     Returns:
         List of dataset information
     """
@@ -63,20 +387,73 @@ def list_datasets() -> List[Dict[str, Any]]:
             "columns": info["columns"],
             "row_count": info["row_count"]
         }
-        for dataset_id, info in cached_datasets.items()
+        for dataset_id, info in _index.items()
     ]
 
-def get_dataset(dataset_id: str) -> pd.DataFrame:
+def get_dataset_info(dataset_id: str) -> Optional[Dict[str, Any]]:
     """
-    Get a dataset by ID.
-    
+    Get the stored metadata of a dataset without opening it.
+
     Args:
         dataset_id: Dataset ID
-        
+
     Returns:
-        pandas DataFrame
+        Metadata dictionary, or None for unknown datasets
     """
-    if dataset_id not in cached_datasets:
+    info = _index.get(dataset_id)
+    if info is None:
         return None
-    
-    return cached_datasets[dataset_id]["df"]
+    return {"id": dataset_id, **info}
+
+def update_dataset_info(dataset_id: str, if_version: Optional[int] = None, **fields) -> bool:
+    """
+    Merge fields into a dataset's stored metadata and persist the index.
+
+    Args:
+        dataset_id: Dataset ID
+        if_version: Only update while the dataset is at this version, for
+                    metadata computed from a given version of the data
+        fields: Metadata to add or replace
+
+    Returns:
+        False if the dataset is unknown or no longer at `if_version`
+    """
+    with _lock:
+        if dataset_id not in _index:
+            return False
+        if if_version is not None and _index[dataset_id].get("version", 1) != if_version:
+            return False
+        _index[dataset_id].update(fields)
+        _write_index()
+        return True
+
+def get_dataset(dataset_id: str) -> Optional[pd.DataFrame]:
+    """
+    Get a dataset by ID, memory-mapping it from disk if it is not cached.
+
+    Every call returns its own copy-on-write snapshot of the cached frame, so
+    concurrent requests never modify each other's data.
+
+    Args:
+        dataset_id: Dataset ID
+
+    Returns:
+        pandas DataFrame
+    """
+    with _lock:
+        if dataset_id not in _index:
+            return None
+
+        df = cached_datasets.get(dataset_id)
+        if df is not None:
+            cache_stats["hits"] += 1
+            cached_datasets.move_to_end(dataset_id)
+            return snapshot(df)
+
+        cache_stats["misses"] += 1
+        df = _read_arrow(get_dataset_path(dataset_id))
+        _cache_put(dataset_id, df)
+        return snapshot(df)
+
+
+load_index()
@@ -5,10 +5,13 @@ import os
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 from sklearn.metrics import r2_score
-from sklearn.linear_model import LinearRegression
 import re
 import json
 import ast
+import warnings
+from typing import Dict, Any, List, Tuple
+
+from services.file_service import snapshot
 
 # Import model and set global variables
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "linear_model.pkl")
@@ -21,33 +24,95 @@ with open(MODEL_PATH, "rb") as f:
 current_df = None
 baseline   = None
 
-def process_and_predict(df):
-    print("[Debug] Processing and predicting...")
-    new_data = df.copy()
+# Columns the Revenue model one-hot encodes; every other feature is numeric
+CATEGORICAL_FEATURES = ['ProductCategory', 'ProductName', 'Region', 'CustomerSegment']
 
-    # Step 1: Encode categorical variables
-    new_data_encoded = pd.get_dummies(new_data, columns=['ProductCategory', 'ProductName', 'Region', 'CustomerSegment'], drop_first=True)
 
-    # Step 2: Add missing columns and reorder
-    missing_cols = set(feature_cols) - set(new_data_encoded.columns)
-    for col in missing_cols:
-        new_data_encoded[col] = 0
-    new_data_encoded = new_data_encoded[feature_cols]
+class RevenueScorer:
+    """
+    The Revenue model compiled for scoring without building dummy columns.
 
-    # Step 3: Fill missing values
-    new_data_encoded = new_data_encoded.fillna(new_data_encoded.mean(numeric_only=True))
+    The scaler is folded into the coefficients, so a prediction is a bias,
+    one dot product over the numeric features and, per categorical feature,
+    the weight of the row's category looked up by its code. This gives the
+    same predictions as one-hot encoding, scaling and multiplying by theta.
+    """
 
-    # Step 4: Scale data
-    X_new_scaled = scaler.transform(new_data_encoded)
+    def __init__(self, theta: np.ndarray, feature_cols: List[str], scaler):
+        coefficients = np.asarray(theta, dtype=float).ravel()
+        scale = np.asarray(scaler.scale_, dtype=float)
+        weights = coefficients[1:] / scale
+        self.bias = float(coefficients[0] - (weights * np.asarray(scaler.mean_, dtype=float)).sum())
+
+        numeric, numeric_weights = [], []
+        self.category_weights: Dict[str, Dict[str, float]] = {col: {} for col in CATEGORICAL_FEATURES}
+        for col, weight in zip(feature_cols, weights):
+            prefix = next((c for c in CATEGORICAL_FEATURES if col.startswith(f"{c}_")), None)
+            if prefix is None:
+                numeric.append(col)
+                numeric_weights.append(weight)
+            else:
+                self.category_weights[prefix][col[len(prefix) + 1:]] = float(weight)
+        self.numeric_cols = numeric
+        self.numeric_weights = np.array(numeric_weights)
+
+    def _category_codes(self, values: pd.Series) -> Tuple[np.ndarray, List[Any]]:
+        # Categories in the order pd.get_dummies gives their columns
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            return values.cat.codes.to_numpy(), list(values.cat.categories)
+        codes, uniques = pd.factorize(values, sort=True)
+        return codes, list(uniques)
+
+    def score(self, df: pd.DataFrame, drop_first: bool = False) -> np.ndarray:
+        """
+        Predict the revenue of every row.
+
+        Args:
+            df: Rows with the model's features; missing numeric values are
+                replaced by the column mean, absent features count as 0
+            drop_first: Leave out the first category of each categorical
+                feature, like pd.get_dummies(drop_first=True)
+
+        Returns:
+            Array with one prediction per row
+        """
+        n = len(df)
+        numeric = np.zeros((n, len(self.numeric_cols)))
+        for i, col in enumerate(self.numeric_cols):
+            if col in df.columns:
+                numeric[:, i] = df[col].to_numpy(dtype=float, na_value=np.nan)
+        missing = np.isnan(numeric)
+        if missing.any():
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", category=RuntimeWarning)
+                means = np.nanmean(numeric, axis=0)
+            numeric = np.where(missing, means, numeric)
+        predicted = numeric @ self.numeric_weights + self.bias
+
+        for col, weights in self.category_weights.items():
+            if col not in df.columns:
+                continue
+            codes, categories = self._category_codes(df[col])
+            # Weight per category code, with a trailing 0 for missing values (code -1)
+            lookup = np.array([weights.get(str(category), 0.0) for category in categories] + [0.0])
+            if drop_first and categories:
+                lookup[0] = 0.0
+            predicted += lookup[codes]
+        return predicted
+
+
+revenue_scorer = RevenueScorer(theta, feature_cols, scaler)
 
-    # Step 5: Add bias term
-    X_new_scaled = np.hstack((np.ones((X_new_scaled.shape[0], 1)), X_new_scaled))
+def process_and_predict(df):
+    print("[Debug] Processing and predicting...")
+    # Copy-on-write snapshot: the caller's frame is never modified
+    new_data = snapshot(df)
 
-    # Step 6: Predict revenue
-    predicted_revenue = X_new_scaled @ theta
+    # Steps 1-6: Encode, scale and predict revenue in one pass with the compiled model
+    predicted_revenue = revenue_scorer.score(new_data, drop_first=True)
 
     # Step 7: Combine predictions with original data
-    new_data_with_predictions = new_data.copy()
+    new_data_with_predictions = snapshot(new_data)
     new_data_with_predictions['PredictedRevenue'] = predicted_revenue
 
     mae = None
@@ -74,14 +139,7 @@ def process_and_predict(df):
 
         visualization = {
             "type": "line",  # or "bar"
-            "data": [
-                {
-                    "OrderID": row["OrderID"],
-                    "ActualRevenue": row["ActualRevenue"],
-                    "PredictedRevenue": row["PredictedRevenue"]
-                }
-                for _, row in new_data_with_predictions.iterrows()
-            ],
+            "data": new_data_with_predictions[["OrderID", "ActualRevenue", "PredictedRevenue"]].to_dict(orient="records"),
             "x": "OrderID", 
             "y": ["ActualRevenue", "PredictedRevenue"],
             "title": "Predicted vs Actual Revenue",
@@ -101,73 +159,220 @@ def process_whatif(custom_input):
     df = pd.DataFrame([custom_input])
     print(f"[DEBUG] Custom input DataFrame in process_whatif:\n{df}")
 
-    sample_encoded = pd.get_dummies(df, columns=['ProductCategory', 'ProductName', 'Region', 'CustomerSegment'])
+    predicted_revenue = revenue_scorer.score(df)
+    print(f"💰 Predicted Revenue: {predicted_revenue[0]:.2f}")
 
-    for col in feature_cols:
-        if col not in sample_encoded.columns:
-            sample_encoded[col] = 0
+    return predicted_revenue[0]
 
-    sample_encoded = sample_encoded[feature_cols]
+# Forecasts fit a linear trend to one total per period (day, week, month,
+# quarter or year) instead of to every order, so their cost and payload
+# depend on the number of periods. Periods are labelled by their first day.
+FORECAST_FREQUENCIES = {"day": "D", "week": "W-MON", "month": "MS", "quarter": "QS", "year": "YS"}
 
-    sample_scaled = scaler.transform(sample_encoded)
-    sample_scaled = np.hstack((np.ones((sample_scaled.shape[0], 1)), sample_scaled))
+# Average length of each granularity in days, to restate a horizon in another unit
+PERIOD_DAYS = {"day": 1, "week": 7, "month": 365.25 / 12, "quarter": 365.25 / 4, "year": 365.25}
 
-    predicted_revenue = sample_scaled @ theta
-    print(f"💰 Predicted Revenue: {predicted_revenue[0][0]:.2f}")
 
-    return predicted_revenue[0][0]
-
-def process_forecast(df, forecast_periods=3):
-    print("[DEBUG] Processing forecast...")
-    print(f"[DEBUG] Initial DataFrame:\n{df}")
-    print(f"[DEBUG] Forecast periods: {forecast_periods}")
-
-    forecast_periods = max(1, forecast_periods)
-    df['Date'] = pd.to_datetime(df[['Year', 'Month']].assign(DAY=1))
-
-    # Sort chronologically
-    df.sort_values('Date', inplace=True)
-    df.reset_index(drop=True, inplace=True)
+def convert_horizon(count, unit, granularity):
+    """
+    Number of `granularity` periods covering `count` periods of `unit`
+    (e.g. 2 years are 24 months), at least 1. A missing unit is taken to
+    be the granularity itself.
+    """
+    if unit is None or unit == granularity:
+        return count
+    return max(1, int(round(count * PERIOD_DAYS[unit] / PERIOD_DAYS[granularity])))
 
-    # Create a time index
-    df['TimeIndex'] = np.arange(len(df))
 
-    # Define features and target
-    X = df[['TimeIndex']]
-    y = df['Revenue']
+def monthly_totals(df, value_col='Revenue', dates=None):
+    """
+    Reduce order rows to one total per month of their Year and Month columns,
+    including the empty months in between.
 
-    model = LinearRegression()
-    model.fit(X, y)
+    Args:
+        df: Rows with Year, Month and value columns
+        value_col: Column to total
+        dates: First-of-month dates of the rows, if already built
 
-    # Forecast future time steps
-    last_index = df['TimeIndex'].iloc[-1]
-    future_index = np.arange(last_index + 1, last_index + forecast_periods + 1).reshape(-1, 1)
+    Returns:
+        DataFrame with a Date column (first day of each month) and the totals
+    """
+    if dates is not None:
+        months = dates.to_numpy(dtype="datetime64[M]").view(np.int64)
+    else:
+        months = (df['Year'].to_numpy(dtype=np.int64) - 1970) * 12 + (df['Month'].to_numpy(dtype=np.int64) - 1)
+    values = np.nan_to_num(df[value_col].to_numpy(dtype=float, na_value=np.nan), nan=0.0)
+    if len(months) == 0:
+        return pd.DataFrame({'Date': pd.Series(dtype="datetime64[ns]"), value_col: pd.Series(dtype=float)})
+    first = months.min()
+    totals = np.bincount(months - first, weights=values)
+    labels = (first + np.arange(len(totals))).astype("datetime64[M]").astype("datetime64[ns]")
+    return pd.DataFrame({'Date': labels, value_col: totals})
 
-    # Predict future values
-    future_revenues = model.predict(future_index)
 
-    # Generate future dates
-    last_date = df['Date'].iloc[-1]
-    # Fix: start forecast from the next month after the last date in the dataset
-    future_dates = pd.date_range(last_date + pd.DateOffset(months=1), periods=forecast_periods, freq='MS')
+def grouped_totals(df, periods, labels, value_cols, group_by):
+    """
+    Total columns per group and period in one pass over the rows.
+
+    Args:
+        df: Rows
+        periods: Position in `labels` of each row's period, -1 to skip the row
+        labels: First day of every period
+        value_cols: Columns to total
+        group_by: Columns identifying the groups; rows missing one are skipped
+
+    Returns:
+        DataFrame with the group columns, Date and the totals, with one row per
+        occurring group and period, groups in sorted order
+    """
+    levels, codes = [], []
+    for col in group_by:
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            levels.append(values.cat.categories)
+            codes.append(values.cat.codes.to_numpy().astype(np.int64))
+        else:
+            col_codes, uniques = pd.factorize(values, sort=True)
+            levels.append(uniques)
+            codes.append(col_codes.astype(np.int64))
+
+    keep = periods >= 0
+    key = np.zeros(len(df), dtype=np.int64)
+    for col_codes, col_levels in zip(codes, levels):
+        keep &= col_codes >= 0
+        key = key * len(col_levels) + col_codes
+    groups, group_index = np.unique(key[keep], return_inverse=True)
+    n_groups, n_periods = len(groups), len(labels)
+
+    result = {}
+    for col, col_levels in reversed(list(zip(group_by, levels))):
+        result[col] = np.repeat(np.asarray(col_levels)[groups % len(col_levels)], n_periods)
+        groups = groups // len(col_levels)
+    result = {col: result[col] for col in group_by}
+    result['Date'] = np.tile(np.asarray(labels, dtype="datetime64[ns]"), n_groups)
+
+    cells = group_index * n_periods + periods[keep]
+    for col in value_cols:
+        values = np.nan_to_num(df[col].to_numpy(dtype=float, na_value=np.nan), nan=0.0)[keep]
+        result[col] = np.bincount(cells, weights=values, minlength=n_groups * n_periods)
+    return pd.DataFrame(result)
+
+
+def fit_trends(values):
+    """
+    Least-squares lines through every column of `values`, observed at
+    t = 0, 1, ..., n - 1, solved together as one stacked problem.
 
-    # Historical result: return actuals with prediction column
-    historical_df = df[['Date', 'Revenue']].copy()
-    historical_df.rename(columns={'Revenue': 'PredictedRevenue'}, inplace=True)
-    historical_df['type'] = 'historical'
+    Args:
+        values: Array of shape (periods,) or (periods, series)
 
-    # Forecast result
-    forecast_df = pd.DataFrame({
-        'Date': future_dates,
-        'PredictedRevenue': future_revenues,
-        'type': 'forecast'
-    })
+    Returns:
+        (intercepts, slopes), one per series; a single period gives flat lines
+    """
+    y = np.asarray(values, dtype=float)
+    if y.ndim == 1:
+        y = y[:, None]
+    n = len(y)
+    if n < 2:
+        return (y[0] if n else np.zeros(y.shape[1])), np.zeros(y.shape[1])
+    X = np.column_stack((np.ones(n), np.arange(n, dtype=float)))
+    coefficients = np.linalg.lstsq(X, y, rcond=None)[0]
+    return coefficients[0], coefficients[1]
+
+
+class ForecastModel:
+    """
+    Linear trends fitted to period-level series, ready to extend over any
+    horizon without refitting.
 
-    combined_df = pd.concat([historical_df, forecast_df], ignore_index=True)
+    Every (group, value column) pair is one series; all of them are fitted
+    in a single least-squares solve.
+    """
 
-    print(f"[DEBUG] Combined DataFrame:\n{combined_df}")
+    def __init__(self, series, granularity="month", value_cols='Revenue', group_by=None):
+        """
+        Args:
+            series: One row per group and period, with the group columns, a Date
+                column (first day of the period) and the value columns. Every
+                group covers the same periods, in chronological order.
+            granularity: "day", "week", "month", "quarter" or "year"
+            value_cols: Column or columns to forecast
+            group_by: Columns identifying the groups, if any
+        """
+        self.value_cols = [value_cols] if isinstance(value_cols, str) else list(value_cols)
+        self.group_by = list(group_by or [])
+        self.granularity = granularity
+        self.series = series
+        self.groups = series[self.group_by].drop_duplicates().reset_index(drop=True) if self.group_by \
+            else pd.DataFrame(index=[0])
+        self.periods = len(series) // len(self.groups) if len(series) else 0
+
+        # One column per series: the value columns side by side, groups within them
+        self.history = np.hstack([series[col].to_numpy(dtype=float).reshape(len(self.groups), self.periods).T
+                                  for col in self.value_cols])
+        self.intercepts, self.slopes = fit_trends(self.history)
+
+    @property
+    def series_count(self):
+        return len(self.groups) * len(self.value_cols)
+
+    def forecast(self, forecast_periods=3):
+        """
+        History and forecast of every series.
+
+        Returns:
+            Records with the group columns, Date, Predicted<column> for every
+            value column and type ("historical" or "forecast"), group by group
+        """
+        print(f"[DEBUG] Forecast periods: {forecast_periods} ({self.granularity}) for {self.series_count} "
+              f"series over {self.periods} historical periods")
+
+        forecast_periods = max(1, forecast_periods)
+        group_by, groups, periods = self.group_by, self.groups, self.periods
+        predicted = {col: f"Predicted{col}" for col in self.value_cols}
+
+        # Predict the periods after the last historical one
+        future_index = np.arange(periods, periods + forecast_periods, dtype=float)
+        future_values = self.intercepts + np.outer(future_index, self.slopes)
+
+        freq = FORECAST_FREQUENCIES[self.granularity]
+        if periods:
+            future_dates = pd.date_range(self.series['Date'].iloc[periods - 1], periods=forecast_periods + 1, freq=freq)[1:]
+        else:
+            future_dates = pd.date_range(pd.Timestamp.today().normalize(), periods=forecast_periods, freq=freq)
+
+        # Historical result: actual totals in the prediction columns
+        historical_df = self.series[group_by + ['Date'] + self.value_cols].rename(columns=predicted).reset_index(drop=True)
+        historical_df['type'] = 'historical'
+
+        # Forecast result
+        forecast_df = groups.loc[np.repeat(groups.index, forecast_periods), group_by].reset_index(drop=True)
+        forecast_df['Date'] = np.tile(future_dates, len(groups))
+        for i, col in enumerate(self.value_cols):
+            forecast_df[predicted[col]] = future_values[:, i * len(groups):(i + 1) * len(groups)].T.ravel()
+        forecast_df['type'] = 'forecast'
+
+        # Each group's history followed by its forecast
+        combined_df = pd.concat([historical_df, forecast_df], ignore_index=True)
+        if group_by:
+            group_ids = np.concatenate((np.repeat(np.arange(len(groups)), periods),
+                                        np.repeat(np.arange(len(groups)), forecast_periods)))
+            combined_df = combined_df.take(np.argsort(group_ids, kind="stable")).reset_index(drop=True)
+
+        print(f"[DEBUG] Combined DataFrame ({len(combined_df)} rows):\n{combined_df.head()}")
+
+        return combined_df.to_dict(orient="records")
+
+
+def process_forecast(series, forecast_periods=3, granularity="month", value_cols='Revenue', group_by=None):
+    """
+    Extend period-level series with linear trends.
 
-    return combined_df.to_dict(orient="records")
+    Fits a ForecastModel (see there for the arguments) and forecasts
+    `forecast_periods` periods with it.
+    """
+    print("[DEBUG] Processing forecast...")
+    return ForecastModel(series, granularity, value_cols, group_by).forecast(forecast_periods)
 
 
 
@@ -202,8 +407,7 @@ if __name__ == "__main__":
     }
     df = pd.DataFrame(data)
 
-    historical_data, forecasted_data = process_forecast(df, forecast_periods=3)
-    combined_data = historical_data + forecasted_data
+    combined_data = process_forecast(monthly_totals(df), forecast_periods=3)
     print(f"[DEBUG] Forecast DataFrame:\n{combined_data} ")
  
 
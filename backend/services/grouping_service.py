@@ -0,0 +1,197 @@
+import pandas as pd
+import numpy as np
+from typing import Dict, List, Tuple, Optional
+
+# Aggregations the engine understands, named as in pandas
+SUPPORTED_AGGREGATIONS = {"sum", "mean", "count", "nunique", "size"}
+
+# Combined keys with at most this many possible values are counted with a
+# dense bincount; larger key spaces are hashed with pd.factorize
+DENSE_KEY_LIMIT = 1 << 22
+
+# Running key spaces above this size are compressed before combining further
+# so combined keys never overflow int64
+COMBINE_KEY_LIMIT = 1 << 40
+
+# A grouping set: (dimension names, {output column: (source column, aggregation)})
+GroupingSet = Tuple[List[str], Dict[str, Tuple[str, str]]]
+
+
+def combine_codes(code_arrays: List[np.ndarray], sizes: List[int], length: int) -> Tuple[np.ndarray, int]:
+    """
+    Combine several non-negative code arrays into one key per row.
+
+    Returns:
+        Tuple of (keys, number of possible key values)
+    """
+    keys = np.zeros(length, dtype=np.int64)
+    space = 1
+    for codes, size in zip(code_arrays, sizes):
+        if space * size > COMBINE_KEY_LIMIT:
+            keys, uniques = pd.factorize(keys)
+            space = len(uniques)
+        keys = keys * size + codes
+        space *= size
+    return keys, space
+
+
+def _group_ids(keys: np.ndarray, space: int) -> Tuple[np.ndarray, int]:
+    """
+    Map combined keys to dense group ids 0..n_groups-1.
+    """
+    if space <= DENSE_KEY_LIMIT:
+        counts = np.bincount(keys, minlength=space)
+        occupied = np.flatnonzero(counts)
+        lookup = np.full(space, -1, dtype=np.int64)
+        lookup[occupied] = np.arange(len(occupied))
+        return lookup[keys], len(occupied)
+    ids, uniques = pd.factorize(keys)
+    return ids.astype(np.int64), len(uniques)
+
+
+class GroupingSets:
+    """
+    Compute many groupby aggregations of one DataFrame with a single scan.
+
+    Every dimension is factorized once. Each row is then assigned to a cell,
+    one per occurring combination of all requested dimensions, and the sums,
+    non-null counts and row counts of every measure are accumulated per cell
+    with one np.bincount pass over the rows. Each grouping set is a second
+    bincount of those cell totals into its groups. With many or fine
+    dimensions there can be nearly as many cells as rows; the saving is that
+    the rows are scanned once for all sets instead of once per groupby.
+
+    `nunique` cannot be rolled up. It is derived from the cell counts when the
+    column has no repeated values (e.g. an order ID) and otherwise computed per
+    grouping set from the factorized codes.
+
+    Results match `df.groupby(dims, observed=True).agg(...).reset_index()`:
+    groups are sorted by their keys and rows with a missing key are dropped.
+    """
+
+    def __init__(self, df: pd.DataFrame, dimensions: Optional[Dict[str, pd.Series]] = None):
+        """
+        Args:
+            df: Data to aggregate
+            dimensions: Extra dimensions that are not columns of `df`
+                        (e.g. binned values), aligned with its rows
+        """
+        self.df = df
+        self.extra_dimensions = dimensions or {}
+        self._dimension_codes = {}
+        self._value_codes = {}
+
+    def _dimension(self, name: str):
+        """
+        Factorized codes of a dimension, shifted by one so 0 marks missing keys.
+        """
+        if name not in self._dimension_codes:
+            values = self.extra_dimensions[name] if name in self.extra_dimensions else self.df[name]
+            codes, labels = pd.factorize(values, sort=True)
+            self._dimension_codes[name] = (codes.astype(np.int64) + 1, labels)
+        return self._dimension_codes[name]
+
+    def _values(self, name: str):
+        """
+        Factorized codes of a nunique column and whether its values are all distinct.
+        """
+        if name not in self._value_codes:
+            codes, uniques = pd.factorize(self.df[name])
+            distinct = len(uniques) == int((codes >= 0).sum())
+            self._value_codes[name] = (codes.astype(np.int64), len(uniques), distinct)
+        return self._value_codes[name]
+
+    def compute(self, sets: Dict[str, GroupingSet]) -> Dict[str, pd.DataFrame]:
+        """
+        Aggregate every grouping set.
+
+        Args:
+            sets: Name -> (dimensions, {output column: (source column, aggregation)})
+
+        Returns:
+            Name -> aggregated DataFrame with the dimensions followed by the outputs
+        """
+        n_rows = len(self.df)
+        dims = list(dict.fromkeys(d for set_dims, _ in sets.values() for d in set_dims))
+        measures = []
+        for _, aggregations in sets.values():
+            for column, func in aggregations.values():
+                if func not in SUPPORTED_AGGREGATIONS:
+                    raise ValueError(f"Unsupported aggregation: {func}")
+                if func in ("sum", "mean", "count") and column not in measures:
+                    measures.append(column)
+
+        # Single scan: reduce rows to cells of the finest dimension combination
+        codes = [self._dimension(d)[0] for d in dims]
+        sizes = [len(self._dimension(d)[1]) + 1 for d in dims]
+        keys, space = combine_codes(codes, sizes, n_rows)
+        row_cell, n_cells = _group_ids(keys, space)
+
+        representative = np.zeros(n_cells, dtype=np.int64)
+        representative[row_cell] = np.arange(n_rows)
+        cell_codes = {d: c[representative] for d, c in zip(dims, codes)}
+        cell_rows = np.bincount(row_cell, minlength=n_cells)
+        cell_sums = {}
+        cell_counts = {}
+        for column in measures:
+            values = self.df[column].to_numpy(dtype=np.float64, na_value=np.nan)
+            valid = ~np.isnan(values)
+            cell_sums[column] = np.bincount(row_cell, weights=np.where(valid, values, 0.0), minlength=n_cells)
+            cell_counts[column] = np.bincount(row_cell, weights=valid, minlength=n_cells)
+
+        results = {}
+        for name, (set_dims, aggregations) in sets.items():
+            keep = np.ones(n_cells, dtype=bool)
+            for d in set_dims:
+                keep &= cell_codes[d] > 0
+            kept = np.flatnonzero(keep)
+
+            set_keys, set_space = combine_codes([cell_codes[d][kept] for d in set_dims],
+                                           [len(self._dimension(d)[1]) + 1 for d in set_dims], len(kept))
+            cell_group, n_groups = _group_ids(set_keys, set_space)
+
+            group_cell = np.zeros(n_groups, dtype=np.int64)
+            group_cell[cell_group] = kept
+            order = np.lexsort([cell_codes[d][group_cell] for d in reversed(set_dims)]) if set_dims else np.arange(n_groups)
+
+            frame = {}
+            for d in set_dims:
+                labels = self._dimension(d)[1]
+                frame[d] = labels.take(cell_codes[d][group_cell[order]] - 1)
+
+            for output, (column, func) in aggregations.items():
+                if func == "size":
+                    values = np.bincount(cell_group, weights=cell_rows[kept], minlength=n_groups).astype(np.int64)
+                elif func == "nunique":
+                    values = self._nunique(column, row_cell, keep, cell_group, n_cells, n_groups)
+                else:
+                    sums = np.bincount(cell_group, weights=cell_sums[column][kept], minlength=n_groups)
+                    counts = np.bincount(cell_group, weights=cell_counts[column][kept], minlength=n_groups)
+                    if func == "sum":
+                        values = sums
+                        if pd.api.types.is_integer_dtype(self.df[column]) or pd.api.types.is_bool_dtype(self.df[column]):
+                            values = np.rint(sums).astype(np.int64)
+                    elif func == "mean":
+                        with np.errstate(invalid="ignore", divide="ignore"):
+                            values = np.where(counts > 0, sums / np.where(counts > 0, counts, 1), np.nan)
+                    else:
+                        values = counts.astype(np.int64)
+                frame[output] = values[order]
+
+            results[name] = pd.DataFrame(frame, columns=list(set_dims) + list(aggregations))
+        return results
+
+    def _nunique(self, column: str, row_cell: np.ndarray, keep: np.ndarray, cell_group: np.ndarray,
+                 n_cells: int, n_groups: int) -> np.ndarray:
+        value_codes, n_values, distinct = self._values(column)
+        if distinct:
+            # No repeated values: distinct count == non-null count, which rolls up
+            cell_non_null = np.bincount(row_cell, weights=value_codes >= 0, minlength=n_cells)
+            return np.rint(np.bincount(cell_group, weights=cell_non_null[keep], minlength=n_groups)).astype(np.int64)
+
+        cell_to_group = np.full(n_cells, -1, dtype=np.int64)
+        cell_to_group[np.flatnonzero(keep)] = cell_group
+        row_group = cell_to_group[row_cell]
+        valid = (row_group >= 0) & (value_codes >= 0)
+        pairs = pd.unique(row_group[valid] * max(n_values, 1) + value_codes[valid])
+        return np.bincount(pairs // max(n_values, 1), minlength=n_groups).astype(np.int64)
@@ -0,0 +1,204 @@
+from fastapi import UploadFile
+import pandas as pd
+import numpy as np
+import os
+import tempfile
+from typing import Dict, Any, List, Tuple
+
+from services.datetime_service import detect_datetime_format
+
+# Size of each read from the upload stream when spooling to disk
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MiB
+
+# Number of CSV rows parsed per chunk
+PARSE_CHUNK_ROWS = 100_000
+
+# Object columns with at most this many distinct values, making up at most
+# this share of the rows, are stored as pandas categoricals. Categoricals are
+# unordered, so date-like text columns are left as they are.
+CATEGORY_MAX_UNIQUES = 1000
+CATEGORY_MAX_RATIO = 0.05
+
+
+async def spool_upload(file: UploadFile, chunk_size: int = UPLOAD_CHUNK_SIZE) -> Tuple[str, int]:
+    """
+    Copy an uploaded file to a temporary file on disk in fixed-size chunks.
+
+    Args:
+        file: Incoming upload
+        chunk_size: Number of bytes read per chunk
+
+    Returns:
+        Tuple of (temporary file path, total bytes written).
+        The caller is responsible for deleting the file.
+    """
+    suffix = os.path.splitext(file.filename or "")[1]
+    fd, path = tempfile.mkstemp(prefix="dataprompt-upload-", suffix=suffix)
+    total = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                out.write(chunk)
+                total += len(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, total
+
+
+def _frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True, index=False).sum())
+
+
+def read_csv_chunked(path: str, chunk_rows: int = PARSE_CHUNK_ROWS) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Parse a CSV file incrementally and assemble the final DataFrame column by column.
+
+    Each parsed chunk is split into per-column pieces straight away so the chunk
+    itself can be released. The final frame is then built one column at a time,
+    dropping that column's pieces as soon as they are concatenated, so peak memory
+    stays close to the size of the finished DataFrame plus one chunk.
+
+    Returns:
+        Tuple of (DataFrame, ingest stats). Stats contain the number of chunks
+        parsed and `estimated_peak_bytes`, an estimate (not a measurement) of
+        the most data bytes held at once, from the sizes of the chunks and
+        columns. It assumes the final DataFrame construction copies every
+        column buffer while consolidating same-dtype columns into blocks; the
+        parser's own scratch memory is not included.
+    """
+    pieces: Dict[str, List[pd.Series]] = {}
+    columns: List[str] = []
+    held = 0
+    peak = 0
+    chunks = 0
+
+    for chunk in pd.read_csv(path, chunksize=chunk_rows):
+        chunks += 1
+        chunk_bytes = _frame_bytes(chunk)
+        peak = max(peak, held + chunk_bytes)
+        if not columns:
+            columns = list(chunk.columns)
+        for col in columns:
+            # Copy out of the chunk's consolidated blocks so the chunk can be freed
+            pieces.setdefault(col, []).append(chunk[col].copy())
+        held += chunk_bytes
+        del chunk
+
+    if not columns:
+        # Header-only file: let pandas produce the empty frame with the right columns
+        df = pd.read_csv(path)
+        return df, {"chunks": 0, "estimated_peak_bytes": _frame_bytes(df)}
+
+    assembled = {}
+    assembled_bytes = 0
+    buffer_bytes = 0
+    for col in columns:
+        parts = pieces.pop(col)
+        parts_bytes = sum(int(p.memory_usage(deep=True, index=False)) for p in parts)
+        series = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0].reset_index(drop=True)
+        del parts
+        col_bytes = int(series.memory_usage(deep=True, index=False))
+        # Pieces of this column and the new column coexist until the pieces are dropped
+        peak = max(peak, held + col_bytes)
+        held -= parts_bytes
+        assembled[col] = series
+        assembled_bytes += col_bytes
+        # Consolidation copies the column's buffer (for text, the pointers, not the strings)
+        buffer_bytes += int(series.memory_usage(deep=False, index=False))
+        held += col_bytes
+
+    df = pd.DataFrame(assembled, copy=False)
+    peak = max(peak, assembled_bytes + buffer_bytes)
+    return df, {"chunks": chunks, "estimated_peak_bytes": int(peak)}
+
+
+def read_tabular_file(path: str, filename: str) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Parse a spooled upload into a DataFrame.
+
+    CSV files are parsed in chunks. Excel workbooks cannot be streamed by pandas,
+    so they are parsed in one go from the spooled file.
+    """
+    if filename.endswith('.csv'):
+        return read_csv_chunked(path)
+
+    df = pd.read_excel(path)
+    size = _frame_bytes(df)
+    return df, {"chunks": 1, "estimated_peak_bytes": size + os.path.getsize(path)}
+
+
+def _compact_object(series: pd.Series) -> pd.Series:
+    values = series.dropna()
+    if values.empty:
+        return series
+
+    # Yes/No columns are kept as labelled categoricals rather than booleans, so
+    # generated code comparing with == 'Yes' keeps matching the same rows
+    uniques = values.unique()
+    if len(uniques) <= min(CATEGORY_MAX_UNIQUES, CATEGORY_MAX_RATIO * len(series)) \
+            and detect_datetime_format(series) is None:
+        return series.astype("category")
+    return series
+
+
+def _compact_numeric(series: pd.Series) -> pd.Series:
+    # Integers are never narrowed below int32 so arithmetic in generated
+    # code (e.g. Year * 100 + Month) keeps its headroom.
+    values = series.to_numpy()
+    info = np.iinfo(np.int32)
+    if len(values) == 0:
+        return series
+    in_int32_range = info.min <= values.min() and values.max() <= info.max
+
+    if pd.api.types.is_float_dtype(series):
+        if np.isnan(values).any() or not np.array_equal(values, np.round(values)) or not in_int32_range:
+            narrowed = values.astype(np.float32)
+            if np.array_equal(narrowed.astype(values.dtype), values, equal_nan=True):
+                return pd.Series(narrowed, index=series.index, name=series.name)
+            return series
+
+    if in_int32_range:
+        return series.astype(np.int32)
+    return series
+
+
+def compact_dtypes(df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Shrink a freshly parsed DataFrame without changing its values.
+
+    - Low-cardinality text columns become categoricals, keeping their labels.
+    - Whole-number floats become integers, and numerics are downcast
+      only where the round trip is exact.
+
+    Returns:
+        Tuple of (compacted DataFrame, report). The report holds dtype and
+        byte counts before and after for every column plus overall totals.
+    """
+    columns = {}
+    report = {"columns": {}}
+    for col in df.columns:
+        series = df[col]
+        before = int(series.memory_usage(deep=True, index=False))
+        if series.dtype == object:
+            compacted = _compact_object(series)
+        elif pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            compacted = _compact_numeric(series)
+        else:
+            compacted = series
+        after = int(compacted.memory_usage(deep=True, index=False))
+
+        columns[col] = compacted
+        report["columns"][col] = {
+            "dtype_before": str(series.dtype),
+            "dtype_after": str(compacted.dtype),
+            "bytes_before": before,
+            "bytes_after": after
+        }
+
+    report["bytes_before"] = sum(c["bytes_before"] for c in report["columns"].values())
+    report["bytes_after"] = sum(c["bytes_after"] for c in report["columns"].values())
+    return pd.DataFrame(columns, index=df.index, copy=False), report
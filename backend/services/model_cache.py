@@ -0,0 +1,84 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from services.file_service import on_dataset_change
+
+# Maximum number of fitted models kept; the least recently used one is evicted first
+MODEL_CACHE_MAX_ENTRIES = int(os.environ.get("DATAPROMPT_MODEL_CACHE_ENTRIES", 128))
+
+ModelKey = Tuple[str, int, str, str]
+
+# Fitted forecast models keyed by (dataset ID, dataset version, series
+# definition, granularity), ordered from least to most recently used. Any
+# horizon is forecast from the cached coefficients without refitting.
+_models: "OrderedDict[ModelKey, Any]" = OrderedDict()
+model_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+_lock = threading.Lock()
+
+
+def model_key(dataset_id: str, version: int, value_cols: List[str], group_by: List[str], granularity: str) -> ModelKey:
+    """
+    Build the cache key of a fitted model.
+    """
+    series = json.dumps({"value_cols": list(value_cols), "group_by": list(group_by)})
+    return (dataset_id, version, series, granularity)
+
+
+def get_model(key: ModelKey) -> Optional[Any]:
+    """
+    Get a fitted model, or None on a miss.
+    """
+    with _lock:
+        if key in _models:
+            model_stats["hits"] += 1
+            _models.move_to_end(key)
+            return _models[key]
+        model_stats["misses"] += 1
+        return None
+
+
+def put_model(key: ModelKey, model: Any):
+    """
+    Store a fitted model, evicting the least recently used ones beyond
+    MODEL_CACHE_MAX_ENTRIES.
+    """
+    with _lock:
+        _models[key] = model
+        _models.move_to_end(key)
+        while len(_models) > MODEL_CACHE_MAX_ENTRIES:
+            _models.popitem(last=False)
+            model_stats["evictions"] += 1
+
+
+def invalidate_dataset(dataset_id: str):
+    """
+    Drop every fitted model of a dataset.
+    """
+    with _lock:
+        stale = [key for key in _models if key[0] == dataset_id]
+        for key in stale:
+            del _models[key]
+        model_stats["invalidations"] += len(stale)
+    if stale:
+        print(f"[DEBUG] Invalidated {len(stale)} fitted models of dataset {dataset_id}")
+
+
+def get_model_stats() -> Dict[str, Any]:
+    """
+    Report hit, miss, eviction and invalidation counters of the model cache.
+    """
+    with _lock:
+        lookups = model_stats["hits"] + model_stats["misses"]
+        return {
+            **model_stats,
+            "hit_rate": model_stats["hits"] / lookups if lookups else 0.0,
+            "entries": len(_models),
+            "max_entries": MODEL_CACHE_MAX_ENTRIES
+        }
+
+
+on_dataset_change(invalidate_dataset)
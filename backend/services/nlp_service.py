@@ -1,10 +1,11 @@
 import requests
 import json
-from typing import List, Dict, Any, Generator, AsyncGenerator
+from typing import List, Dict, Any, Optional, Tuple, Generator, AsyncGenerator
 import re
 import httpx
 import pandas as pd
 import asyncio
+from functools import lru_cache
 
 OLLAMA_URL = "http://localhost:11434/api/generate"
 # MODEL_NAME = "llama3.2"
@@ -140,18 +141,31 @@ Prompt:
 
 
 
-def generate_panda_code_from_prompt(prompt: str, df_columns: List[str]):
+def _column_metadata_section(column_metadata: Optional[str]) -> str:
+    if not column_metadata:
+        return ""
+    return f"""
+Column types and sample values:
+{column_metadata}
+"""
+
+
+def generate_panda_code_from_prompt(prompt: str, df_columns: List[str], column_metadata: Optional[str] = None):
     """
     Generate a pandas code snippet based on the user's prompt.
     Sends prompt to LLM with proper instructions to use correct column names.
+
+    `column_metadata` (from DataAnalyzer.get_column_metadata) lists the dtype
+    and sample values of every column, so comparisons use the stored labels.
     """
     base_prompt = f"""
 You are a coding assistant that generates only valid pandas DataFrame code based on the user's prompt.
 
 The DataFrame is named `df`, and it contains the following columns (case-sensitive): {df_columns}
-
+{_column_metadata_section(column_metadata)}
 Instructions:
 - Use the exact column names from the list above. If the user's prompt includes a slightly different name, match it to the closest correct column.
+- Compare text and category columns with values spelled exactly like their sample values.
 - Do not include import statements, variable assignments, comments, explanations, or markdown formatting.
 - Do not wrap the response in ```python``` or any other formatting.
 - Return only the **raw, executable** pandas code (ideally one line, unless absolutely necessary).
@@ -173,6 +187,75 @@ User prompt: {prompt}
     return model_response
 
 
+def generate_query_plan(prompt: str, df_columns: List[str], kind: str = "query",
+                        column_metadata: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Ask the LLM for a JSON query plan instead of pandas source code.
+
+    Args:
+        prompt: User prompt
+        df_columns: Dataset columns
+        kind: "filter" for row subsets, "query"/"aggregation" for totals and rankings
+        column_metadata: Dtype and sample values of every column, from
+                         DataAnalyzer.get_column_metadata
+
+    Returns:
+        The parsed plan, or None if the LLM did not return valid JSON
+    """
+    base_prompt = f"""
+You are a strict JSON API that turns a data question into a query plan. Do not return explanations, code, or comments.
+
+The table has these columns (case-sensitive): {df_columns}
+{_column_metadata_section(column_metadata)}
+Return ONLY a JSON object with these optional keys:
+{{
+  "filters": [{{"column": "<column>", "op": "<op>", "value": <value>}}],
+  "group_by": ["<column>"],
+  "aggregates": [{{"column": "<column>", "func": "<func>", "as": "<output name>"}}],
+  "select": ["<column>"],
+  "sort": [{{"column": "<column or aggregate output name>", "descending": true}}],
+  "limit": <int>
+}}
+
+Rules:
+- op is one of: ==, !=, >, >=, <, <=, in, not in, between, contains. "in"/"not in" take a list, "between" takes [low, high].
+- func is one of: sum, mean, median, min, max, count, nunique, size.
+- Use the exact column names from the list above.
+- Spell filter values for text and category columns like their sample values.
+- {"Keep every column of the matching rows: do not use group_by or aggregates." if kind == "filter" else "Use group_by with aggregates for totals per group, and sort with limit for rankings such as top 5."}
+
+Examples:
+"Top 3 regions by total revenue" ->
+{{"group_by": ["Region"], "aggregates": [{{"column": "Revenue", "func": "sum", "as": "Revenue"}}], "sort": [{{"column": "Revenue", "descending": true}}], "limit": 3}}
+"Orders in the North with more than 10 units" ->
+{{"filters": [{{"column": "Region", "op": "==", "value": "North"}}, {{"column": "UnitsSold", "op": ">", "value": 10}}]}}
+
+User prompt: {prompt}
+"""
+
+    try:
+        response = requests.post(
+            OLLAMA_URL,
+            json={"model": MODEL_NAME, "prompt": base_prompt, "stream": False}
+        )
+        response.raise_for_status()
+        model_response = response.json().get("response", "").strip()
+    except Exception as e:
+        print(f"[ERROR] generate_query_plan Exception: {e}")
+        return None
+
+    print(f"[DEBUG] Query plan response: {model_response}", flush=True)
+    match = re.search(r"\{.*\}", model_response, re.DOTALL)
+    if not match:
+        return None
+    try:
+        plan = json.loads(match.group(0))
+    except json.JSONDecodeError as e:
+        print(f"[ERROR] Failed to parse query plan: {e}")
+        return None
+    return plan if isinstance(plan, dict) else None
+
+
 def classify_forecast_intent(prompt: str, df_columns: List[str]):
     """
     Classifies the forecast intent and extracts parameters (time range, target variable).
@@ -296,7 +379,61 @@ Return only the final dictionary in this exact format (Python-style, single quot
     print(f"[DEBUG] Extracted prediciton features  Response: {model_response}")
     return model_response
 
-def extract_forecast_period(prompt: str):
+# Horizons like "next 12 months", "6 weeks ahead" or "next year" are read
+# without a model round trip; anything else is asked to the model.
+FORECAST_PERIOD_PATTERN = re.compile(r"\b(\d+)\s*(day|week|month|quarter|year)s?\b")
+FORECAST_SINGLE_PERIOD_PATTERN = re.compile(r"\b(?:next|coming|following)\s+(day|week|month|quarter|year)\b")
+
+# Horizon used when neither the prompt nor the model gives one
+DEFAULT_FORECAST_PERIOD = 3
+
+
+def parse_forecast_period(prompt: str) -> Optional[Tuple[int, str]]:
+    """
+    Read the forecast horizon of common phrasings, or None if there is none.
+
+    Returns:
+        (number of periods, unit: day, week, month, quarter or year)
+    """
+    text = prompt.lower()
+    match = FORECAST_PERIOD_PATTERN.search(text)
+    if match and int(match.group(1)) > 0:
+        return int(match.group(1)), match.group(2)
+    match = FORECAST_SINGLE_PERIOD_PATTERN.search(text)
+    if match:
+        return 1, match.group(1)
+    return None
+
+
+def extract_forecast_period(prompt: str) -> Tuple[int, Optional[str]]:
+    """
+    Forecast horizon of a prompt, read directly or asked to the model.
+
+    Returns:
+        (number of periods, unit, or None when the model gave the number or
+        DEFAULT_FORECAST_PERIOD was used)
+    """
+    parsed = parse_forecast_period(prompt)
+    if parsed is not None:
+        print(f"[DEBUG] Extracted Forecast Period without the model: {parsed}")
+        return parsed
+    try:
+        return _ask_forecast_period(prompt), None
+    except Exception as e:
+        # Not cached, so the next request asks the model again
+        print(f"[ERROR] Failed to get the forecast period from the model: {e}")
+        return DEFAULT_FORECAST_PERIOD, None
+
+
+@lru_cache(maxsize=256)
+def _ask_forecast_period(prompt: str) -> int:
+    """
+    Ask the model for the forecast horizon. Only answers it gave are cached:
+    failed requests and unparseable replies raise.
+
+    Raises:
+        ValueError: If the reply holds no positive number of periods
+    """
     base_prompt = f"""
 You are a strict JSON API. Do not return explanations, code, or comments.
 
@@ -333,19 +470,13 @@ Respond with only the JSON object, nothing else.
     model_response = response_json.get("response", "").strip()
     print(f"[DEBUG] Model raw response: {model_response}")  # Add this
 
-    try:
-        if model_response.startswith("{"):
-            forecast_dict = json.loads(model_response.replace("'", '"'))
-            forecast_period = int(forecast_dict.get("ForecastPeriod", 3))
-        else:
-            forecast_period = int(model_response)
-        # Ensure forecast_period is at least 1
-        if forecast_period <= 0:
-            print(f"[WARN] Invalid forecast period {forecast_period}. Using default 3.")
-            forecast_period = 3
-    except Exception as e:
-        print(f"[ERROR] Failed to parse model response: {e}")
-        forecast_period = 3  # fallback
+    if model_response.startswith("{"):
+        forecast_dict = json.loads(model_response.replace("'", '"'))
+        forecast_period = int(forecast_dict["ForecastPeriod"])
+    else:
+        forecast_period = int(model_response)
+    if forecast_period <= 0:
+        raise ValueError(f"Invalid forecast period {forecast_period}")
 
     print(f"[DEBUG] Extracted Forecast Period: {forecast_period}")
     return forecast_period
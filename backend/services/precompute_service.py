@@ -0,0 +1,178 @@
+import asyncio
+import traceback
+from typing import Dict, Any, Optional
+
+from services.file_service import get_dataset, get_dataset_info, get_dataset_version, update_dataset_info
+from services.profile_service import build_profile, PROFILE_VERSION
+from services.data_service import DataAnalyzer
+from services.result_cache import result_key, get_result, put_result
+from services.serialization import make_json_safe
+
+# In-flight precompute tasks per dataset, for one version of its data:
+# {"version": int, "profile": Task, "summary": Task}
+_jobs: Dict[str, Dict[str, Any]] = {}
+
+# Error messages of precomputes that failed, keyed by dataset ID
+_failures: Dict[str, str] = {}
+
+
+def ensure_profile(dataset_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Get the profile of a dataset's current version, building and storing it
+    if it is missing, was built from another version of the data or by an
+    older PROFILE_VERSION.
+
+    A profile is only stored while the dataset is still at the version it
+    was built from, so a build that races a replace never overwrites the
+    newer data's profile.
+
+    Returns:
+        The profile, or None for unknown datasets
+    """
+    while True:
+        info = get_dataset_info(dataset_id)
+        if info is None:
+            return None
+        version = info.get("version", 1)
+        profile = info.get("profile")
+        if profile is not None and profile.get("version") == PROFILE_VERSION \
+                and info.get("profile_dataset_version") == version:
+            return profile
+        df = get_dataset(dataset_id)
+        if df is None:
+            return None
+        if get_dataset_version(dataset_id) != version:
+            continue
+        profile = build_profile(df)
+        if update_dataset_info(dataset_id, if_version=version, profile=profile, profile_dataset_version=version):
+            return profile
+        print(f"[DEBUG] Dataset {dataset_id} changed while it was profiled, profiling it again")
+
+
+def summary_key(dataset_id: str, version: Optional[int] = None):
+    """
+    Result cache key of the dataset summary, as used by /analyze, for the
+    given version of the dataset (the current one by default).
+    """
+    return result_key(dataset_id, version or get_dataset_version(dataset_id), "summary", {})
+
+
+def _compute_summary(dataset_id: str, version: int, profile: Dict[str, Any]) -> Dict[str, Any]:
+    df = get_dataset(dataset_id)
+    if get_dataset_version(dataset_id) != version:
+        # Superseded; the precompute of the newer version stores its summary
+        return None
+    key = summary_key(dataset_id, version)
+    analyzer = DataAnalyzer(df, profile=profile, dataset_id=dataset_id)
+    # Build the cube and time pyramids while the data is hot so the first
+    # aggregate and trend queries can use them
+    analyzer.get_cube()
+    for col in analyzer.date_columns:
+        analyzer.get_time_pyramid(col)
+    result = make_json_safe(analyzer.generate_user_friendly_summary())
+    put_result(key, result)
+    return result
+
+
+async def _run_summary(dataset_id: str, version: int, profile_task: asyncio.Task) -> Dict[str, Any]:
+    profile = await profile_task
+    return await asyncio.to_thread(_compute_summary, dataset_id, version, profile)
+
+
+def _current_job(dataset_id: str) -> Optional[Dict[str, Any]]:
+    """
+    The in-flight precompute of a dataset, if it is for the current version.
+    """
+    job = _jobs.get(dataset_id)
+    if job is None or job["version"] != get_dataset_version(dataset_id):
+        return None
+    return job
+
+
+def _finished(dataset_id: str, task: asyncio.Task):
+    if _jobs.get(dataset_id, {}).get("summary") is not task:
+        # Superseded by the precompute of a newer version
+        return
+    if task.cancelled():
+        _failures[dataset_id] = "cancelled"
+    elif task.exception() is not None:
+        _failures[dataset_id] = str(task.exception())
+        print(f"[ERROR] Precompute of dataset {dataset_id} failed: {task.exception()}")
+        traceback.print_exception(task.exception())
+    else:
+        print(f"[DEBUG] Precompute of dataset {dataset_id} finished")
+    del _jobs[dataset_id]
+
+
+def start_precompute(dataset_id: str):
+    """
+    Profile a dataset and compute its summary in worker threads.
+
+    Must be called from a running event loop. Does nothing if a precompute
+    of the dataset's current version is already in flight; one of an older
+    version is cancelled and replaced.
+    """
+    version = get_dataset_version(dataset_id)
+    job = _jobs.get(dataset_id)
+    if job is not None:
+        if job["version"] == version:
+            return
+        # Its profile thread cannot be interrupted, but ensure_profile will
+        # not store a profile of the old version
+        job["summary"].cancel()
+        print(f"[DEBUG] Restarting precompute of dataset {dataset_id} for version {version}")
+    _failures.pop(dataset_id, None)
+    profile_task = asyncio.create_task(asyncio.to_thread(ensure_profile, dataset_id))
+    summary_task = asyncio.create_task(_run_summary(dataset_id, version, profile_task))
+    summary_task.add_done_callback(lambda task: _finished(dataset_id, task))
+    _jobs[dataset_id] = {"version": version, "profile": profile_task, "summary": summary_task}
+
+
+async def wait_for_profile(dataset_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Get a dataset's profile, waiting for an in-flight precompute to build it
+    instead of building it a second time.
+    """
+    job = _current_job(dataset_id)
+    if job is not None:
+        try:
+            return await asyncio.shield(job["profile"])
+        except Exception:
+            pass
+    return await asyncio.to_thread(ensure_profile, dataset_id)
+
+
+async def wait_for_summary(dataset_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Wait for an in-flight summary precompute of a dataset.
+
+    Returns:
+        The JSON-safe summary, or None if no precompute is running or it failed
+    """
+    job = _current_job(dataset_id)
+    if job is None:
+        return None
+    try:
+        return await asyncio.shield(job["summary"])
+    except Exception:
+        return None
+
+
+def get_precompute_status(dataset_id: str) -> Dict[str, Any]:
+    """
+    Report whether a dataset's summary is ready.
+
+    Status is one of:
+        processing: precompute is running
+        ready: the summary is cached and /analyze will return it immediately
+        failed: the last precompute failed (error holds the reason)
+        pending: nothing is cached, e.g. after a restart; the next summary
+                 request computes it
+    """
+    if _current_job(dataset_id) is not None:
+        return {"status": "processing"}
+    if dataset_id in _failures:
+        return {"status": "failed", "error": _failures[dataset_id]}
+    if get_result(summary_key(dataset_id), count=False) is not None:
+        return {"status": "ready"}
+    return {"status": "pending"}
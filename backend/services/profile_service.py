@@ -0,0 +1,68 @@
+import pandas as pd
+import numpy as np
+from typing import Dict, Any
+
+from services.datetime_service import detect_datetime_columns, parse_datetime_column
+
+# Bumped whenever the profile layout or detection rules change, so stored
+# profiles from older versions get rebuilt
+PROFILE_VERSION = 2
+
+
+def _json_value(value):
+    """
+    Convert a scalar min/max value to something json.dump accepts.
+    """
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return None if pd.isna(value) else pd.Timestamp(value).isoformat()
+    if isinstance(value, (np.bool_, bool)):
+        return bool(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return None if np.isnan(value) else float(value)
+    return value
+
+
+def build_profile(df: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Describe a dataset once so analyzers do not have to rediscover it on every request.
+
+    The profile contains the numeric, categorical and date column sets, the format
+    of each date column, per-column dtypes, cardinalities, null counts, and min/max
+    values for numeric and date columns. It only holds JSON-serializable values so
+    it can be stored in the dataset index.
+    """
+    numeric_columns = df.select_dtypes(include=["number"]).columns.tolist()
+    categorical_columns = df.select_dtypes(include=["object", "category", "bool", "boolean"]).columns.tolist()
+
+    # Detect date columns and their exact format from a small sample of each column
+    date_formats = detect_datetime_columns(df)
+    date_columns = list(date_formats)
+
+    min_values = {}
+    max_values = {}
+    for col in numeric_columns:
+        min_values[col] = _json_value(df[col].min())
+        max_values[col] = _json_value(df[col].max())
+    for col, fmt in date_formats.items():
+        parsed_col = parse_datetime_column(df[col], fmt)
+        min_values[col] = _json_value(parsed_col.min())
+        max_values[col] = _json_value(parsed_col.max())
+
+    return {
+        "version": PROFILE_VERSION,
+        "row_count": len(df),
+        "columns": df.columns.tolist(),
+        "dtypes": df.dtypes.astype(str).to_dict(),
+        "numeric_columns": numeric_columns,
+        "categorical_columns": categorical_columns,
+        "date_columns": date_columns,
+        "date_formats": date_formats,
+        "cardinality": {col: int(n) for col, n in df.nunique().items()},
+        "null_counts": {col: int(n) for col, n in df.isnull().sum().items()},
+        "min": min_values,
+        "max": max_values
+    }
@@ -0,0 +1,101 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+from services.file_service import on_dataset_change
+
+# Intents whose results only depend on the dataset and their normalized parameters.
+# Their results are aggregates, small next to the dataset; predictions carry a
+# row per input row, so they are left out to keep the cache off the memory budget.
+CACHEABLE_INTENTS = {"summary", "trend"}
+
+# Maximum number of results kept; the least recently used one is evicted first
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("DATAPROMPT_RESULT_CACHE_ENTRIES", 256))
+
+ResultKey = Tuple[str, int, str, str]
+
+# JSON-safe results keyed by (dataset ID, dataset version, intent, parameters),
+# ordered from least to most recently used
+_results: "OrderedDict[ResultKey, Any]" = OrderedDict()
+result_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+_lock = threading.Lock()
+
+
+def result_key(dataset_id: str, version: int, intent: str, parameters: Optional[Dict[str, Any]] = None) -> ResultKey:
+    """
+    Build the cache key of a result.
+
+    Parameters are serialized with sorted keys so equivalent requests
+    share an entry regardless of argument order.
+    """
+    normalized = json.dumps(parameters or {}, sort_keys=True, default=str)
+    return (dataset_id, version, intent, normalized)
+
+
+def get_result(key: ResultKey, count: bool = True) -> Optional[Any]:
+    """
+    Get a cached result, or None on a miss.
+
+    Args:
+        key: Key built by result_key
+        count: Update the hit/miss counters and recency; disable for status checks
+    """
+    with _lock:
+        if key in _results:
+            if count:
+                result_stats["hits"] += 1
+                _results.move_to_end(key)
+            return _results[key]
+        if count:
+            result_stats["misses"] += 1
+        return None
+
+
+def put_result(key: ResultKey, result: Any):
+    """
+    Store a JSON-safe result, evicting the least recently used ones beyond
+    RESULT_CACHE_MAX_ENTRIES.
+    """
+    with _lock:
+        _results[key] = result
+        _results.move_to_end(key)
+        while len(_results) > RESULT_CACHE_MAX_ENTRIES:
+            _results.popitem(last=False)
+            result_stats["evictions"] += 1
+
+
+def invalidate_dataset(dataset_id: str):
+    """
+    Drop every cached result of a dataset.
+    """
+    with _lock:
+        stale = [key for key in _results if key[0] == dataset_id]
+        for key in stale:
+            del _results[key]
+        result_stats["invalidations"] += len(stale)
+    if stale:
+        print(f"[DEBUG] Invalidated {len(stale)} cached results of dataset {dataset_id}")
+
+
+def clear_results():
+    """
+    Drop every cached result and reset the counters.
+    """
+    with _lock:
+        _results.clear()
+        for key in result_stats:
+            result_stats[key] = 0
+
+
+def get_result_stats() -> Dict[str, Any]:
+    """
+    Report hit, miss, eviction and invalidation counters of the result cache.
+    """
+    with _lock:
+        return {**result_stats, "entries": len(_results), "max_entries": RESULT_CACHE_MAX_ENTRIES}
+
+
+on_dataset_change(invalidate_dataset)
@@ -0,0 +1,399 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import multiprocessing
+import json
+import os
+import threading
+import time
+import traceback
+import atexit
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Sequence, Tuple
+
+from services.file_service import get_dataset_path
+
+# Generated pandas code runs in a pool of worker processes instead of the API
+# process. Each worker memory-maps the datasets it is asked about and keeps the
+# most recent ones open, so only the pages a query touches are read and they
+# are shared with every other worker through the page cache.
+SANDBOX_WORKERS = int(os.environ.get("DATAPROMPT_SANDBOX_WORKERS", 2))
+
+# Wall-clock limit for one piece of generated code
+SANDBOX_TIMEOUT_SECONDS = float(os.environ.get("DATAPROMPT_SANDBOX_TIMEOUT_SECONDS", 30))
+
+# Limit on a worker's private (anonymous) resident memory. Memory-mapped
+# dataset pages are not counted because they are shared and reclaimable.
+SANDBOX_RSS_LIMIT_BYTES = int(os.environ.get("DATAPROMPT_SANDBOX_RSS_LIMIT_BYTES", 2 * 1024 ** 3))
+
+# How often the parent checks a running query against its limits
+POLL_INTERVAL_SECONDS = 0.05
+
+# Number of datasets each worker keeps memory-mapped
+WORKER_DATASETS = 2
+
+# Number of compiled snippets each worker keeps, so repeated code skips compile()
+WORKER_COMPILED_SNIPPETS = 256
+
+
+class SandboxError(Exception):
+    """Generated code failed, or was stopped for exceeding its time or memory limit."""
+
+
+def process_context():
+    """
+    Multiprocessing context for worker pools.
+
+    forkserver starts workers from a clean, single-threaded server process
+    with pandas already imported; spawn is the portable fallback.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload(["pandas", "numpy", "pyarrow", "services.sandbox_service"])
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+def _to_json(value: Any) -> Any:
+    """
+    Convert a scalar, list, tuple or dict result to JSON-ready values. Tuples,
+    dicts (whose keys need not be strings), timestamps and timedeltas are
+    tagged so _from_json can rebuild them.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return _to_json(value.item())
+    if isinstance(value, (pd.Timestamp, pd.Timedelta)) or value is pd.NaT:
+        return {"__pandas__": [type(value).__name__, str(value)]}
+    if isinstance(value, (list, np.ndarray, pd.Index)):
+        return [_to_json(item) for item in list(value)]
+    if isinstance(value, tuple):
+        return {"__tuple__": [_to_json(item) for item in value]}
+    if isinstance(value, dict):
+        return {"__dict__": [[_to_json(k), _to_json(v)] for k, v in value.items()]}
+    raise SandboxError(f"Unsupported result type {type(value).__name__}")
+
+
+def _from_json(value: Any) -> Any:
+    if isinstance(value, list):
+        return [_from_json(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if "__tuple__" in value:
+        return tuple(_from_json(item) for item in value["__tuple__"])
+    if "__dict__" in value:
+        # Keys that were tuples come back as lists, which are not hashable
+        return {_key(_from_json(k)): _from_json(v) for k, v in value["__dict__"]}
+    if "__pandas__" in value:
+        kind, text = value["__pandas__"]
+        return pd.Timedelta(text) if kind == "Timedelta" else pd.Timestamp(text)
+    raise SandboxError("Malformed result from the sandbox worker")
+
+
+def _key(value: Any) -> Any:
+    return tuple(_key(item) for item in value) if isinstance(value, list) else value
+
+
+def _encode(value: Any) -> Tuple[str, bytes]:
+    """
+    Encode a result for the trip back to the parent. DataFrames and Series are
+    sent as Arrow IPC streams, scalars, lists and dicts as JSON. Nothing is
+    pickled: the parent must not run code chosen by the generated code.
+
+    Raises:
+        SandboxError: If the result has no such encoding
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        kind = "series" if isinstance(value, pd.Series) else "frame"
+        frame = value.to_frame(name="__value__" if value.name is None else value.name) if kind == "series" else value
+        try:
+            table = pa.Table.from_pandas(frame.rename(columns=str))
+        except (pa.ArrowException, TypeError, ValueError) as e:
+            # Mixed-type object columns have no Arrow equivalent
+            raise SandboxError(f"Result {kind} cannot be sent back: {e}")
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return kind, sink.getvalue().to_pybytes()
+    return "json", json.dumps(_to_json(value)).encode()
+
+
+def _decode(kind: str, payload: bytes) -> Any:
+    """
+    Decode a result sent by a worker; only Arrow IPC streams and JSON are accepted.
+
+    Raises:
+        SandboxError: If the result is of any other kind
+    """
+    if kind == "json":
+        return _from_json(json.loads(payload))
+    if kind not in ("frame", "series"):
+        raise SandboxError(f"Unsupported result encoding {kind!r} from the sandbox worker")
+    try:
+        frame = pa.ipc.open_stream(payload).read_all().to_pandas()
+    except pa.ArrowException as e:
+        raise SandboxError(f"Malformed {kind} from the sandbox worker: {e}")
+    if kind == "series":
+        series = frame.iloc[:, 0]
+        return series.rename(None) if series.name == "__value__" else series
+    return frame
+
+
+def _pack_reply(header: Dict[str, Any], payload: bytes = b"") -> bytes:
+    # Replies travel as raw bytes, never through Connection.send, so the
+    # parent does not unpickle anything the worker sends
+    return json.dumps(header).encode() + b"\n" + payload
+
+
+def _unpack_reply(message: bytes) -> Any:
+    """
+    Decode a worker's reply into the result it carries.
+
+    Raises:
+        SandboxError: If the generated code failed or the reply is malformed
+    """
+    head, _, payload = message.partition(b"\n")
+    try:
+        header = json.loads(head)
+        status = header["status"]
+    except (ValueError, TypeError, KeyError):
+        raise SandboxError("Malformed reply from the sandbox worker")
+    if status == "error":
+        print(f"[DEBUG] Sandboxed code failed:\n{header.get('traceback', '')}")
+        raise SandboxError(str(header.get("message", "Sandboxed code failed")))
+    return _decode(header.get("kind"), payload)
+
+
+def _read_ipc_file(path: str) -> pd.DataFrame:
+    source = pa.memory_map(path, "r")
+    return pa.ipc.open_file(source).read_all().to_pandas(split_blocks=True)
+
+
+def _worker_main(conn):
+    """
+    Worker loop: receive code, run it against a dataset and send the result back.
+    """
+    # Copy-on-write keeps the mapped frames intact across queries
+    pd.set_option("mode.copy_on_write", True)
+    datasets: "OrderedDict[Tuple[str, int], pd.DataFrame]" = OrderedDict()
+    compiled: "OrderedDict[str, Any]" = OrderedDict()
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        try:
+            if task["path"] is not None:
+                key = (task["path"], os.stat(task["path"]).st_mtime_ns)
+                if key not in datasets:
+                    datasets[key] = _read_ipc_file(task["path"])
+                    while len(datasets) > WORKER_DATASETS:
+                        datasets.popitem(last=False)
+                datasets.move_to_end(key)
+                df = datasets[key]
+            else:
+                df = pa.ipc.open_stream(task["data"]).read_all().to_pandas()
+
+            code = compiled.get(task["code"])
+            if code is None:
+                code = compile(task["code"], "<generated>", "exec")
+                compiled[task["code"]] = code
+                while len(compiled) > WORKER_COMPILED_SNIPPETS:
+                    compiled.popitem(last=False)
+            compiled.move_to_end(task["code"])
+
+            local_vars = {"df": df.copy(deep=False)}
+            exec(code, {}, local_vars)
+
+            result = None
+            for name in task["outputs"]:
+                result = local_vars.get(name)
+                if result is not None:
+                    break
+            kind, payload = _encode(result)
+            reply = _pack_reply({"status": "ok", "kind": kind}, payload)
+        except Exception as e:
+            reply = _pack_reply({"status": "error", "message": f"{type(e).__name__}: {e}",
+                                 "traceback": traceback.format_exc()})
+        conn.send_bytes(reply)
+
+
+def _private_rss(pid: int) -> Optional[int]:
+    """
+    Anonymous resident memory of a process in bytes, or None where /proc is unavailable.
+    """
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+    except OSError:
+        return None
+    value = fields.get("RssAnon") or fields.get("VmRSS")
+    return int(value.split()[0]) * 1024 if value else None
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.loaded = OrderedDict()
+
+    def note_loaded(self, path: str):
+        self.loaded[path] = True
+        self.loaded.move_to_end(path)
+        while len(self.loaded) > WORKER_DATASETS:
+            self.loaded.popitem(last=False)
+
+    def stop(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class SandboxPool:
+    """
+    Pool of pre-started worker processes that run generated pandas code.
+
+    A query runs in an idle worker, preferably one that already has its dataset
+    mapped. The parent enforces the wall-clock and memory limits; a worker that
+    exceeds either is killed and replaced by a fresh one.
+    """
+
+    def __init__(self, size: int = SANDBOX_WORKERS, timeout: float = SANDBOX_TIMEOUT_SECONDS,
+                 rss_limit: int = SANDBOX_RSS_LIMIT_BYTES):
+        self.size = size
+        self.timeout = timeout
+        self.rss_limit = rss_limit
+        self.stats = {"runs": 0, "errors": 0, "timeouts": 0, "memory_kills": 0, "recycled": 0}
+        self._ctx = process_context()
+        self._idle = []
+        self._condition = threading.Condition()
+        self._closed = False
+        for _ in range(size):
+            self._idle.append(_Worker(self._ctx))
+
+    def _acquire(self, path: Optional[str]) -> _Worker:
+        with self._condition:
+            while not self._idle:
+                if self._closed:
+                    raise SandboxError("Sandbox pool is closed")
+                self._condition.wait()
+            for worker in self._idle:
+                if path is not None and path in worker.loaded:
+                    self._idle.remove(worker)
+                    return worker
+            return self._idle.pop()
+
+    def _release(self, worker: _Worker):
+        with self._condition:
+            if self._closed:
+                worker.stop()
+                return
+            self._idle.append(worker)
+            self._condition.notify()
+
+    def _recycle(self, worker: _Worker):
+        worker.stop()
+        self.stats["recycled"] += 1
+        self._release(_Worker(self._ctx))
+
+    def run(self, code: str, dataset_id: Optional[str] = None, df: Optional[pd.DataFrame] = None,
+            outputs: Sequence[str] = ("df",)) -> Any:
+        """
+        Run generated code against a dataset in a worker process.
+
+        Args:
+            code: Python code operating on a DataFrame named `df`
+            dataset_id: Stored dataset to run against; its Arrow file is mapped by the worker
+            df: DataFrame to send to the worker instead, for data that is not stored
+            outputs: Variables to return, in order of preference; the first one
+                     that is set and not None is returned
+
+        Returns:
+            The value of the first output variable
+
+        Raises:
+            SandboxError: If the code raises, or exceeds the time or memory limit
+        """
+        path = get_dataset_path(dataset_id) if dataset_id is not None else None
+        task = {"code": code, "path": path, "data": None, "outputs": list(outputs)}
+        if path is None:
+            if df is None:
+                raise SandboxError("No dataset to run the code against")
+            task["data"] = _encode(df)[1]
+
+        worker = self._acquire(path)
+        self.stats["runs"] += 1
+        try:
+            worker.conn.send(task)
+            started = time.monotonic()
+            while not worker.conn.poll(POLL_INTERVAL_SECONDS):
+                if not worker.process.is_alive():
+                    raise SandboxError("Worker process died while running the query")
+                if time.monotonic() - started > self.timeout:
+                    self.stats["timeouts"] += 1
+                    raise SandboxError(f"Query exceeded the {self.timeout:g}s time limit and was stopped")
+                rss = _private_rss(worker.process.pid)
+                if rss is not None and rss > self.rss_limit:
+                    self.stats["memory_kills"] += 1
+                    raise SandboxError(f"Query exceeded the {self.rss_limit // 1024 ** 2} MiB memory limit and was stopped")
+            reply = worker.conn.recv_bytes()
+        except (SandboxError, EOFError, OSError) as e:
+            self._recycle(worker)
+            self.stats["errors"] += 1
+            raise e if isinstance(e, SandboxError) else SandboxError(str(e))
+
+        if path is not None:
+            worker.note_loaded(path)
+        self._release(worker)
+
+        try:
+            return _unpack_reply(reply)
+        except SandboxError:
+            self.stats["errors"] += 1
+            raise
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            workers, self._idle = self._idle, []
+            self._condition.notify_all()
+        for worker in workers:
+            worker.stop()
+
+
+_pool: Optional[SandboxPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> SandboxPool:
+    """
+    Get the shared sandbox pool, starting its workers on first use.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool()
+            atexit.register(_pool.close)
+        return _pool
+
+
+def run_code(code: str, dataset_id: Optional[str] = None, df: Optional[pd.DataFrame] = None,
+             outputs: Sequence[str] = ("df",)) -> Any:
+    """
+    Run generated code in the shared sandbox pool. See SandboxPool.run.
+    """
+    return get_pool().run(code, dataset_id=dataset_id, df=df, outputs=outputs)
+
+
+def get_sandbox_stats() -> Dict[str, Any]:
+    """
+    Report run, error, timeout and recycle counters of the sandbox pool.
+    """
+    if _pool is None:
+        return {"workers": 0}
+    return {**_pool.stats, "workers": _pool.size}
@@ -0,0 +1,40 @@
+import json
+import math
+import numpy as np
+import pandas as pd
+
+
+def make_json_safe(data):
+    """
+    Recursively convert all NumPy and pandas types to Python native types,
+    and sanitize non-JSON-compliant float values (NaN, inf).
+    """
+    if data is None:
+        return None
+    elif isinstance(data, dict):
+        return {k: make_json_safe(v) for k, v in data.items()}
+    elif isinstance(data, list):
+        return [make_json_safe(item) for item in data]
+    elif isinstance(data, (np.integer, np.int64, np.int32, np.int16, np.int8)):
+        return int(data)
+    elif isinstance(data, (np.floating, float, np.float64, np.float32, np.float16)):
+        # Catch NaN, inf, -inf
+        if math.isnan(data) or math.isinf(data):
+            return None
+        return float(data)
+    elif isinstance(data, (np.ndarray,)):
+        return make_json_safe(data.tolist())
+    elif isinstance(data, pd.Timestamp):
+        return data.isoformat()
+    elif isinstance(data, pd.Series):
+        return make_json_safe(data.tolist())
+    elif isinstance(data, pd.DataFrame):
+        return make_json_safe(data.to_dict(orient='records'))
+    elif isinstance(data, np.bool_):
+        return bool(data)
+    elif hasattr(data, 'to_json'):
+        return json.loads(data.to_json())
+    elif hasattr(data, '__dict__'):
+        return make_json_safe(vars(data))
+    else:
+        return data
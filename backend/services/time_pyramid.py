@@ -0,0 +1,270 @@
+import pandas as pd
+import numpy as np
+from typing import Dict, Any, List, Optional, Tuple
+
+from services.datetime_service import detect_datetime_format, parse_datetime_column
+
+# Trend questions and date-range totals only need the measures summed per
+# period. The pyramid keeps the daily totals of every numeric measure over
+# the full span of a date column, empty days included, with prefix sums for
+# range totals and the week/month/quarter/year levels rolled up from them,
+# so answers cost the number of output periods instead of the number of rows.
+PYRAMID_LEVELS = ["day", "week", "month", "quarter", "year"]
+
+NS_PER_DAY = 86_400 * 10 ** 9
+
+
+def _epoch_days(dates: pd.Series) -> Tuple[np.ndarray, np.ndarray, bool]:
+    """
+    Day numbers (days since 1970-01-01) of the dates, which of them are valid,
+    and whether every valid date falls on midnight. Timezone-aware dates use
+    their local time.
+    """
+    if getattr(dates.dtype, "tz", None) is not None:
+        dates = dates.dt.tz_localize(None)
+    values = dates.to_numpy(dtype="datetime64[ns]").view(np.int64)
+    valid = values != np.iinfo(np.int64).min
+    days = np.where(valid, values // NS_PER_DAY, 0)
+    date_only = bool((values[valid] % NS_PER_DAY == 0).all())
+    return days, valid, date_only
+
+
+def _measure_values(values: pd.Series) -> Tuple[np.ndarray, bool]:
+    """
+    Values of a measure ready for summing, with missing values as 0 like a
+    pandas sum, and whether the sums stay integers.
+    """
+    if pd.api.types.is_bool_dtype(values) or (pd.api.types.is_integer_dtype(values) and not values.hasnans):
+        return values.to_numpy(dtype=np.int64, na_value=0), True
+    return np.nan_to_num(values.to_numpy(dtype=float, na_value=np.nan), nan=0.0), False
+
+
+class TimePyramid:
+    """
+    Daily totals of a dataset's measures along one date column.
+
+    `rows` and `daily[measure]` hold one slot per day from `first` (a day
+    number) to the last dated row. Rows without a date are left out.
+    """
+
+    def __init__(self, column: str, fmt: Optional[str], first: int, rows: np.ndarray,
+                 daily: Dict[str, np.ndarray], date_only: bool):
+        self.column = column
+        self.fmt = fmt
+        self.first = first
+        self.rows = rows
+        self.daily = daily
+        self.date_only = date_only
+
+        # Prefix sums: the total of days [a, b) is prefix[b] - prefix[a]
+        self.prefix = {m: np.concatenate(([0], np.cumsum(v))).astype(v.dtype) for m, v in daily.items()}
+        self.prefix_rows = np.concatenate(([0], np.cumsum(rows)))
+        self.levels = {level: self._roll_up(level) for level in PYRAMID_LEVELS[1:]}
+
+    @classmethod
+    def from_rows(cls, df: pd.DataFrame, column: str, dates: pd.Series, measures: List[str],
+                  fmt: Optional[str] = None) -> "TimePyramid":
+        """
+        Build the pyramid of a dataset from its parsed date column.
+        """
+        days, valid, date_only = _epoch_days(dates)
+        first = int(days[valid].min()) if valid.any() else 0
+        slots = days[valid] - first
+        size = int(slots.max()) + 1 if len(slots) else 0
+        rows = np.bincount(slots, minlength=size).astype(np.int64)
+        daily = {}
+        for measure in measures:
+            values, integer = _measure_values(df[measure])
+            sums = np.bincount(slots, weights=values[valid], minlength=size)
+            daily[measure] = sums.round().astype(np.int64) if integer else sums
+        return cls(column, fmt, first, rows, daily, date_only)
+
+    @property
+    def measures(self) -> List[str]:
+        return list(self.daily)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.rows, self.prefix_rows, *self.daily.values(), *self.prefix.values()]
+        for level in self.levels.values():
+            arrays += [level["starts"], level["labels"], level["rows"], *level["sums"].values()]
+        return sum(a.nbytes for a in arrays)
+
+    def _day_labels(self) -> np.ndarray:
+        return (self.first + np.arange(len(self.rows))).astype("datetime64[D]")
+
+    def _roll_up(self, level: str) -> Dict[str, Any]:
+        """
+        Sum the days into weeks (ending Sunday), months, quarters or years.
+        Every period between the first and last day is present, empty or not.
+        """
+        days = self._day_labels()
+        if level == "week":
+            # 1970-01-01 was a Thursday; weeks are labelled by their Sunday
+            keys = days + (6 - (days.view(np.int64) + 3) % 7).astype("timedelta64[D]")
+        elif level == "month":
+            keys = days.astype("datetime64[M]")
+        elif level == "quarter":
+            keys = days.astype("datetime64[M]").view(np.int64) // 3
+        else:
+            keys = days.astype("datetime64[Y]")
+
+        if len(keys) == 0:
+            starts = np.zeros(0, dtype=np.int64)
+        else:
+            starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+        labels = keys[starts]
+        if level == "month":
+            # Months and quarters are labelled by their last day
+            labels = (labels + 1).astype("datetime64[D]") - np.timedelta64(1, "D")
+        elif level == "quarter":
+            labels = ((labels + 1) * 3).astype("datetime64[M]").astype("datetime64[D]") - np.timedelta64(1, "D")
+        elif level == "year":
+            labels = labels.astype(np.int64) + 1970
+
+        def reduce(values):
+            return np.add.reduceat(values, starts) if len(starts) else values[:0]
+
+        return {
+            "starts": starts,
+            "labels": labels,
+            "rows": reduce(self.rows),
+            "sums": {m: reduce(v) for m, v in self.daily.items()},
+        }
+
+    def period_sums(self, measure: str, level: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Totals of a measure per period.
+
+        Days and years are only reported when they have rows; weeks, months
+        and quarters include the empty periods in between, like pd.Grouper.
+
+        Returns:
+            Period labels (datetime64 last days, or int years) and their sums
+        """
+        if level == "day":
+            present = np.flatnonzero(self.rows)
+            return self._day_labels()[present], self.daily[measure][present]
+        periods = self.levels[level]
+        labels, sums = periods["labels"], periods["sums"][measure]
+        if level == "year":
+            present = periods["rows"] > 0
+            return labels[present], sums[present]
+        return labels, sums
+
+    def period_starts(self, level: str) -> np.ndarray:
+        """
+        First day of every period from the first to the last dated row (weeks
+        start on Monday).
+        """
+        if level == "day":
+            return self._day_labels()
+        days = (self.first + self.levels[level]["starts"]).astype("datetime64[D]")
+        if level == "week":
+            return days - ((days.view(np.int64) + 3) % 7).astype("timedelta64[D]")
+        months = days.astype("datetime64[M]")
+        if level == "quarter":
+            return (months.view(np.int64) // 3 * 3).astype("datetime64[M]").astype("datetime64[D]")
+        if level == "year":
+            return days.astype("datetime64[Y]").astype("datetime64[D]")
+        return months.astype("datetime64[D]")
+
+    def series(self, measure: str, level: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Totals of a measure for every period, empty periods included,
+        labelled by period_starts. Used as the history of forecasts.
+        """
+        totals = self.daily[measure] if level == "day" else self.levels[level]["sums"][measure]
+        return self.period_starts(level), totals
+
+    def row_periods(self, dates: pd.Series, level: str) -> np.ndarray:
+        """
+        Position in period_starts of the period of each date, -1 for missing dates.
+        """
+        days, valid, _ = _epoch_days(dates)
+        starts = np.arange(len(self.rows)) if level == "day" else self.levels[level]["starts"]
+        positions = np.searchsorted(starts, days - self.first, side="right") - 1
+        positions[~valid] = -1
+        return positions
+
+    def day_range(self, low: Optional[pd.Timestamp] = None, high: Optional[pd.Timestamp] = None,
+                  include_low: bool = True, include_high: bool = True) -> Optional[Tuple[int, int]]:
+        """
+        Day numbers [start, stop) holding exactly the rows dated between `low`
+        and `high`, or None when a bound falls inside a day whose rows it splits.
+        """
+        start, stop = None, None
+        if low is not None:
+            value = pd.Timestamp(low).as_unit("ns").value
+            floor, ceil = value // NS_PER_DAY, -(-value // NS_PER_DAY)
+            if not self.date_only and not (include_low and floor == ceil):
+                return None
+            start = ceil if include_low else floor + 1
+        if high is not None:
+            value = pd.Timestamp(high).as_unit("ns").value
+            floor, ceil = value // NS_PER_DAY, -(-value // NS_PER_DAY)
+            if not self.date_only and (include_high or floor != ceil):
+                return None
+            stop = floor + 1 if include_high else ceil
+        return start, stop
+
+    def range_total(self, measure: Optional[str], start: Optional[int] = None, stop: Optional[int] = None):
+        """
+        Total of a measure (or the row count, for None) over the days [start, stop).
+        """
+        prefix = self.prefix_rows if measure is None else self.prefix[measure]
+        size = len(self.rows)
+        lo = 0 if start is None else min(max(start - self.first, 0), size)
+        hi = size if stop is None else min(max(stop - self.first, 0), size)
+        return prefix[hi] - prefix[lo] if hi > lo else prefix[0]
+
+    def appended(self, rows: pd.DataFrame) -> Optional["TimePyramid"]:
+        """
+        The pyramid of the dataset after `rows` were appended to it, built from
+        the new rows and the existing daily totals without rescanning old rows.
+        None when the new rows lack a measure or their dates cannot be parsed.
+        """
+        if self.column not in rows.columns or any(m not in rows.columns for m in self.daily):
+            return None
+        fmt = self.fmt or detect_datetime_format(rows[self.column])
+        if fmt is None:
+            return None
+        added = TimePyramid.from_rows(rows, self.column, parse_datetime_column(rows[self.column], fmt),
+                                      self.measures, fmt)
+        if not added.prefix_rows[-1]:
+            return self
+        if not self.prefix_rows[-1]:
+            return added
+
+        first = min(self.first, added.first)
+        size = max(self.first + len(self.rows), added.first + len(added.rows)) - first
+
+        def merge(old, new):
+            dtype = np.result_type(old, new)
+            merged = np.zeros(size, dtype=dtype)
+            merged[self.first - first:self.first - first + len(old)] += old
+            merged[added.first - first:added.first - first + len(new)] += new
+            return merged
+
+        return TimePyramid(
+            self.column, fmt, first, merge(self.rows, added.rows),
+            {m: merge(v, added.daily[m]) for m, v in self.daily.items()},
+            self.date_only and added.date_only
+        )
+
+
+def build_time_pyramid(df: pd.DataFrame, column: str, dates: pd.Series, measures: List[str],
+                       fmt: Optional[str] = None) -> TimePyramid:
+    """
+    Build the time pyramid of a dataset along a parsed date column.
+
+    Args:
+        df: Dataset
+        column: Name of the date column
+        dates: The column parsed as datetime
+        measures: Numeric columns to total
+        fmt: Format of the raw column, used to parse appended rows
+    """
+    pyramid = TimePyramid.from_rows(df, column, dates, measures, fmt)
+    print(f"[DEBUG] Built time pyramid over {len(pyramid.rows):,} days of {column} for {len(measures)} measures")
+    return pyramid
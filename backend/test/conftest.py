@@ -0,0 +1,72 @@
+import asyncio
+import os
+
+import pandas as pd
+import pytest
+
+from services import file_service
+from services.data_service import DataAnalyzer
+from services.ingest_service import compact_dtypes
+
+SAMPLE_CSV = os.path.join(os.path.dirname(__file__), "..", "services", "cleaned_dataset.csv")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def copy_on_write():
+    """Enable pandas copy-on-write for the whole session, as the app does at startup."""
+    with pd.option_context("mode.copy_on_write", True):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def isolated_store(tmp_path, monkeypatch):
+    """Point the dataset store at a temporary directory for every test."""
+    monkeypatch.setattr(file_service, "DATA_DIR", str(tmp_path / "data"))
+    file_service.load_index()
+    yield tmp_path / "data"
+    file_service.load_index()
+
+
+@pytest.fixture(scope="session")
+def sample_csv():
+    """Path of the sample sales CSV."""
+    return SAMPLE_CSV
+
+
+@pytest.fixture(scope="session")
+def sample_frames(sample_csv):
+    """The sample sales data as read from CSV and as compacted on upload, loaded once."""
+    raw = pd.read_csv(sample_csv)
+    return raw, compact_dtypes(raw)[0]
+
+
+@pytest.fixture
+def raw_sales(sample_frames):
+    """The sample sales data as read from CSV; a copy-on-write snapshot, so writes stay in the test."""
+    return file_service.snapshot(sample_frames[0])
+
+
+@pytest.fixture
+def compact_sales(sample_frames):
+    """The sample sales data with compacted dtypes; a copy-on-write snapshot, so writes stay in the test."""
+    return file_service.snapshot(sample_frames[1])
+
+
+@pytest.fixture
+def stored_analyzer():
+    """
+    Factory saving a DataFrame to the dataset store and returning a
+    DataAnalyzer over the stored dataset, on the pandas backend unless
+    another one is passed.
+    """
+    def store(df, **kwargs):
+        dataset_id = asyncio.run(file_service.save_file(df, "sales.csv"))
+        return DataAnalyzer(file_service.get_dataset(dataset_id), dataset_id=dataset_id,
+                            **{"backend": "pandas", **kwargs})
+    return store
+
+
+@pytest.fixture
+def stored_sales(stored_analyzer, compact_sales):
+    """A DataAnalyzer over the compacted sample data, saved to the dataset store."""
+    return stored_analyzer(compact_sales)
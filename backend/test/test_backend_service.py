@@ -0,0 +1,57 @@
+import pandas as pd
+import pytest
+
+from services import backend_service
+from services.backend_service import PandasBackend, get_backend
+from services.data_service import DataAnalyzer, validate_query_plan
+
+PLANS = [
+    ({"group_by": ["Region", "ProductCategory"],
+      "aggregates": [{"column": "Revenue", "func": "sum"}, {"column": "Profit", "func": "mean"},
+                     {"column": "OrderID", "func": "nunique", "as": "Orders"}]}, "query"),
+    ({"filters": [{"column": "PromotionApplied", "op": "==", "value": "yes"}],
+      "group_by": ["Region"],
+      "aggregates": [{"column": "Revenue", "func": "sum"}, {"func": "size", "as": "Rows"}],
+      "sort": [{"column": "Revenue", "descending": True}], "limit": 2}, "query"),
+    ({"aggregates": [{"column": "UnitsSold", "func": "median"}, {"column": "OrderDate", "func": "max"}]}, "query"),
+    ({"filters": [{"column": "Region", "op": "in", "value": ["north", "East"]},
+                  {"column": "OrderDate", "op": ">=", "value": "2024-06-01"},
+                  {"column": "UnitsSold", "op": "between", "value": [5, 20]}],
+      "sort": [{"column": "OrderDate"}]}, "filter"),
+    ({"group_by": ["OrderDate"],
+      "aggregates": [{"column": "Revenue", "func": "sum"}],
+      "sort": [{"column": "Revenue", "descending": True}], "limit": 5}, "query"),
+    ({"filters": [{"column": "OrderDate", "op": "<", "value": "2021-03-01"}],
+      "group_by": ["OrderDate", "Region"], "aggregates": [{"func": "size", "as": "Rows"}]}, "query"),
+    ({"filters": [{"column": "ProductCategory", "op": "!=", "value": "electronics"}],
+      "select": ["OrderID", "Revenue"], "sort": [{"column": "Revenue", "descending": True}], "limit": 10}, "filter"),
+]
+
+
+@pytest.fixture(params=["memory", "stored"])
+def analyzer(request, stored_analyzer, compact_sales):
+    if request.param == "memory":
+        return DataAnalyzer(compact_sales, backend="pandas")
+    # Stored datasets are scanned from their Arrow file
+    return stored_analyzer(compact_sales)
+
+
+@pytest.mark.skipif(backend_service.duckdb is None, reason="duckdb is not installed")
+@pytest.mark.parametrize("plan,kind", PLANS)
+def test_duckdb_matches_pandas_reference(analyzer, plan, kind):
+    plan = validate_query_plan(plan, analyzer.profile, kind)
+    expected = PandasBackend().execute(analyzer, plan)
+    result = get_backend("duckdb").execute(analyzer, plan)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False, check_exact=False)
+
+
+def test_unavailable_backend_falls_back_to_pandas(monkeypatch):
+    assert get_backend("no-such-engine").name == "pandas"
+    monkeypatch.setattr(backend_service, "get_dataset_info", lambda dataset_id: {"backend": "no-such-engine"})
+    assert get_backend(None, "some-dataset").name == "pandas"
+
+
+def test_explicit_backend_wins_over_dataset_setting(monkeypatch):
+    monkeypatch.setattr(backend_service, "get_dataset_info", lambda dataset_id: {"backend": "duckdb"})
+    assert get_backend("pandas", "some-dataset").name == "pandas"
+    assert DataAnalyzer(pd.DataFrame({"a": [1]}), dataset_id="some-dataset", backend="pandas").backend.name == "pandas"
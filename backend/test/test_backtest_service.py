@@ -0,0 +1,61 @@
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from services import backtest_service
+from services.backtest_service import run_backtest
+
+
+def _reference(history, horizon, min_train):
+    errors = {h: [] for h in range(horizon)}
+    for origin in range(min_train, len(history)):
+        for s in range(history.shape[1]):
+            slope, intercept = np.polyfit(np.arange(origin), history[:origin, s], 1)
+            for h in range(min(horizon, len(history) - origin)):
+                errors[h].append((intercept + slope * (origin + h), history[origin + h, s]))
+    return [(np.mean([abs(p - a) for p, a in pairs]), np.mean([abs(p - a) / abs(a) for p, a in pairs if a]) * 100)
+            for pairs in errors.values()]
+
+
+@pytest.fixture(scope="module")
+def history():
+    rng = np.random.default_rng(0)
+    trend = np.arange(60)[:, None] * rng.uniform(-2, 5, 8) + rng.uniform(50, 100, 8)
+    values = trend + rng.normal(0, 10, trend.shape)
+    values[5, 3] = 0
+    return values
+
+
+def test_scores_match_a_fold_by_fold_reference(history):
+    result = run_backtest(history, horizon=4, min_train=12, parallel=False)
+    assert result["folds"] == 48 and result["series"] == 8
+    for scores, (mae, mape) in zip(result["horizons"], _reference(history, 4, 12)):
+        assert scores["mae"] == pytest.approx(mae)
+        assert scores["mape"] == pytest.approx(mape)
+
+
+def test_folds_across_workers_match_one_process(history, monkeypatch):
+    monkeypatch.setattr(backtest_service, "BACKTEST_WORKERS", 2)
+    monkeypatch.setattr(backtest_service, "_executor", None)
+    inline = run_backtest(history, horizon=3, min_train=6, parallel=False)
+    parallel = run_backtest(history, horizon=3, min_train=6)
+    assert (inline["workers"], parallel["workers"]) == (1, 2)
+    for a, b in zip(parallel["horizons"], inline["horizons"]):
+        assert a == pytest.approx(b)
+
+
+def test_backtest_endpoint(sample_csv):
+    with TestClient(main.app) as client:
+        with open(sample_csv, "rb") as f:
+            dataset_id = client.post("/upload", files={"file": ("sales.csv", f, "text/csv")}).json()["id"]
+
+        response = client.post("/backtest", json={"dataset_id": dataset_id, "group_by": ["Region"], "horizon": 2})
+        assert response.status_code == 200
+        result = response.json()
+        assert result["series"] == 4 and result["folds"] == result["periods"] - 6
+        assert [h["horizon"] for h in result["horizons"]] == [1, 2]
+
+        response = client.post("/backtest", json={"dataset_id": dataset_id, "value_cols": ["Region"]})
+        assert response.status_code == 400
@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+
+from services.bitmap_index import build_bitmap_index
+from services.data_service import DataAnalyzer, validate_query_plan
+
+
+@pytest.fixture(params=[True, False], ids=["compact", "raw"])
+def analyzers(request, stored_analyzer, raw_sales, compact_sales):
+    df = compact_sales if request.param else raw_sales
+    return stored_analyzer(df), DataAnalyzer(df, backend="pandas")
+
+
+@pytest.mark.parametrize("filters", [
+    [{"column": "ProductCategory", "op": "==", "value": "grocery"}],
+    [{"column": "Region", "op": "==", "value": "East"}, {"column": "CustomerSegment", "op": "in", "value": ["online", "Nope"]}],
+    [{"column": "Region", "op": "not in", "value": ["East", "West"]}, {"column": "PromotionApplied", "op": "==", "value": "no"},
+     {"column": "Revenue", "op": ">", "value": 100}],
+    [{"column": "StoreID", "op": "!=", "value": "S001"}, {"column": "Month", "op": "in", "value": [1, 2]}],
+    [{"column": "Region", "op": "==", "value": "Atlantis"}],
+])
+def test_indexed_filters_match_comparisons(analyzers, filters):
+    stored, in_memory = analyzers
+    plan = validate_query_plan({"filters": filters}, stored.profile, "filter")
+    pd.testing.assert_frame_equal(stored.execute_plan(plan), in_memory.execute_plan(plan))
+    for predicate in filters:
+        if predicate["column"] != "Revenue":
+            assert stored.get_bitmap_index(predicate["column"]) is not None
+
+
+def test_index_is_built_once_per_column(analyzers):
+    stored, _ = analyzers
+    assert stored.get_bitmap_index("Region") is stored.get_bitmap_index("Region")
+    assert stored.get_bitmap_index("OrderID") is None
+    assert build_bitmap_index(pd.Series(range(1000))) is None
@@ -0,0 +1,79 @@
+
+import pandas as pd
+import pytest
+
+from services import sandbox_service
+from services.code_analysis import CodeCostError, prepare_code
+from services.profile_service import build_profile
+
+
+@pytest.fixture(scope="module")
+def sales(sample_frames):
+    df = sample_frames[1]
+    return df, build_profile(df)
+
+
+def _run(code, df):
+    local_vars = {"df": df.copy(deep=False)}
+    exec(code, {}, local_vars)
+    return local_vars.get("result", local_vars["df"])
+
+
+@pytest.mark.parametrize("code", [
+    "result = df.apply(lambda row: row['Revenue'] - row['Profit'], axis=1)",
+    "df = df[df.apply(lambda r: r['UnitsSold'] > 10 and not r.Region == 'North', axis=1)]",
+    "result = df['Revenue'].apply(lambda x: x * 1.2 + 1)",
+    "result = df['Region'].map(lambda x: x != 'West')",
+    "result = [row['Revenue'] / row['UnitsSold'] for _, row in df.iterrows() if row['Profit'] < 0]",
+    "result = df.copy().groupby('Region')['Revenue'].sum()",
+])
+def test_rewrites_are_vectorized_and_equivalent(sales, code):
+    df, profile = sales
+    prepared = prepare_code(code, profile)
+    assert prepared["rewrites"]
+    assert "lambda" not in prepared["code"] and "iterrows" not in prepared["code"]
+    expected, result = _run(code, df), _run(prepared["code"], df)
+    if isinstance(expected, list):
+        assert result == pytest.approx(expected)
+    elif isinstance(expected, pd.DataFrame):
+        pd.testing.assert_frame_equal(result, expected)
+    else:
+        pd.testing.assert_series_equal(result, expected, check_dtype=False)
+
+
+@pytest.mark.parametrize("code", [
+    "a = df.copy().pop('Revenue')\nresult = df['Revenue'].sum()",
+    "df.copy().insert(0, 'Extra', 1)\nresult = df.columns.tolist()",
+    "result = df['UnitsSold'].apply(lambda x: x ** -1)",
+])
+def test_unsafe_rewrites_are_skipped(sales, code):
+    df, profile = sales
+    prepared = prepare_code(code, profile)
+    assert prepared["code"] == code
+    assert _run(code, df) is not None
+
+
+def test_text_arithmetic_is_left_alone(sales):
+    _, profile = sales
+    code = "result = df.apply(lambda row: row['Region'] + '-' + row['ProductCategory'], axis=1)"
+    prepared = prepare_code(code, profile)
+    assert prepared["code"] == code
+    assert prepared["slow_constructs"] == ["row-wise apply"]
+
+
+def test_expensive_code_is_rejected(sales, monkeypatch):
+    _, profile = sales
+    monkeypatch.setattr(sandbox_service, "SANDBOX_TIMEOUT_SECONDS", 2)
+
+    nested = ("for _, a in df.iterrows():\n"
+              "    for _, b in df.iterrows():\n"
+              "        pass")
+    with pytest.raises(CodeCostError, match="nested loop over rows"):
+        prepare_code(nested, profile)
+    with pytest.raises(CodeCostError, match="cross join"):
+        prepare_code("result = df.merge(df, how='cross')", profile)
+
+    # Self-joins cost rows**2 / distinct keys: unique IDs are fine, regions are not
+    assert prepare_code("result = df.merge(df, on='OrderID')", profile)["estimated_seconds"] < 1
+    with pytest.raises(CodeCostError, match="self-join"):
+        prepare_code("other = df[df['UnitsSold'] > 5]\nresult = df.merge(other, on='Region')", profile)
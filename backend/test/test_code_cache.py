@@ -0,0 +1,33 @@
+from services import code_cache, data_service
+
+
+def test_generated_code_is_reused_until_it_fails(monkeypatch, stored_analyzer, raw_sales):
+    df = raw_sales
+    analyzer = stored_analyzer(df)
+
+    llm_calls = []
+
+    def fake_llm(prompt, df_columns, column_metadata):
+        llm_calls.append(prompt)
+        return "df.groupby('Region')['Revenue'].sum()"
+
+    monkeypatch.setattr(data_service, "generate_panda_code_from_prompt", fake_llm)
+
+    first = analyzer.execute_query("Total revenue by region?", df.columns.tolist())
+    second = analyzer.execute_query("  total revenue BY region ", df.columns.tolist())
+    assert first["type"] == second["type"] == "query"
+    assert len(llm_calls) == 1
+    stats = code_cache.get_code_cache_stats()
+    assert stats["hits"] == 1 and stats["entries"] == 1
+
+    # Persisted: a fresh process state still hits
+    monkeypatch.setattr(code_cache, "_loaded_from", None)
+    analyzer.execute_query("total revenue by region", df.columns.tolist())
+    assert len(llm_calls) == 1
+
+    # A cached snippet that stops working (schema unchanged) is dropped
+    key = code_cache.code_cache_key("query: total revenue by region", code_cache.schema_fingerprint(analyzer.df),
+                                    data_service.CODE_MODEL_NAME)
+    code_cache.put_cached_code(key, "df['Missing'].sum()", 1.0)
+    assert analyzer.execute_query("total revenue by region", df.columns.tolist())["type"] == "error"
+    assert code_cache.get_code_cache_stats()["entries"] == 0
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.cube_service import Cube, cube_stats
+from services.data_service import DataAnalyzer, validate_query_plan
+
+
+@pytest.fixture(params=[True, False], ids=["compact", "raw"])
+def analyzer(request, stored_analyzer, raw_sales, compact_sales):
+    return stored_analyzer(compact_sales if request.param else raw_sales)
+
+
+@pytest.mark.parametrize("plan", [
+    {"group_by": ["Region"], "aggregates": [{"column": "Revenue", "func": "sum"}]},
+    {"group_by": ["ProductCategory", "Year"],
+     "aggregates": [{"column": "Profit", "func": "mean"}, {"column": "UnitsSold", "func": "sum"}, {"func": "size", "as": "Rows"}],
+     "sort": [{"column": "Profit", "descending": True}], "limit": 5},
+    {"filters": [{"column": "Region", "op": "in", "value": ["east", "West"]}, {"column": "Month", "op": ">=", "value": 6}],
+     "group_by": ["CustomerSegment"], "aggregates": [{"column": "Revenue", "func": "count"}]},
+    {"filters": [{"column": "Region", "op": "==", "value": "Atlantis"}],
+     "aggregates": [{"column": "Revenue", "func": "sum"}, {"column": "Profit", "func": "mean"}]},
+    {"aggregates": [{"column": "UnitsSold", "func": "sum"}, {"func": "size", "as": "Rows"}]},
+])
+def test_cube_answers_match_raw_rows(analyzer, plan):
+    plan = validate_query_plan(plan, analyzer.profile)
+    hits = cube_stats["hits"]
+    answer = analyzer.answer_from_cube(plan)
+    assert cube_stats["hits"] == hits + 1
+    pd.testing.assert_frame_equal(answer, analyzer.execute_plan(plan), check_dtype=False, check_exact=False,
+                                  check_categorical=False)
+
+
+@pytest.mark.parametrize("plan", [
+    {"group_by": ["Region"], "aggregates": [{"column": "Revenue", "func": "median"}]},
+    {"group_by": ["OrderID"], "aggregates": [{"column": "Revenue", "func": "sum"}]},
+    {"filters": [{"column": "Revenue", "op": ">", "value": 100}], "aggregates": [{"column": "Profit", "func": "sum"}]},
+])
+def test_other_plans_fall_back_to_raw_rows(analyzer, plan):
+    plan = validate_query_plan(plan, analyzer.profile)
+    assert analyzer.answer_from_cube(plan) is None
+
+
+def test_cube_is_built_once_per_dataset(analyzer):
+    assert analyzer.get_cube() is analyzer.get_cube()
+    assert DataAnalyzer(analyzer.df).get_cube() is None
+
+
+def test_cube_keys_do_not_overflow_with_many_wide_dimensions():
+    # 8 dimensions of 1,000 values: the key space (1001 ** 8) is far beyond int64
+    rng = np.random.default_rng(0)
+    dims = [f"d{i}" for i in range(8)]
+    df = pd.DataFrame({d: rng.integers(0, 1000, 5000) for d in dims})
+    df.iloc[0, :] = 999
+    df["m"] = rng.random(5000)
+    cube = Cube(df, dims, ["m"])
+    assert cube.cell_count == len(df.drop_duplicates(dims))
+
+    grouped = cube.group(["d7", "d0"])
+    expected = df.groupby(["d7", "d0"])["m"].sum()
+    levels = [cube.levels[d].to_numpy()[grouped["codes"][d]] for d in ["d7", "d0"]]
+    np.testing.assert_array_equal(levels[0], expected.index.get_level_values(0))
+    np.testing.assert_array_equal(levels[1], expected.index.get_level_values(1))
+    np.testing.assert_allclose(grouped["sums"]["m"], expected.to_numpy())
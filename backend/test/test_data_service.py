@@ -0,0 +1,30 @@
+import pandas as pd
+
+from services import data_service
+from services.data_service import DataAnalyzer
+
+
+def test_summary_records_match_row_by_row_construction(compact_sales):
+    df = compact_sales
+    summary = DataAnalyzer(df).generate_user_friendly_summary()["data"]["visual_data"]
+
+    monthly = df.groupby(['Year', 'Month']).agg({'Revenue': 'sum', 'Profit': 'sum', 'UnitsSold': 'sum'}).reset_index()
+    expected = [
+        {
+            "month": f"{int(row['Year'])}-{int(row['Month']):02d}",
+            "revenue": round(row['Revenue'], 2),
+            "profit": round(row['Profit'], 2),
+            "units_sold": int(row['UnitsSold'])
+        }
+        for _, row in monthly.iterrows()
+    ]
+    assert summary["monthly_performance"] == expected
+    assert sum(r["orders"] for r in summary["daily_orders"]) == len(df)
+
+
+def test_failed_rewrite_falls_back_to_the_original_code(monkeypatch):
+    df = pd.DataFrame({"a": [1, 2, 3]})
+    monkeypatch.setattr(data_service, "prepare_code", lambda code, profile: {"code": "df = df['missing']",
+                                                                             "rewrites": ["broken"]})
+    result = DataAnalyzer(df, backend="pandas")._run_generated("df = df[df['a'] > 1]")
+    assert result["a"].tolist() == [2, 3]
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from services import file_service
+from services.data_service import DataAnalyzer, validate_query_plan
+from services.datetime_service import detect_datetime_format, detect_datetime_columns, get_parsed_datetime, get_year_month_dates, SortedDateIndex
+
+
+def test_detects_formats_without_numeric_false_positives(raw_sales):
+    df = raw_sales
+    assert detect_datetime_columns(df) == {"OrderDate": "%Y-%m-%d"}
+
+    assert detect_datetime_format(pd.Series(["13/01/2024", "02/02/2024"])) == "%d/%m/%Y"
+    assert detect_datetime_format(pd.Series(["2024", "2023"])) is None
+    assert detect_datetime_format(pd.Series(["East", "West"])) is None
+
+
+def test_parsed_column_matches_pandas_and_is_shared(monkeypatch, raw_sales, compact_sales):
+    df = compact_sales
+    expected = pd.to_datetime(raw_sales["OrderDate"])
+
+    monkeypatch.setitem(file_service._index, "sales", {})
+    file_service._cache_put("sales", df)
+    first = get_parsed_datetime(df, "OrderDate", "%Y-%m-%d", dataset_id="sales")
+    second = get_parsed_datetime(df, "OrderDate", dataset_id="sales")
+
+    assert first is second
+    pd.testing.assert_series_equal(first, expected, check_names=False)
+
+
+def test_year_month_dates():
+    df = pd.DataFrame({"Year": [2023, 2024], "Month": [12, 1]})
+    dates = get_year_month_dates(df)
+    assert dates.tolist() == [pd.Timestamp("2023-12-01"), pd.Timestamp("2024-01-01")]
+
+
+def test_sorted_index_ranges():
+    dates = pd.Series(pd.to_datetime(["2024-03-01", None, "2024-01-01", "2024-02-01", "2024-01-01"]))
+    index = SortedDateIndex(dates)
+    assert index.order.tolist() == [2, 4, 3, 0]
+    assert sorted(index.range("2024-01-01", "2024-02-01")) == [2, 3, 4]
+    assert sorted(index.range(low="2024-01-01", include_low=False)) == [0, 3]
+    assert len(index.range(high="2023-12-31")) == 0
+    np.testing.assert_array_equal(index.order, dates.sort_values().index[:4])
+
+
+@pytest.mark.parametrize("filters", [
+    [{"column": "OrderDate", "op": "between", "value": ["2023-10-01", "2023-12-31"]}],
+    [{"column": "OrderDate", "op": ">", "value": "2024-12-01"}, {"column": "Region", "op": "==", "value": "East"}],
+    [{"column": "OrderDate", "op": "<", "value": "2021-02-01"}, {"column": "OrderDate", "op": ">=", "value": "2021-01-15"}],
+    [{"column": "OrderDate", "op": "==", "value": "2022-06-15"}],
+])
+def test_date_ranges_match_comparisons(stored_sales, filters):
+    plan = validate_query_plan({"filters": filters}, stored_sales.profile, "filter")
+    in_memory = DataAnalyzer(stored_sales.df, profile=stored_sales.profile, backend="pandas")
+    pd.testing.assert_frame_equal(stored_sales.execute_plan(plan), in_memory.execute_plan(plan))
+    assert stored_sales.get_date_index("OrderDate") is stored_sales.get_date_index("OrderDate")
+
+
+@pytest.mark.parametrize("period,grouper", [
+    ("day", lambda t: t.dt.normalize()),
+    ("week", lambda t: pd.Grouper(key="OrderDate", freq="W")),
+    ("month", lambda t: pd.Grouper(key="OrderDate", freq="M")),
+    ("quarter", lambda t: pd.Grouper(key="OrderDate", freq="Q")),
+    ("year", lambda t: t.dt.year),
+])
+def test_period_sums_match_groupby(stored_sales, period, grouper):
+    times = stored_sales.get_datetime("OrderDate")
+    timeline = pd.DataFrame({"OrderDate": times.to_numpy(), "Revenue": stored_sales.df["Revenue"].to_numpy()})
+    key = grouper(timeline["OrderDate"])
+    expected = timeline.groupby(key).agg({"Revenue": "sum"}).reset_index()
+    result = stored_sales._period_sums(stored_sales.get_time_pyramid("OrderDate"), "Revenue", period)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import numpy as np
+import pandas as pd
+
+from services import file_service
+
+
+def test_dataset_survives_restart(isolated_store, raw_sales):
+    df = raw_sales
+    dataset_id = asyncio.run(file_service.save_file(df, "sales.csv"))
+
+    assert os.path.exists(isolated_store / f"{dataset_id}.arrow")
+    assert os.path.exists(isolated_store / "index.json")
+
+    # Simulate a restart: drop everything held in memory and reload the index
+    file_service.load_index()
+    assert dataset_id not in file_service.cached_datasets
+    assert [d["id"] for d in file_service.list_datasets()] == [dataset_id]
+
+    reloaded = file_service.get_dataset(dataset_id)
+    pd.testing.assert_frame_equal(reloaded, df)
+    assert file_service.get_dataset_info(dataset_id)["row_count"] == len(df)
+
+
+def test_unknown_dataset():
+    assert file_service.get_dataset("missing") is None
+    assert file_service.get_dataset_info("missing") is None
+    assert file_service.get_dataset_path("missing") is None
+
+
+def test_lru_eviction_reloads_from_disk(monkeypatch, raw_sales):
+    df = raw_sales
+    size = int(df.memory_usage(deep=True).sum())
+    monkeypatch.setattr(file_service, "CACHE_BUDGET_BYTES", int(size * 1.5))
+
+    first = asyncio.run(file_service.save_file(df, "a.csv"))
+    second = asyncio.run(file_service.save_file(df, "b.csv"))
+
+    assert list(file_service.cached_datasets) == [second]
+    assert file_service.get_cache_stats()["evictions"] == 1
+
+    pd.testing.assert_frame_equal(file_service.get_dataset(first), df)
+    file_service.get_dataset(first)
+    stats = file_service.get_cache_stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 1
+    assert stats["evictions"] == 2
+
+
+def test_snapshots_do_not_leak_writes(raw_sales):
+    df = raw_sales
+    dataset_id = asyncio.run(file_service.save_file(df, "sales.csv"))
+    file_service.load_index()
+
+    # Memory-mapped snapshot: in-place writes copy only what they touch
+    first = file_service.get_dataset(dataset_id)
+    first.loc[first['Revenue'] > 0, 'Revenue'] = -1.0
+    first['Extra'] = 1
+    first.sort_values('Profit', inplace=True)
+
+    second = file_service.get_dataset(dataset_id)
+    assert 'Extra' not in second.columns
+    pd.testing.assert_frame_equal(second, df)
+    assert np.shares_memory(file_service.get_dataset(dataset_id)['Profit'].to_numpy(), second['Profit'].to_numpy())
+
+
+def test_concurrent_appends_keep_every_row():
+    dataset_id = asyncio.run(file_service.save_file(pd.DataFrame({"x": [1]}), "x.csv"))
+
+    async def append_all():
+        return await asyncio.gather(*(
+            file_service.append_rows(dataset_id, pd.DataFrame({"x": [value]}))
+            for value in (2, 20, 200)
+        ))
+
+    assert sorted(asyncio.run(append_all())) == [2, 3, 4]
+    assert sorted(file_service.get_dataset(dataset_id)["x"]) == [1, 2, 20, 200]
+    file_service.load_index()
+    assert sorted(file_service.get_dataset(dataset_id)["x"]) == [1, 2, 20, 200]
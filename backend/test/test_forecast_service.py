@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.data_service import DataAnalyzer
+from services.forecast_service import (CATEGORICAL_FEATURES, feature_cols, fit_trends, monthly_totals,
+                                      process_forecast, revenue_scorer, scaler, theta)
+from services.ingest_service import compact_dtypes
+
+
+def test_stacked_fit_matches_polyfit_per_series():
+    y = np.array([[3.0, 1.0], [5.5, 1.0], [4.0, 0.5], [8.0, 0.0], [9.5, -2.0]])
+    intercepts, slopes = fit_trends(y)
+    for i in range(y.shape[1]):
+        slope, intercept = np.polyfit(np.arange(len(y)), y[:, i], 1)
+        assert (intercepts[i], slopes[i]) == pytest.approx((intercept, slope))
+    assert [a.tolist() for a in fit_trends([7.0])] == [[7.0], [0.0]]
+
+
+@pytest.mark.parametrize("granularity,freq", [("month", "MS"), ("week", "W-MON"), ("quarter", "QS")])
+def test_forecast_is_fitted_on_period_totals(stored_sales, granularity, freq):
+    series, used = stored_sales.period_series("Revenue", granularity)
+    assert used == granularity
+    dates = stored_sales.get_datetime("OrderDate")
+    expected = stored_sales.df["Revenue"].groupby(dates.dt.to_period(freq[0]).dt.start_time).sum()
+    expected = expected.reindex(pd.date_range(expected.index[0], expected.index[-1], freq=freq), fill_value=0)
+    np.testing.assert_array_equal(series["Date"], expected.index)
+    np.testing.assert_allclose(series["Revenue"], expected.to_numpy())
+
+    records = process_forecast(series, forecast_periods=4, granularity=granularity)
+    history = [r for r in records if r["type"] == "historical"]
+    forecast = [r for r in records if r["type"] == "forecast"]
+    assert len(history) == len(expected) and len(forecast) == 4
+    assert [r["Date"] for r in forecast] == list(pd.date_range(expected.index[-1], periods=5, freq=freq)[1:])
+    slope, intercept = np.polyfit(np.arange(len(expected)), expected.to_numpy(), 1)
+    assert forecast[0]["PredictedRevenue"] == pytest.approx(intercept + slope * len(expected))
+
+
+def test_year_month_totals_fill_empty_months():
+    df = pd.DataFrame({"Year": [2023, 2023, 2024, 2023], "Month": [11, 11, 2, 12], "Revenue": [1.0, 2.0, 4.0, 8.0]})
+    totals = monthly_totals(df)
+    assert totals["Date"].tolist() == list(pd.date_range("2023-11-01", "2024-02-01", freq="MS"))
+    assert totals["Revenue"].tolist() == [3.0, 8.0, 0.0, 4.0]
+
+    analyzer = DataAnalyzer(df)
+    series, granularity = analyzer.period_series("Revenue", "week")
+    assert granularity == "month"
+    pd.testing.assert_frame_equal(series, totals)
+
+
+def test_grouped_forecast_matches_one_series_at_a_time(stored_sales):
+    value_cols, group_by = ["Revenue", "Profit"], ["Region", "ProductCategory"]
+    series, _ = stored_sales.period_series(value_cols, "month", group_by)
+    assert stored_sales.period_series(value_cols, "month", group_by)[0] is series
+
+    dates = stored_sales.get_datetime("OrderDate")
+    months = dates.dt.to_period("M").dt.start_time.rename("Date")
+    expected = stored_sales.df.groupby([*group_by, months], observed=True)[value_cols].sum().reset_index()
+    actual = series[(series[value_cols] != 0).any(axis=1)].reset_index(drop=True)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False, check_categorical=False)
+
+    records = pd.DataFrame(process_forecast(series, 6, "month", value_cols, group_by))
+    periods = series["Date"].nunique()
+    assert len(records) == series.groupby(group_by).ngroups * (periods + 6)
+    east = series[(series["Region"] == "East") & (series["ProductCategory"] == "Grocery")]
+    alone = pd.DataFrame(process_forecast(east.drop(columns=group_by), 6, "month", value_cols))
+    grouped = records[(records["Region"] == "East") & (records["ProductCategory"] == "Grocery")]
+    pd.testing.assert_frame_equal(grouped.drop(columns=group_by).reset_index(drop=True), alone)
+
+
+@pytest.mark.parametrize("prompt,expected", [
+    ("forecast revenue for the next 3 months", (["Revenue"], [], "month")),
+    ("Forecast revenue and profit for each category/region for the next 6 weeks",
+     (["Revenue", "Profit"], ["ProductCategory", "Region"], "week")),
+    ("predict units sold per product category next quarter", (["UnitsSold"], ["ProductCategory"], "quarter")),
+    ("forecast revenue for the next 6 months starting today", (["Revenue"], [], "month")),
+    ("forecast sales including holiday effects", (["Revenue"], [], "month")),
+    ("forecast daily revenue", (["Revenue"], [], "day")),
+])
+def test_forecast_parameters(stored_sales, prompt, expected):
+    parameters = stored_sales.resolve_forecast_parameters(prompt)
+    assert (parameters["value_cols"], parameters["group_by"], parameters["granularity"]) == expected
+
+
+def dummies_prediction(df, drop_first):
+    # Reference: one-hot encode, scale and multiply by theta
+    encoded = pd.get_dummies(df, columns=CATEGORICAL_FEATURES, drop_first=drop_first)
+    encoded = encoded.reindex(columns=feature_cols, fill_value=0)
+    encoded = encoded.fillna(encoded.mean(numeric_only=True))
+    scaled = np.hstack((np.ones((len(encoded), 1)), scaler.transform(encoded)))
+    return (scaled @ theta).ravel()
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_compiled_scorer_matches_one_hot_encoding(raw_sales, compact):
+    df = raw_sales
+    df.loc[::7, "UnitPrice"] = np.nan
+    df.loc[::11, "Region"] = np.nan
+    if compact:
+        df, _ = compact_dtypes(df)
+    np.testing.assert_allclose(revenue_scorer.score(df, drop_first=True), dummies_prediction(df, True))
+
+    # Without the first category present, drop_first leaves out a category the model weights
+    rest = df[df["ProductCategory"] != sorted(df["ProductCategory"].dropna().unique())[0]]
+    np.testing.assert_allclose(revenue_scorer.score(rest, drop_first=True), dummies_prediction(rest, True))
+
+
+def test_compiled_scorer_scores_one_row_inputs():
+    row = pd.DataFrame([{"UnitsSold": 12, "UnitPrice": 80.0, "CostPerUnit": 50.0, "Profit": 360.0,
+                         "ProductCategory": "Electronics", "ProductName": "Laptop", "Region": "North", "CustomerSegment": "Retail"}])
+    np.testing.assert_allclose(revenue_scorer.score(row), dummies_prediction(row, False))
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+from services.grouping_service import GroupingSets
+
+
+def _frame():
+    rng = np.random.default_rng(0)
+    n = 2000
+    return pd.DataFrame({
+        "Region": pd.Categorical(rng.choice(["North", "South", "East", None], n)),
+        "Year": rng.integers(2020, 2023, n).astype(np.int32),
+        "Month": rng.integers(1, 13, n).astype(np.int32),
+        "Revenue": np.where(rng.random(n) < 0.05, np.nan, rng.random(n) * 100),
+        "UnitsSold": rng.integers(0, 50, n),
+        "OrderID": np.arange(n),
+        "Customer": rng.integers(0, 40, n),
+    })
+
+
+def test_grouping_sets_match_pandas_groupby():
+    df = _frame()
+    aggregations = {
+        "Revenue": ("Revenue", "sum"),
+        "AvgRevenue": ("Revenue", "mean"),
+        "UnitsSold": ("UnitsSold", "sum"),
+        "Orders": ("OrderID", "nunique"),
+        "Customers": ("Customer", "nunique"),
+        "Rows": ("Revenue", "size"),
+    }
+    sets = {
+        "region": (["Region"], aggregations),
+        "monthly": (["Year", "Month"], aggregations),
+        "region_year": (["Region", "Year"], aggregations),
+    }
+
+    results = GroupingSets(df).compute(sets)
+
+    for name, (dims, _) in sets.items():
+        expected = df.groupby(dims, observed=True).agg(**aggregations).reset_index()
+        pd.testing.assert_frame_equal(results[name], expected, check_dtype=False, check_categorical=False)
@@ -0,0 +1,63 @@
+import os
+import numpy as np
+import pandas as pd
+from fastapi.testclient import TestClient
+
+from services.ingest_service import read_csv_chunked, compact_dtypes
+from main import app
+
+
+def test_chunked_read_matches_full_read(sample_csv, raw_sales):
+    expected = raw_sales
+    df, stats = read_csv_chunked(sample_csv, chunk_rows=1500)
+
+    assert stats["chunks"] == 7
+    assert stats["estimated_peak_bytes"] > 0
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_upload_reports_estimated_peak_bytes(sample_csv):
+    client = TestClient(app)
+    with open(sample_csv, "rb") as f:
+        response = client.post("/upload", files={"file": ("sales.csv", f, "text/csv")})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["row_count"] == 10000
+    assert body["file_size_bytes"] == os.path.getsize(sample_csv)
+    assert body["estimated_peak_bytes"] > 0
+
+
+def test_compaction_is_lossless(raw_sales):
+    df = raw_sales
+    compacted, report = compact_dtypes(df)
+
+    assert report["bytes_after"] < report["bytes_before"]
+    assert compacted["Region"].dtype == "category"
+    # IDs and date strings are not low-cardinality, and categoricals cannot be ordered
+    assert compacted["ProductID"].dtype == object and compacted["OrderDate"].dtype == object
+    assert compacted["OrderDate"].max() == df["OrderDate"].max()
+    assert compacted["UnitsSold"].dtype == np.int32
+    # Yes/No columns keep their labels, so "No" and "False" stay separate groups
+    assert compacted["Holiday"].dtype == "category"
+    assert set(compacted["PromotionApplied"].cat.categories) == set(df["PromotionApplied"].unique())
+    assert compacted["Revenue"].dtype == np.float64
+    np.testing.assert_array_equal(compacted["FootTraffic"], df["FootTraffic"])
+    assert (compacted["ProductName"].astype(object) == df["ProductName"]).all()
+
+
+def test_string_filters_match_the_same_rows_after_compaction(raw_sales):
+    df = raw_sales
+    compacted, _ = compact_dtypes(df)
+
+    # Typical generated filter code compares text columns with their labels
+    for code in ("df[df['PromotionApplied'] == 'Yes']",
+                 "df[df['PromotionApplied'] != 'No']",
+                 "df[(df['Holiday'] == 'Yes') & (df['Region'] == 'North')]",
+                 "df[df['Region'].isin(['East', 'West'])]"):
+        expected = eval(code, {"df": df})
+        actual = eval(code, {"df": compacted})
+        assert len(expected) > 0
+        assert actual.index.equals(expected.index)
+    assert (compacted.groupby("PromotionApplied", observed=True).size().sort_index().to_dict()
+            == df.groupby("PromotionApplied").size().sort_index().to_dict())
@@ -0,0 +1,80 @@
+import asyncio
+
+import pandas as pd
+import pytest
+
+from services import data_service, file_service, model_cache, nlp_service
+from services.data_service import DataAnalyzer
+from services.nlp_service import parse_forecast_period
+
+
+def test_horizons_reuse_the_fitted_model_until_the_dataset_changes(monkeypatch, stored_analyzer, compact_sales):
+    df = compact_sales
+    analyzer = stored_analyzer(df)
+    dataset_id = analyzer.dataset_id
+    monkeypatch.setattr(data_service, "extract_forecast_period", parse_forecast_period)
+
+    short = analyzer.forecast("Forecast revenue for each region for the next 3 months")
+    stats = model_cache.get_model_stats()
+    monkeypatch.setattr(data_service.ForecastModel, "__init__", lambda *args: pytest.fail("model refitted"))
+    long = analyzer.forecast("Predict revenue by region over the next 12 months")
+
+    assert (short["model_cache_hit"], long["model_cache_hit"]) == (False, True)
+    assert model_cache.get_model_stats()["hits"] == stats["hits"] + 1
+    forecasts = pd.DataFrame(long["data"]).query("type == 'forecast'").groupby("Region", observed=True).head(3)
+    expected = pd.DataFrame(short["data"]).query("type == 'forecast'")
+    pd.testing.assert_frame_equal(forecasts.reset_index(drop=True), expected.reset_index(drop=True))
+
+    monkeypatch.undo()
+    monkeypatch.setattr(data_service, "extract_forecast_period", parse_forecast_period)
+    asyncio.run(file_service.replace_dataset(dataset_id, df.head(500)))
+    analyzer = DataAnalyzer(file_service.get_dataset(dataset_id), dataset_id=dataset_id, backend="pandas")
+    assert analyzer.forecast("Forecast revenue for each region for the next 3 months")["model_cache_hit"] is False
+    assert model_cache.get_model_stats()["invalidations"] >= 1
+
+
+@pytest.mark.parametrize("prompt,expected", [
+    ("Forecast revenue for the next 12 months", (12, "month")),
+    ("forecast profit 6 weeks ahead", (6, "week")),
+    ("What will sales be next quarter?", (1, "quarter")),
+    ("forecast revenue for the next year", (1, "year")),
+    ("Forecast revenue", None),
+])
+def test_forecast_period_is_read_without_the_model(prompt, expected):
+    assert parse_forecast_period(prompt) == expected
+
+
+@pytest.mark.parametrize("prompt,granularity,periods", [
+    ("forecast revenue for the next year", "year", 1),
+    ("forecast monthly revenue for the next 2 years", "month", 24),
+    ("forecast weekly revenue for the next quarter", "week", 13),
+])
+def test_forecast_horizon_is_counted_in_its_granularity(monkeypatch, compact_sales, prompt, granularity, periods):
+    df = compact_sales
+    monkeypatch.setattr(data_service, "extract_forecast_period", parse_forecast_period)
+    result = DataAnalyzer(df, backend="pandas").forecast(prompt)
+    assert (result["granularity"], result["forecast_periods"]) == (granularity, periods)
+    assert len(pd.DataFrame(result["data"]).query("type == 'forecast'")) == periods
+
+
+def test_model_fallback_horizon_is_not_cached(monkeypatch):
+    replies = iter([RuntimeError("model unavailable"), '{"ForecastPeriod": 8}'])
+
+    class Reply:
+        def __init__(self):
+            reply = next(replies)
+            if isinstance(reply, Exception):
+                raise reply
+            self.text = reply
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"response": self.text}
+
+    monkeypatch.setattr(nlp_service.requests, "post", lambda *args, **kwargs: Reply())
+    prompt = "How will revenue develop for a while?"
+    assert nlp_service.extract_forecast_period(prompt) == (nlp_service.DEFAULT_FORECAST_PERIOD, None)
+    assert nlp_service.extract_forecast_period(prompt) == (8, None)
+    assert nlp_service.extract_forecast_period(prompt) == (8, None)
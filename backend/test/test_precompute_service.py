@@ -0,0 +1,65 @@
+import asyncio
+import threading
+
+from fastapi.testclient import TestClient
+
+import main
+from services import file_service, precompute_service, result_cache
+
+
+def test_summary_request_joins_background_precompute(monkeypatch, sample_csv):
+    result_cache.clear_results()
+    calls = []
+    original = precompute_service.DataAnalyzer.generate_user_friendly_summary
+
+    def counting_summary(self):
+        calls.append(1)
+        return original(self)
+
+    monkeypatch.setattr(precompute_service.DataAnalyzer, "generate_user_friendly_summary", counting_summary)
+
+    with TestClient(main.app) as client:
+        with open(sample_csv, "rb") as f:
+            upload = client.post("/upload", files={"file": ("sales.csv", f, "text/csv")}).json()
+        assert upload["status"] in ("processing", "ready")
+
+        response = client.post("/analyze", json={"prompt": "Give me a summary of the dataset",
+                                                 "dataset_id": upload["id"]}).json()
+        assert response["cache_hit"] is True
+        assert response["result"]["type"] == "summary"
+        assert client.get(f"/datasets/{upload['id']}").json()["status"] == "ready"
+
+    assert len(calls) == 1
+
+
+def test_replacing_a_dataset_restarts_its_precompute(monkeypatch, raw_sales):
+    df = raw_sales
+    started, release = threading.Event(), threading.Event()
+    original = precompute_service.build_profile
+
+    def slow_first_profile(frame):
+        if not started.is_set():
+            started.set()
+            release.wait(5)
+        return original(frame)
+
+    monkeypatch.setattr(precompute_service, "build_profile", slow_first_profile)
+
+    async def scenario():
+        dataset_id = await file_service.save_file(df, "sales.csv")
+        precompute_service.start_precompute(dataset_id)
+        await asyncio.to_thread(started.wait, 5)
+
+        # Replaced while the first profile is still being built
+        await file_service.replace_dataset(dataset_id, df.head(500))
+        precompute_service.start_precompute(dataset_id)
+        release.set()
+        summary = await precompute_service.wait_for_summary(dataset_id)
+        return dataset_id, summary
+
+    dataset_id, summary = asyncio.run(scenario())
+    info = file_service.get_dataset_info(dataset_id)
+    assert summary is not None
+    assert info["profile"]["row_count"] == 500
+    assert info["profile_dataset_version"] == info["version"] == 2
+    assert precompute_service.ensure_profile(dataset_id)["row_count"] == 500
@@ -0,0 +1,30 @@
+from fastapi.testclient import TestClient
+
+from main import app
+from services import file_service
+from services.profile_service import build_profile
+from services.data_service import DataAnalyzer
+
+
+def test_profile_describes_columns(compact_sales):
+    df = compact_sales
+    profile = build_profile(df)
+
+    assert "Revenue" in profile["numeric_columns"]
+    assert "Region" in profile["categorical_columns"]
+    assert "OrderDate" in profile["date_columns"]
+    assert profile["cardinality"]["Region"] == 4
+    assert profile["null_counts"]["Revenue"] == 0
+    assert profile["min"]["Year"] == 2021
+    assert profile["max"]["OrderDate"].startswith("2024-")
+
+
+def test_analyzer_uses_stored_profile(sample_csv):
+    client = TestClient(app)
+    with open(sample_csv, "rb") as f:
+        dataset_id = client.post("/upload", files={"file": ("sales.csv", f, "text/csv")}).json()["id"]
+
+    profile = file_service.get_dataset_info(dataset_id)["profile"]
+    analyzer = DataAnalyzer(file_service.get_dataset(dataset_id), profile=profile)
+    assert analyzer.profile is profile
+    assert analyzer.numeric_columns == profile["numeric_columns"]
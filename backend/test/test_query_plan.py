@@ -0,0 +1,74 @@
+
+import pandas as pd
+import pytest
+
+from services import data_service
+from services.data_service import DataAnalyzer, QueryPlanError, validate_query_plan
+
+
+@pytest.fixture(scope="module")
+def analyzer(sample_frames):
+    return DataAnalyzer(sample_frames[1])
+
+
+def _run(analyzer, plan, kind="query"):
+    return analyzer.execute_plan(validate_query_plan(plan, analyzer.profile, kind))
+
+
+def test_plans_match_pandas(analyzer):
+    df = analyzer.df
+
+    top = _run(analyzer, {
+        "filters": [{"column": "PromotionApplied", "op": "==", "value": "yes"}],
+        "group_by": ["Region"],
+        "aggregates": [{"column": "Revenue", "func": "sum"}, {"column": "OrderID", "func": "nunique", "as": "Orders"}],
+        "sort": [{"column": "Revenue", "descending": True}],
+        "limit": 2
+    })
+    promoted = df[df["PromotionApplied"] == "Yes"]
+    expected = promoted.groupby("Region", observed=True).agg(Revenue=("Revenue", "sum"), Orders=("OrderID", "nunique"))
+    expected = expected.reset_index().nlargest(2, "Revenue").reset_index(drop=True)
+    pd.testing.assert_frame_equal(top, expected)
+
+    rows = _run(analyzer, {
+        "filters": [{"column": "Region", "op": "in", "value": ["north", "East"]},
+                    {"column": "OrderDate", "op": ">=", "value": "2024-06-01"},
+                    {"column": "UnitsSold", "op": "between", "value": [5, 20]}],
+        "sort": [{"column": "OrderDate"}]
+    }, kind="filter")
+    dates = pd.to_datetime(df["OrderDate"].astype(str))
+    mask = df["Region"].isin(["North", "East"]) & (dates >= "2024-06-01") & df["UnitsSold"].between(5, 20)
+    assert len(rows) == mask.sum()
+    assert list(rows.columns) == list(df.columns)
+    assert pd.to_datetime(rows["OrderDate"].astype(str)).is_monotonic_increasing
+
+
+@pytest.mark.parametrize("plan", [
+    {"filters": [{"column": "Nope", "op": "==", "value": 1}]},
+    {"filters": [{"column": "Region", "op": ">", "value": "North"}]},
+    {"aggregates": [{"column": "Region", "func": "sum"}]},
+    {"group_by": ["Region"], "sort": [{"column": "Revenue"}]},
+])
+def test_invalid_plans_are_rejected(analyzer, plan):
+    with pytest.raises(QueryPlanError):
+        validate_query_plan(plan, analyzer.profile)
+
+
+def test_plan_runs_before_free_form_code(analyzer, monkeypatch):
+    prompts = []
+    monkeypatch.setattr(data_service, "generate_query_plan", lambda prompt, columns, kind, metadata: prompts.append(metadata) or {
+        "filters": [{"column": "Region", "op": "==", "value": "West"}]
+    })
+    monkeypatch.setattr(data_service, "generate_panda_code_from_prompt", lambda *args: pytest.fail("code generated"))
+    result = analyzer.filter_data("orders in the west", analyzer.df.columns.tolist())
+    assert result["type"] == "filter"
+    assert (result["data"]["Region"] == "West").all()
+    # The LLM sees dtypes and stored labels, not just column names
+    assert "- PromotionApplied (category): sample values" in prompts[0]
+
+    # Unusable plans fall back to generated code
+    monkeypatch.setattr(data_service, "generate_query_plan", lambda *args: {"group_by": ["Nope"]})
+    monkeypatch.setattr(data_service, "generate_panda_code_from_prompt", lambda *args: "df = df[df['Region'] == 'East']")
+    result = analyzer.filter_data("orders in the east", analyzer.df.columns.tolist())
+    assert result["type"] == "filter"
+    assert (result["data"]["Region"] == "East").all()
@@ -0,0 +1,47 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+import main
+from services import result_cache
+from services.file_service import replace_dataset
+
+
+def _upload(client, path):
+    with open(path, "rb") as f:
+        response = client.post("/upload", files={"file": ("sales.csv", f, "text/csv")})
+    return response.json()["id"]
+
+
+def test_trend_is_served_from_cache_until_dataset_changes(sample_csv, raw_sales):
+    result_cache.clear_results()
+    with TestClient(main.app) as client:
+        dataset_id = _upload(client, sample_csv)
+        request = {"prompt": "Show the monthly revenue trend", "dataset_id": dataset_id}
+
+        first = client.post("/analyze", json=request).json()
+        second = client.post("/analyze", json=request).json()
+        assert first["cache_hit"] is False
+        assert second["cache_hit"] is True
+        assert second["result"] == first["result"]
+
+        smaller = raw_sales.head(100)
+        asyncio.run(replace_dataset(dataset_id, smaller))
+        third = client.post("/analyze", json=request).json()
+        assert third["cache_hit"] is False
+        assert third["result"] != first["result"]
+        assert result_cache.get_result_stats()["invalidations"] >= 1
+
+
+def test_result_cache_evicts_least_recently_used(monkeypatch):
+    result_cache.clear_results()
+    monkeypatch.setattr(result_cache, "RESULT_CACHE_MAX_ENTRIES", 2)
+    keys = [result_cache.result_key("ds", 1, "trend", {"time_period": p}) for p in ("day", "week", "month")]
+    result_cache.put_result(keys[0], 0)
+    result_cache.put_result(keys[1], 1)
+    assert result_cache.get_result(keys[0]) == 0
+    result_cache.put_result(keys[2], 2)
+
+    assert result_cache.get_result(keys[1]) is None
+    assert result_cache.get_result(keys[0]) == 0
+    assert result_cache.get_result_stats()["evictions"] == 1
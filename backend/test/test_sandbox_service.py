@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+
+from services.sandbox_service import SandboxPool, SandboxError, _pack_reply, _unpack_reply
+
+
+@pytest.fixture
+def pool():
+    pool = SandboxPool(size=1, timeout=2, rss_limit=300 * 1024 ** 2)
+    yield pool
+    pool.close()
+
+
+def test_runs_code_against_stored_dataset(pool, stored_analyzer, raw_sales):
+    df = raw_sales
+    dataset_id = stored_analyzer(df).dataset_id
+
+    filtered = pool.run("df = df[df['Region'] == 'North']", dataset_id=dataset_id)
+    pd.testing.assert_frame_equal(filtered, df[df['Region'] == 'North'])
+
+    total = pool.run("result = df['Revenue'].sum()", dataset_id=dataset_id, outputs=("result", "df"))
+    assert total == pytest.approx(df['Revenue'].sum())
+
+    by_region = pool.run("result = df.groupby('Region')['Revenue'].sum()", df=df, outputs=("result",))
+    pd.testing.assert_series_equal(by_region, df.groupby('Region')['Revenue'].sum())
+
+
+def test_runaway_code_is_killed_and_worker_recycled(pool):
+    df = pd.DataFrame({"a": range(10)})
+
+    with pytest.raises(SandboxError, match="time limit"):
+        pool.run("while True: pass", df=df)
+    with pytest.raises(SandboxError, match="memory limit"):
+        pool.run("blocks = []\nwhile True: blocks.append(bytearray(50 * 1024 ** 2))", df=df)
+    with pytest.raises(SandboxError, match="KeyError"):
+        pool.run("df = df['missing']", df=df)
+
+    assert pool.stats["recycled"] == 2
+    assert pool.run("df = df[df['a'] > 6]", df=df)['a'].tolist() == [7, 8, 9]
+
+
+def test_results_come_back_without_pickle(pool):
+    df = pd.DataFrame({"a": [1, 2, 2], "b": ["x", "y", "y"]})
+
+    counts = pool.run("result = df.groupby(['a', 'b']).size().to_dict()", df=df, outputs=("result",))
+    assert counts == {(1, "x"): 1, (2, "y"): 2}
+    assert pool.run("import pandas as pd\nresult = (df['a'].max(), [pd.Timestamp('2024-01-31')])", df=df,
+                    outputs=("result",)) == (2, [pd.Timestamp("2024-01-31")])
+
+    # Objects with a custom __reduce__ are refused instead of pickled to the parent
+    code = "class Payload:\n    def __reduce__(self):\n        return (print, ('escaped',))\nresult = Payload()"
+    with pytest.raises(SandboxError, match="Unsupported result type"):
+        pool.run(code, df=df, outputs=("result",))
+    with pytest.raises(SandboxError, match="Unsupported result encoding"):
+        _unpack_reply(_pack_reply({"status": "ok", "kind": "pickle"}, b"\x80\x04."))
@@ -0,0 +1,69 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services import file_service
+from services.data_service import DataAnalyzer, validate_query_plan
+from services.ingest_service import compact_dtypes
+from services.time_pyramid import TimePyramid
+
+
+@pytest.mark.parametrize("filters", [
+    [{"column": "OrderDate", "op": "between", "value": ["2023-10-01", "2023-12-31"]}],
+    [{"column": "OrderDate", "op": ">", "value": "2024-12-01 12:00"}],
+    [{"column": "OrderDate", "op": "<", "value": "2021-02-01"}, {"column": "OrderDate", "op": ">=", "value": "2021-01-15"}],
+    [{"column": "OrderDate", "op": "==", "value": "2022-06-15"}],
+    [{"column": "OrderDate", "op": ">", "value": "2030-01-01"}],
+])
+def test_range_totals_match_raw_rows(stored_sales, filters):
+    plan = validate_query_plan({
+        "filters": filters,
+        "aggregates": [{"column": "Revenue", "func": "sum"}, {"column": "UnitsSold", "func": "sum"},
+                       {"func": "size", "as": "Orders"}],
+    }, stored_sales.profile)
+    answer = stored_sales.answer_from_pyramid(plan)
+    pd.testing.assert_frame_equal(answer, stored_sales.execute_plan(plan), check_dtype=False)
+
+
+@pytest.mark.parametrize("plan", [
+    {"filters": [{"column": "OrderDate", "op": ">", "value": "2023-01-01"}], "group_by": ["Region"],
+     "aggregates": [{"column": "Revenue", "func": "sum"}]},
+    {"filters": [{"column": "Revenue", "op": ">", "value": 100}], "aggregates": [{"column": "Revenue", "func": "sum"}]},
+    {"filters": [{"column": "OrderDate", "op": ">", "value": "2023-01-01"}], "aggregates": [{"column": "Revenue", "func": "mean"}]},
+])
+def test_other_plans_are_not_answered(stored_sales, plan):
+    assert stored_sales.answer_from_pyramid(validate_query_plan(plan, stored_sales.profile)) is None
+
+
+def test_bounds_inside_a_day_need_date_only_rows():
+    dates = pd.Series(pd.to_datetime(["2024-01-01 08:00", "2024-01-01 20:00", "2024-01-03 00:00"]))
+    pyramid = TimePyramid.from_rows(pd.DataFrame({"Revenue": [1.0, 2.0, 4.0]}), "OrderDate", dates, ["Revenue"])
+    assert pyramid.day_range(low=pd.Timestamp("2024-01-01 12:00")) is None
+    start, stop = pyramid.day_range(low=pd.Timestamp("2024-01-02"), include_high=False, high=pd.Timestamp("2024-01-04"))
+    assert pyramid.range_total("Revenue", start, stop) == 4.0
+    assert pyramid.range_total(None) == 3
+
+
+def test_appended_rows_update_the_pyramid(stored_analyzer, stored_sales, raw_sales):
+    df = raw_sales
+    head, tail = df.iloc[:600], df.iloc[600:].copy()
+    tail.loc[tail.index[0], "Region"] = "Antarctica"
+    analyzer = stored_analyzer(compact_dtypes(head)[0])
+    tail, _ = compact_dtypes(tail)
+    before = analyzer.get_time_pyramid("OrderDate")
+
+    asyncio.run(file_service.append_rows(analyzer.dataset_id, tail))
+    assert ("time_pyramid", "OrderDate") in file_service._derived[analyzer.dataset_id]
+    appended = DataAnalyzer(file_service.get_dataset(analyzer.dataset_id), dataset_id=analyzer.dataset_id)
+    pyramid = appended.get_time_pyramid("OrderDate")
+    assert pyramid is not before and len(appended.df) == len(df)
+    assert "Antarctica" in appended.df["Region"].cat.categories
+
+    rebuilt = stored_sales.get_time_pyramid("OrderDate")
+    assert (pyramid.first, len(pyramid.rows)) == (rebuilt.first, len(rebuilt.rows))
+    np.testing.assert_array_equal(pyramid.rows, rebuilt.rows)
+    for measure in ("Revenue", "UnitsSold"):
+        np.testing.assert_allclose(pyramid.daily[measure], rebuilt.daily[measure])
+        np.testing.assert_allclose(pyramid.levels["quarter"]["sums"][measure], rebuilt.levels["quarter"]["sums"][measure])